@@ -0,0 +1,131 @@
+import argparse
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from os import environ, walk
+from os.path import getsize, join
+
+def get_stats(hostname, cafile, reset = False):
+    '''
+    Return the counts of the calls served by the mock VCO
+    '''
+    import requests
+    return requests.get('https://%s/stats%s' % (hostname,
+            '?reset=1' if reset else ''), verify=cafile).json()
+
+def get_dir_size(directory):
+    '''
+    Return the size in bytes of all the files in a directory
+    '''
+    return sum(getsize(join(root, each))
+               for root, _, files in walk(directory) for each in files)
+
+def run_fleet(mock_environ, directory, args):
+    '''
+    Run the detection cycles and the writers against the mock VCO in
+    a fresh process, so that the peak RSS is of this fleet size only,
+    with the caches and the stores written to the given directory
+    '''
+    environ.update(mock_environ)
+    environ['VCO_MAX_CALLS_PER_SEC'] = str(args.calls_per_sec)
+    environ['VCO_BATCH_SIZE'] = str(args.batch_size)
+    # The app keeps its caches and stores in the directory of path[0]
+    sys.path.insert(0, directory)
+    from vco_api_main import vco_api_main
+
+    hostname = mock_environ['VCO_HOSTNAME']
+    cafile = mock_environ['REQUESTS_CA_BUNDLE']
+    conn = vco_api_main()
+    results = { 'cycles': [] }
+    for _ in range(args.cycles):
+        get_stats(hostname, cafile, reset = True)
+        conn.refresh_time()
+        time_start = time.perf_counter()
+        conn.detect_wan_anomaly(args.min_per_sample,
+            args.min_per_sample * 60,
+            args.samples * args.min_per_sample * 60,
+            mode = 'sample_cache', email = False)
+        seconds = time.perf_counter() - time_start
+        stats = get_stats(hostname, cafile)
+        results['cycles'].append((seconds, sum(stats['calls'].values()),
+                                  stats['requests']))
+
+    for name, write in (
+    ('events', lambda: conn.store_ent_events(
+        conn.iter_ent_events(args.writer_sec))),
+    ('fw_logs', lambda: conn.store_ent_fw_logs(
+        conn.iter_ent_fw_logs(args.writer_sec))),
+    ('configs', lambda: len(conn.backup_ent_edge_config()[1]))):
+        time_start = time.perf_counter()
+        count = write()
+        results[name] = count / (time.perf_counter() - time_start)
+
+    results['disk_bytes'] = get_dir_size(directory)
+    # ru_maxrss is in KiB on Linux
+    results['peak_rss'] = resource.getrusage(
+                            resource.RUSAGE_SELF).ru_maxrss * 1024
+    conn.close()
+    return results
+
+def run_fleet_process(queue, *args):
+    queue.put(run_fleet(*args))
+
+if __name__ == '__main__':
+    '''
+    Report the end-to-end detect_wan_anomaly cycle time, cold and
+    then warm with the sample cache, the API calls per cycle, the
+    peak RSS and the writer throughput for each fleet size against
+    the mock VCO
+    '''
+    from benchmarks.mock_vco import mock_vco
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--edges', type=int, nargs='+',
+        default=[10, 100, 500])
+    parser.add_argument('--links', type=int, default=2)
+    parser.add_argument('--samples', type=int, default=12,
+        help='historical samples per link, 12 i.e. an hour at 5 minutes')
+    parser.add_argument('--min-per-sample', type=int, default=5)
+    parser.add_argument('--cycles', type=int, default=3,
+        help='cycles per fleet size, the first one cold')
+    parser.add_argument('--calls-per-sec', type=float, default=0,
+        help='VCO_MAX_CALLS_PER_SEC, 0 i.e. no limit by default')
+    parser.add_argument('--batch-size', type=int, default=0,
+        help='VCO_BATCH_SIZE, 0 i.e. no batching by default')
+    parser.add_argument('--latency', type=float, default=0,
+        help='seconds of latency of each response of the mock VCO')
+    parser.add_argument('--error-rate', type=float, default=0,
+        help='share of the requests answered with an HTTP 503')
+    parser.add_argument('--events-per-hour', type=int, default=10000)
+    parser.add_argument('--writer-sec', type=int, default=3600,
+        help='seconds of events and firewall logs to write')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    print('%8s %10s %10s %10s %10s %10s %12s %12s %12s' % ('edges',
+        'cold s', 'warm s', 'calls', 'requests', 'peak MiB',
+        'events/s', 'fw_logs/s', 'configs/s'))
+    for edges in args.edges:
+        mock = mock_vco(edges, args.links, latency=args.latency,
+                        error_rate=args.error_rate,
+                        events_per_hour=args.events_per_hour)
+        mock.start()
+        with tempfile.TemporaryDirectory() as directory:
+            queue = context.Queue()
+            process = context.Process(target=run_fleet_process,
+                        args=(queue, mock.environ(), directory, args))
+            process.start()
+            results = queue.get()
+            process.join()
+        mock.stop()
+
+        cold = results['cycles'][0]
+        warm = results['cycles'][1:] or [cold]
+        print('%8s %10.3f %10.3f %10s %10s %10.1f %12.0f %12.0f %12.0f' % (
+            edges, cold[0], sum(each[0] for each in warm) / len(warm),
+            '%s/%s' % (cold[1], warm[-1][1]),
+            '%s/%s' % (cold[2], warm[-1][2]),
+            results['peak_rss'] / 1024 / 1024, results['events'],
+            results['fw_logs'], results['configs']))
@@ -0,0 +1,70 @@
+import argparse
+import timeit
+import tracemalloc
+import pandas as pd
+from vco_api_parser import parse_link_quality
+from benchmarks.synthetic import link_quality_events
+
+def parse_link_quality_dataframe(wan_quality):
+    '''
+    The previous parsing path, a dict per sample updated with the
+    metadata detail and one pandas DataFrame per link, kept here
+    as the baseline of the comparison
+    '''
+    wan = {}
+    for wan_id in wan_quality:
+        if not wan_id == 'overallLinkQuality':
+            dict = []
+            try:
+                for timeseries in wan_quality[wan_id]['timeseries']:
+                    try:
+                        timeseries['timestamp']
+                        timeseries['metadata']['detail']
+                    except KeyError:
+                        pass
+                    else:
+                        sample = {'timestamp': timeseries['timestamp']}
+                        sample.update(timeseries['metadata']['detail'])
+                    if sample: dict.append(sample)
+            except KeyError:
+                pass
+            if dict:
+                wan[wan_id] = pd.DataFrame.from_dict(dict)
+    return wan
+
+def measure(parse, wan_quality, number):
+    '''
+    Return the mean parse time in seconds and the peak memory
+    allocated in bytes by the given parser
+    '''
+    seconds = timeit.timeit(lambda: parse(wan_quality),
+                            number=number) / number
+    tracemalloc.start()
+    parse(wan_quality)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+if __name__ == '__main__':
+    '''
+    Compare the parse time and peak memory of the two parsing paths
+    on a synthetic response of a given size
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--links', type=int, default=4)
+    parser.add_argument('--samples', type=int, default=2016,
+        help='samples per link, 2016 i.e. a week at 5 minutes')
+    parser.add_argument('--number', type=int, default=10)
+    args = parser.parse_args()
+
+    min_per_sample = 5
+    wan_quality = link_quality_events(1, args.links, 0,
+                    (args.samples - 1) * min_per_sample * 60 * 1000,
+                    min_per_sample)
+
+    print('%d link(s) of %d sample(s)' % (args.links, args.samples))
+    for name, parse in (('dataframe', parse_link_quality_dataframe),
+                        ('numpy', parse_link_quality)):
+        seconds, peak = measure(parse, wan_quality, args.number)
+        print('%-10s %10.3f ms %10.1f KiB peak' % (name, seconds * 1000,
+            peak / 1024))
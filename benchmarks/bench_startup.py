@@ -0,0 +1,117 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from os import environ
+from os.path import abspath, dirname
+
+ROOT = dirname(dirname(abspath(__file__)))
+'''
+The root of the repository, for the app to be imported from
+'''
+
+RUN = '''
+import json, resource, sys, time
+time_start = time.perf_counter()
+%s
+from vco_api_wan_anomaly_alert import pccwg_vco
+time_import = time.perf_counter() - time_start
+conn = pccwg_vco()
+conn.detect_wan_anomaly(5, 300, 3600, mode = 'sample_cache',
+    email = False)
+conn.close()
+print(json.dumps({ 'import': time_import,
+                   'run': time.perf_counter() - time_start,
+                   'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   'pandas': 'pandas' in sys.modules }))
+'''
+'''
+A short run as from cron, with the import of the app timed apart,
+and with the heavy modules imported upfront first in eager mode as
+they were before they were made lazy
+'''
+
+def get_import_time(module, number):
+    '''
+    Return the median import time in seconds of the given module in
+    a fresh interpreter, and the cumulative import time in seconds of
+    each module it imports, as reported by python -X importtime
+    '''
+    totals = []
+    for _ in range(number):
+        output = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                    'import ' + module], cwd=ROOT, capture_output=True,
+                    text=True, check=True).stderr
+        modules = {}
+        for line in output.splitlines():
+            try:
+                _, cumulative, name = line.split('|')
+                modules[name.strip()] = int(cumulative) / 1e6
+            except ValueError:
+                pass
+        totals.append(modules[module])
+    return statistics.median(totals), modules
+
+def get_run(mock_environ, eager, number):
+    '''
+    Return the medians of the import time and the run time in seconds
+    and of the peak RSS in bytes of a short run against the mock VCO
+    in a fresh interpreter and a fresh directory, each with a cold
+    topology and sample cache, and whether pandas ended up imported
+    '''
+    runs = []
+    for _ in range(number):
+        with tempfile.TemporaryDirectory() as directory:
+            '''
+            Run the snippet as a script in the temporary directory, as
+            the app keeps its caches in the directory of path[0], which
+            is that of the script rather than the working directory
+            '''
+            with open(directory + '/run.py', 'w') as f:
+                f.write(RUN % ('import numpy, pandas' if eager else ''))
+            output = subprocess.run([sys.executable, 'run.py'],
+                        cwd=directory, capture_output=True, text=True,
+                        check=True, env=dict(environ, PYTHONPATH=ROOT,
+                        VCO_MAX_CALLS_PER_SEC='0', **mock_environ)).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return (statistics.median(run['import'] for run in runs),
+            statistics.median(run['run'] for run in runs),
+            # ru_maxrss is in KiB on Linux
+            statistics.median(run['rss'] for run in runs) * 1024,
+            any(run['pandas'] for run in runs))
+
+if __name__ == '__main__':
+    '''
+    Report the import time of the app and of the heavy modules, and
+    the wall time and the peak RSS of a short run against the mock VCO
+    with the heavy modules imported lazily, as they are, and eagerly,
+    as they were
+    '''
+    from benchmarks.mock_vco import mock_vco
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--edges', type=int, default=10)
+    parser.add_argument('--number', type=int, default=5,
+        help='runs of each measurement, of which the median is taken')
+    args = parser.parse_args()
+
+    total, modules = get_import_time('vco_api_wan_anomaly_alert',
+                        args.number)
+    print('import vco_api_wan_anomaly_alert: %.3f s' % total)
+    for module in ('requests', 'numpy', 'pandas'):
+        print('  of which %s: %s' % (module, '%.3f s' % modules[module]
+            if module in modules else 'not imported'))
+
+    mock = mock_vco(args.edges)
+    mock.start()
+    print('%8s %10s %10s %10s %8s' % ('imports', 'import s', 'run s',
+        'peak MiB', 'pandas'))
+    for eager in (False, True):
+        time_import, time_run, rss, pandas = get_run(mock.environ(), eager,
+                                                args.number)
+        print('%8s %10.3f %10.3f %10.1f %8s' % (
+            'eager' if eager else 'lazy', time_import, time_run,
+            rss / 1024 / 1024, 'yes' if pandas else 'no'))
+    mock.stop()
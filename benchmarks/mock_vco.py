@@ -0,0 +1,314 @@
+import argparse
+import gzip
+import json
+import random
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from vco_api_parser import parse_timestamp_e
+from benchmarks import synthetic
+
+class mock_vco_server(ThreadingHTTPServer):
+    '''
+    A threading HTTP server with a listen backlog deep enough for the
+    concurrent connections of the app, as SYNs dropped by a full
+    backlog are retried by the client only a second later
+    '''
+    request_queue_size = 128
+    daemon_threads = True
+
+class mock_vco():
+    '''
+    A local stand-in for the VCO that serves the JSON-RPC calls made
+    by the app, single or batched, on /portal/, and the enterprise and
+    operator logins on /login/, over HTTPS with a self-signed
+    certificate. It serves synthetic enterprises with a given number
+    of Edges and links per Edge, and the given number of events and
+    firewall logs per hour, after the given latency in seconds, and
+    answers the given share of the requests with an HTTP 503 instead.
+    The calls served are counted by method, and the counts are served
+    on /stats, and reset on /stats?reset=1, for a benchmark running
+    in another process.
+    '''
+
+    TOKEN = 'mock-vco-token'
+    '''
+    The API token and the session cookie accepted by the mock VCO
+    '''
+
+    PAGE_LIMIT = 2048
+    '''
+    2048 records per page as default of the events and firewall logs
+    '''
+
+    def __init__(self, edges = 10, links = 2, enterprises = 1,
+    latency = 0, error_rate = 0, events_per_hour = 1000, seed = 0):
+        self.edges = edges
+        self.links = links
+        self.enterprises = enterprises
+        self.latency = latency
+        self.error_rate = error_rate
+        self.events_per_hour = events_per_hour
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.server = None
+        self.directory = tempfile.TemporaryDirectory()
+        self.reset()
+
+    def reset(self):
+        '''
+        Reset the counts of the requests and the calls served
+        '''
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.calls = {}
+
+    def stats(self, reset = False):
+        '''
+        Return the counts of the requests, the errors and the calls
+        served by method, resetting them after should reset be True
+        '''
+        with self.lock:
+            stats = { 'requests': self.requests, 'errors': self.errors,
+                      'calls': dict(self.calls) }
+        if reset:
+            self.reset()
+        return stats
+
+    def _count(self, method):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+    def _enterprise_name(self, enterprise_id):
+        return 'Enterprise %s' % enterprise_id
+
+    def _page(self, records, parameters):
+        '''
+        Return a page of the given records from the offset in the
+        nextPageLink of the parameters, if any, with the metaData
+        '''
+        limit = parameters.get('limit') or self.PAGE_LIMIT
+        offset = int(parameters.get('nextPageLink') or 0)
+        more = offset + limit < len(records)
+        return { 'data': records[offset:offset + limit],
+                 'metaData': { 'more': more,
+                               'nextPageLink': str(offset + limit)
+                                   if more else None } }
+
+    def _records(self, generate, parameters):
+        '''
+        Return the records of an enterprise in the interval of the
+        parameters, or in the one encoded in the nextPageLink
+        '''
+        if parameters.get('nextPageLink'):
+            start_e, end_e, offset = parameters['nextPageLink'].split(':')
+            parameters = dict(parameters, nextPageLink=offset)
+        else:
+            start_e = parse_timestamp_e(parameters['interval']['start'])
+            end_e = parse_timestamp_e(parameters['interval']['end'])
+        start_e, end_e = int(start_e), int(end_e)
+        count = int(self.events_per_hour * (end_e - start_e) / 3600000)
+        page = self._page(generate(parameters['enterpriseId'], count,
+                            start_e, end_e, self.seed), parameters)
+        if page['metaData']['more']:
+            page['metaData']['nextPageLink'] = '%s:%s:%s' % (start_e,
+                end_e, page['metaData']['nextPageLink'])
+        return page
+
+    def call(self, method, parameters, enterprise_id):
+        '''
+        Return the result of a JSON-RPC call of the given method for
+        the enterprise logged in to, or for any as an operator
+        '''
+        self._count(method)
+        if method == 'network/getNetworkEnterprises':
+            return [{ 'id': i, 'name': self._enterprise_name(i) }
+                    for i in range(1, self.enterprises + 1)]
+        if method == 'monitoring/getAggregateEdgeLinkMetrics':
+            enterprise_id = (parameters.get('enterprises')
+                             or [enterprise_id])[0]
+            return synthetic.aggregate_edge_link_metrics(enterprise_id,
+                    self._enterprise_name(enterprise_id), self.edges,
+                    self.links, parse_timestamp_e(
+                        parameters['interval']['start']),
+                    parse_timestamp_e(parameters['interval']['end']),
+                    self.seed)
+        if method == 'enterprise/getEnterpriseEdges':
+            return synthetic.enterprise_edges(parameters['enterpriseId'],
+                    self.edges)
+        if method == 'linkQualityEvent/getLinkQualityEvents':
+            return synthetic.link_quality_events(parameters['edgeId'],
+                    self.links, parse_timestamp_e(
+                        parameters['interval']['start']),
+                    parse_timestamp_e(parameters['interval']['end']),
+                    parameters['minutesPerSample'], self.seed)
+        if method == 'event/getEnterpriseEvents':
+            return self._records(synthetic.enterprise_events, parameters)
+        if method == 'firewall/getEnterpriseFirewallLogs':
+            return self._records(synthetic.firewall_logs, parameters)
+        if method == 'edge/getEdgeConfigurationStack':
+            return synthetic.edge_configuration_stack(parameters['edgeId'],
+                    seed=self.seed)
+        raise KeyError(method)
+
+    def _respond(self, request, enterprise_id):
+        '''
+        Return the JSON-RPC response of a request
+        '''
+        try:
+            return { 'jsonrpc': '2.0', 'id': request.get('id'),
+                     'result': self.call(request['method'],
+                        request.get('params') or {}, enterprise_id) }
+        except KeyError as e:
+            return { 'jsonrpc': '2.0', 'id': request.get('id'),
+                     'error': { 'code': -32601,
+                                'message': 'Method not found: %s' % e } }
+
+    def _handler(self):
+        mock = self
+
+        class handler(BaseHTTPRequestHandler):
+            # Keep the connections alive as the VCO does
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _send(self, status, body = None, headers = None):
+                data = json.dumps(body).encode() if body is not None \
+                        else b''
+                if data and 'gzip' in self.headers.get(
+                'Accept-Encoding', ''):
+                    data = gzip.compress(data, 1)
+                    headers = dict(headers or {},
+                                   **{ 'Content-Encoding': 'gzip' })
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if not self.path.startswith('/stats'):
+                    return self._send(404, { 'error': 'Not found' })
+                self._send(200, mock.stats(reset = 'reset=1' in self.path))
+
+            def do_POST(self):
+                data = self.rfile.read(int(self.headers.get(
+                        'Content-Length', 0)))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    data = gzip.decompress(data)
+                with mock.lock:
+                    mock.requests += 1
+                    error = mock.rng.random() < mock.error_rate
+                    if error:
+                        mock.errors += 1
+                if mock.latency:
+                    time.sleep(mock.latency)
+                if error:
+                    return self._send(503, { 'error': 'Unavailable' })
+
+                if self.path.startswith('/login/'):
+                    # Log in to enterprise 1, or to all as an operator
+                    return self._send(200, {}, { 'Set-Cookie':
+                        'velocloud.session=%s; Path=/' % mock.TOKEN })
+
+                if self.headers.get('Authorization') != \
+                'Token ' + mock.TOKEN and 'velocloud.session=' \
+                + mock.TOKEN not in self.headers.get('Cookie', ''):
+                    return self._send(401, { 'error': 'Unauthorized' })
+
+                payload = json.loads(data)
+                if isinstance(payload, list):
+                    return self._send(200, [mock._respond(each, 1)
+                                            for each in payload])
+                return self._send(200, mock._respond(payload, 1))
+
+            def log_message(self, *args):
+                pass
+
+        return handler
+
+    def _get_ssl_context(self):
+        '''
+        Return the server SSL context with a self-signed certificate
+        for 127.0.0.1 created with the openssl command, and keep the
+        certificate as the CA bundle for the client to trust
+        '''
+        self.cafile = self.directory.name + '/cert.pem'
+        keyfile = self.directory.name + '/key.pem'
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048',
+            '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+            '-addext', 'subjectAltName=IP:127.0.0.1',
+            '-keyout', keyfile, '-out', self.cafile],
+            check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cafile, keyfile)
+        return context
+
+    def start(self, port = 0):
+        '''
+        Start serving on the given local port, or on a free one by
+        default, from a background thread and return the hostname
+        '''
+        self.server = mock_vco_server(('127.0.0.1', port), self._handler())
+        # Handshake in the thread of each connection rather than on accept
+        self.server.socket = self._get_ssl_context().wrap_socket(
+                                self.server.socket, server_side=True,
+                                do_handshake_on_connect=False)
+        threading.Thread(target=self.server.serve_forever,
+            daemon=True).start()
+        self.hostname = '127.0.0.1:%s' % self.server.server_address[1]
+        return self.hostname
+
+    def environ(self):
+        '''
+        Return the environment variables for the app to use the mock
+        VCO, with the certificate trusted through REQUESTS_CA_BUNDLE
+        '''
+        return { 'VCO_HOSTNAME': self.hostname,
+                 'VCO_TOKEN': self.TOKEN,
+                 'REQUESTS_CA_BUNDLE': self.cafile }
+
+    def stop(self):
+        '''
+        Stop serving and remove the certificate
+        '''
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.directory.cleanup()
+
+if __name__ == '__main__':
+    '''
+    Run the mock VCO in the foreground, e.g. to run the app against
+    with the environment variables printed
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--edges', type=int, default=10)
+    parser.add_argument('--links', type=int, default=2)
+    parser.add_argument('--enterprises', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0,
+        help='seconds of latency of each response')
+    parser.add_argument('--error-rate', type=float, default=0,
+        help='share of the requests answered with an HTTP 503')
+    parser.add_argument('--events-per-hour', type=int, default=1000)
+    args = parser.parse_args()
+
+    mock = mock_vco(args.edges, args.links, args.enterprises, args.latency,
+                    args.error_rate, args.events_per_hour)
+    mock.start(args.port)
+    for name, value in mock.environ().items():
+        print('%s=%s' % (name, value))
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,146 @@
+import random
+from vco_api_parser import WAN_QUALITY
+
+def link_quality_events(edge_id, links, time_start_e, time_end_e,
+min_per_sample, seed = 0):
+    '''
+    Return a synthetic linkQualityEvent/getLinkQualityEvents result
+    for an Edge with the given number of links and one sample per
+    sampling interval between the start and end time in epoch and
+    in milliseconds. Each sample is drawn from its Edge, link and
+    timestamp alone, so that overlapping intervals polled return the
+    same samples where they overlap, as the VCO does.
+    '''
+    time_step_e = int(min_per_sample * 60 * 1000)
+    time_first_e = -(-time_start_e // time_step_e) * time_step_e
+    result = { 'overallLinkQuality': { 'timeseries': [] } }
+    for link in range(links):
+        timeseries = []
+        for timestamp in range(time_first_e, time_end_e + 1, time_step_e):
+            rng = random.Random('%s-%s-%s-%s' % (seed, edge_id, link,
+                                                 timestamp))
+            detail = {}
+            for quality in WAN_QUALITY:
+                if quality.startswith('loss'):
+                    detail[quality] = round(abs(rng.gauss(0.5, 0.5)), 2)
+                else:
+                    detail[quality] = round(abs(rng.gauss(40, 5)), 2)
+            timeseries.append({
+                'timestamp': timestamp,
+                'score': {},
+                'metadata': { 'detail': detail } })
+        result[link_id(edge_id, link)] = { 'timeseries': timeseries }
+    return result
+
+def link_id(edge_id, link):
+    '''
+    Return the synthetic logical ID of a link of an Edge, as used by
+    link_quality_events
+    '''
+    return '%08d-0000-0000-0000-%012d' % (edge_id, link)
+
+def enterprise_edges(enterprise_id, edges):
+    '''
+    Return a synthetic enterprise/getEnterpriseEdges result for an
+    enterprise with the given number of Edges, with the Edge IDs
+    numbered from enterprise_id times 100,000 so that they are
+    unique across enterprises
+    '''
+    return [{ 'id': enterprise_id * 100000 + i,
+              'name': 'Edge-%s-%s' % (enterprise_id, i),
+              'enterpriseId': enterprise_id,
+              'edgeState': 'CONNECTED' } for i in range(1, edges + 1)]
+
+def aggregate_edge_link_metrics(enterprise_id, enterprise_name, edges,
+links, time_start_e = None, time_end_e = None, seed = 0):
+    '''
+    Return a synthetic monitoring/getAggregateEdgeLinkMetrics result
+    for an enterprise with the given number of Edges and links, with
+    the best latency, jitter and packet loss of each link the minimum
+    of its synthetic samples every 5 minutes between the start and end
+    time in epoch and in milliseconds, should they be given, as the
+    VCO reports the best of the interval rather than its mean
+    '''
+    metrics = []
+    for edge in enterprise_edges(enterprise_id, edges):
+        if time_start_e is not None:
+            result = link_quality_events(edge['id'], links, time_start_e,
+                        time_end_e, 5, seed)
+        for link in range(links):
+            best = {}
+            if time_start_e is not None:
+                details = [each['metadata']['detail'] for each in
+                    result[link_id(edge['id'], link)]['timeseries']]
+                for quality in WAN_QUALITY:
+                    if details:
+                        best['best' + quality[0].upper() + quality[1:]] = \
+                            min(detail[quality] for detail in details)
+            metrics.append(dict(best, **{
+                'linkId': len(metrics) + 1,
+                'linkLogicalId': link_id(edge['id'], link),
+                'bytesRx': 0,
+                'bytesTx': 0,
+                'link': {
+                    'edgeId': edge['id'],
+                    'edgeName': edge['name'],
+                    'displayName': 'WAN %s' % link,
+                    'enterpriseId': enterprise_id,
+                    'enterpriseName': enterprise_name } }))
+    return metrics
+
+def enterprise_events(enterprise_id, count, time_start_e, time_end_e,
+seed = 0):
+    '''
+    Return the given number of synthetic event/getEnterpriseEvents
+    records spread evenly between the start and end time in epoch
+    and in milliseconds
+    '''
+    rng = random.Random('%s-%s-events' % (seed, enterprise_id))
+    time_step_e = (time_end_e - time_start_e) / max(count, 1)
+    return [{ 'id': i,
+              'eventTime': int(time_start_e + i * time_step_e),
+              'event': rng.choice(('EDGE_UP', 'EDGE_DOWN', 'LINK_UP',
+                                   'LINK_DEAD', 'VPN_TUNNEL_UP')),
+              'category': 'EDGE',
+              'severity': rng.choice(('INFO', 'NOTICE', 'ERROR')),
+              'message': 'Synthetic event %s' % i,
+              'detail': '' } for i in range(count)]
+
+def firewall_logs(enterprise_id, count, time_start_e, time_end_e,
+seed = 0):
+    '''
+    Return the given number of synthetic
+    firewall/getEnterpriseFirewallLogs records spread evenly between
+    the start and end time in epoch and in milliseconds
+    '''
+    rng = random.Random('%s-%s-fw' % (seed, enterprise_id))
+    time_step_e = (time_end_e - time_start_e) / max(count, 1)
+    return [{ 'timestamp': int(time_start_e + i * time_step_e),
+              'edgeName': 'Edge-%s-%s' % (enterprise_id, i % 10 + 1),
+              'action': rng.choice(('ALLOW', 'DENY')),
+              'protocol': rng.choice(('TCP', 'UDP')),
+              'sourceIp': '10.0.%s.%s' % (rng.randint(0, 255),
+                                          rng.randint(1, 254)),
+              'destinationIp': '192.0.2.%s' % rng.randint(1, 254),
+              'destinationPort': rng.choice((53, 80, 443)) }
+            for i in range(count)]
+
+def edge_configuration_stack(edge_id, modules = 8, seed = 0):
+    '''
+    Return a synthetic edge/getEdgeConfigurationStack result for an
+    Edge, an Edge specific profile and an enterprise profile with
+    the given number of modules each
+    '''
+    rng = random.Random('%s-%s-config' % (seed, edge_id))
+    stack = []
+    for profile in ('edge', 'enterprise'):
+        stack.append({
+            'id': edge_id if profile == 'edge' else 1,
+            'name': '%s profile' % profile,
+            'modules': [{
+                'id': edge_id * 100 + i,
+                'name': 'module-%s' % i,
+                'data': { 'setting-%s' % j: rng.randint(0, 1000)
+                          for j in range(32) } }
+                for i in range(modules)] })
+    return stack
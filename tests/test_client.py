@@ -0,0 +1,132 @@
+import threading
+import unittest
+from unittest import mock
+import requests
+from vco_api_client import vco_api_call_error, vco_api_client, \
+    vco_api_http_error
+
+class test_client_batch(unittest.TestCase):
+
+    def get_client(self, batch = True):
+        '''
+        Return a client whose posts are answered locally, each call
+        with its parameter n, a batch with a call of n of 3 failing as
+        a whole, and a batch of any other calls with one error in the
+        place of the result of a call of n of 5, and keep the posts
+        '''
+        client = vco_api_client('vco.example', batch_size=2, pool_size=2)
+        client.posts = []
+        lock = threading.Lock()
+
+        def post(url, payload):
+            with lock:
+                client.posts.append(payload)
+            if not isinstance(payload, list):
+                return { 'jsonrpc': '2.0', 'id': payload['id'],
+                         'result': payload['params']['n'] }
+            if not batch:
+                return { 'error': { 'code': -32600,
+                                    'message': 'Invalid Request' } }
+            if any(each['params']['n'] == 3 for each in payload):
+                raise vco_api_http_error('HTTP 502', 502)
+            return [{ 'jsonrpc': '2.0', 'id': each['id'],
+                      'error': { 'code': -1, 'message': 'failed' } }
+                    if each['params']['n'] == 5 else
+                    { 'jsonrpc': '2.0', 'id': each['id'],
+                      'result': each['params']['n'] }
+                    for each in reversed(payload)]
+
+        client._post = post
+        return client
+
+    def test_batch_failed_chunk(self):
+        '''
+        Send the calls of the batch that fails one by one only, and
+        keep the results of the others in the order of the calls
+        '''
+        client = self.get_client()
+        results = client.call_api_batch([('m', { 'n': n })
+                                         for n in range(7)])
+        self.assertEqual(results[:5], [0, 1, 2, 3, 4])
+        self.assertIsInstance(results[5], vco_api_call_error)
+        self.assertEqual(results[6], 6)
+
+        single = sorted(payload['params']['n'] for payload in client.posts
+                        if not isinstance(payload, list))
+        self.assertEqual(single, [2, 3])
+        self.assertEqual(len(client.posts), 6)
+        self.assertTrue(client.batch_supported)
+
+    def test_batch_unsupported(self):
+        '''
+        Send the calls one by one should the VCO not support batching,
+        and from then on
+        '''
+        client = self.get_client(batch = False)
+        calls = [('m', { 'n': n }) for n in range(4)]
+        self.assertEqual(client.call_api_batch(calls), [0, 1, 2, 3])
+        self.assertFalse(client.batch_supported)
+        client.posts.clear()
+        self.assertEqual(client.call_api_batch(calls), [0, 1, 2, 3])
+        self.assertFalse(any(isinstance(payload, list)
+                             for payload in client.posts))
+
+class test_client_retry(unittest.TestCase):
+
+    class response:
+        '''
+        A response of the given status code whose JSON is the result
+        of a call with the id of 1
+        '''
+        def __init__(self, status_code):
+            self.status_code = status_code
+            self.headers = {}
+            self.content = b''
+
+        def json(self):
+            return { 'jsonrpc': '2.0', 'id': 1, 'result': 'ok' }
+
+    def get_client(self, answers):
+        '''
+        Return a client whose session posts are answered with the
+        given exceptions and status codes in turn, and keep the number
+        of posts
+        '''
+        client = vco_api_client('vco.example', max_retries=2)
+        client.posts = 0
+        answers = iter(answers)
+
+        def post(*args, **kwargs):
+            client.posts += 1
+            answer = next(answers)
+            if isinstance(answer, Exception):
+                raise answer
+            return self.response(answer)
+
+        client.session.post = post
+        return client
+
+    def test_retry_transient(self):
+        '''
+        Retry on a connection error and on a transient HTTP error,
+        and return the result of the call that succeeds
+        '''
+        client = self.get_client([requests.ConnectionError('reset'),
+                                  503, 200])
+        with mock.patch('vco_api_client.time.sleep') as sleep:
+            self.assertEqual(client.call_api('m', {}), 'ok')
+        self.assertEqual(client.posts, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_retry_exhausted(self):
+        '''
+        Raise an HTTP error once the retries run out
+        '''
+        client = self.get_client([requests.Timeout('timed out')] * 3)
+        with mock.patch('vco_api_client.time.sleep'):
+            with self.assertRaises(vco_api_http_error):
+                client.call_api('m', {})
+        self.assertEqual(client.posts, 3)
+
+if __name__ == '__main__':
+    unittest.main()
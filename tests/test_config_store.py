@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from vco_api_config_store import diff_config, vco_api_config_store
+
+class test_config_store(unittest.TestCase):
+
+    def test_dedup(self):
+        '''
+        Store equal configs once whatever the order of their keys, and
+        read them back
+        '''
+        config = { 'modules': [{ 'id': 1, 'name': 'device',
+                                 'data': { 'a': 1, 'b': [1, 2] } }] }
+        with tempfile.TemporaryDirectory() as directory:
+            store = vco_api_config_store(directory)
+            config_hash = store.put(config)
+            self.assertEqual(store.put({ 'modules': [{
+                'data': { 'b': [1, 2], 'a': 1 },
+                'name': 'device', 'id': 1 }] }), config_hash)
+            self.assertNotEqual(store.put({ 'modules': [] }), config_hash)
+            self.assertEqual(store.get(config_hash), config)
+            objects = [name for _, _, names in os.walk(directory + '/objects')
+                       for name in names]
+            self.assertEqual(len(objects), 2)
+
+    def test_snapshots(self):
+        '''
+        Find the Edges added, removed and changed between two snapshots
+        from their manifests, and the differences of a changed one
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            store = vco_api_config_store(directory)
+            store.save_manifest({ 'edge-a': store.put({ 'x': 1 }),
+                                  'edge-b': store.put({ 'x': 2 }) },
+                                '2024-01-01-00-00-00')
+            store.save_manifest({ 'edge-b': store.put({ 'x': 3 }),
+                                  'edge-c': store.put({ 'x': 1 }) },
+                                '2024-01-02-00-00-00')
+            snapshots = store.list_snapshots()
+            self.assertEqual(snapshots, ['2024-01-01-00-00-00',
+                                         '2024-01-02-00-00-00'])
+            self.assertEqual(store.changes(*snapshots),
+                             { 'added': ['edge-c'],
+                               'removed': ['edge-a'],
+                               'changed': ['edge-b'] })
+            self.assertEqual(store.diff(*snapshots, 'edge-b'),
+                             [('/x', 2, 3)])
+
+    def test_diff_keyed(self):
+        '''
+        Match the objects of a list by their id rather than by their
+        position, so that a reordered list is not a change
+        '''
+        before = [{ 'id': 1, 'v': 'a' }, { 'id': 2, 'v': 'b' }]
+        after = [{ 'id': 2, 'v': 'b' }, { 'id': 1, 'v': 'c' }]
+        self.assertEqual(diff_config(before, list(reversed(before))), [])
+        self.assertEqual(diff_config(before, after), [('/1/v', 'a', 'c')])
+        self.assertEqual(diff_config([1, 2], [1]), [('/1', 2, None)])
+
+if __name__ == '__main__':
+    unittest.main()
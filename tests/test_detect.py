@@ -0,0 +1,119 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from vco_api_detect import vco_api_online_detector, \
+    vco_api_seasonal_detector
+
+class test_online_detector(unittest.TestCase):
+
+    def get_detector(self, directory, timestamp, values, half_life_sec,
+    batches = 3):
+        '''
+        Return an online detector of the given half-life with the given
+        samples of a WAN quality of a WAN of an Edge folded in over a
+        few runs, saved and loaded again in between
+        '''
+        file_name = os.path.join(directory, 'wan_quality_online.npz')
+        for each in np.array_split(np.arange(len(values)), batches):
+            detector = vco_api_online_detector(file_name, 1,
+                        half_life_sec = half_life_sec)
+            detector.load()
+            detector.update({ 1: { 'wan': {
+                'timestamp': timestamp[each],
+                'latencyMsRx': values[each] } } })
+            detector.save()
+        detector = vco_api_online_detector(file_name, 1,
+                    half_life_sec = half_life_sec)
+        detector.load()
+        return detector
+
+    def test_weighted(self):
+        '''
+        Find the mean and the standard deviation of reliability weights
+        halving with every half-life of age, as computed at once, for
+        a half-life down to that of a sum of weights below two
+        '''
+        rng = np.random.default_rng(0)
+        timestamp = np.arange(100, dtype='int64') * 300000
+        values = rng.normal(50, 5, len(timestamp))
+        for half_life_sec in (3600, 200):
+            with self.subTest(half_life_sec = half_life_sec), \
+            tempfile.TemporaryDirectory() as directory:
+                detector = self.get_detector(directory, timestamp, values,
+                            half_life_sec)
+                mean, std = detector.get_mean_std(np.array([0]))
+
+                weights = 0.5 ** ((timestamp[-1] - timestamp)
+                                  / (half_life_sec * 1000))
+                weight = np.sum(weights)
+                mean_weighted = np.sum(weights * values) / weight
+                std_weighted = np.sqrt(np.sum(weights *
+                                    (values - mean_weighted) ** 2)
+                                    / (weight - np.sum(weights ** 2)
+                                       / weight))
+                self.assertAlmostEqual(mean[0], mean_weighted)
+                self.assertAlmostEqual(std[0], std_weighted)
+
+    def test_unweighted(self):
+        '''
+        Find the sample standard deviation with no half-life
+        '''
+        rng = np.random.default_rng(1)
+        timestamp = np.arange(50, dtype='int64') * 300000
+        values = rng.normal(50, 5, len(timestamp))
+        with tempfile.TemporaryDirectory() as directory:
+            detector = self.get_detector(directory, timestamp, values, None)
+            mean, std = detector.get_mean_std(np.array([0]))
+        self.assertAlmostEqual(mean[0], values.mean())
+        self.assertAlmostEqual(std[0], values.std(ddof=1))
+
+    def test_weighted_few(self):
+        '''
+        Leave the standard deviation as NaN, and hence find no anomaly,
+        with a half-life too short for two effective samples
+        '''
+        timestamp = np.arange(20, dtype='int64') * 300000
+        values = np.full(len(timestamp), 50.0)
+        with tempfile.TemporaryDirectory() as directory:
+            detector = self.get_detector(directory, timestamp, values, 60)
+            _, std = detector.get_mean_std(np.array([0]))
+            wan_anomalies = detector.detect({ 1: { 'wan': {
+                'timestamp': timestamp[-1:] + 300000,
+                'latencyMsRx': np.array([500.0]) } } })
+        self.assertTrue(np.isnan(std[0]))
+        self.assertEqual(wan_anomalies, [])
+
+class test_seasonal_detector(unittest.TestCase):
+
+    def test_time_last_e(self):
+        '''
+        Return the timestamp of the latest sample folded in of each
+        Edge, kept across runs and expiries, without reading the cells
+        '''
+        rng = np.random.default_rng(2)
+        timestamp = np.arange(400, dtype='int64') * 300000
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'wan_quality_seasonal')
+            for edge, end in ((1, 300), (2, 200), (3, 400), (1, 350)):
+                detector = vco_api_seasonal_detector(file_name, 1)
+                detector.load()
+                detector.update({ edge: { 'wan': {
+                    'timestamp': timestamp[:end],
+                    'latencyMsRx': rng.normal(50, 5, end) } } })
+                detector.expire([1, 2])
+                detector.save()
+
+            detector = vco_api_seasonal_detector(file_name, 1)
+            detector.load()
+            time_last = detector.time_last
+            detector.time_last = None
+            self.assertEqual(detector.get_time_last_e(),
+                             { 1: int(timestamp[349]),
+                               2: int(timestamp[199]) })
+            self.assertEqual(time_last.reshape(-1, detector.BUCKETS)
+                             .max(axis=1).tolist(),
+                             detector.time_last_key.tolist())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+from vco_api_event_store import vco_api_event_store
+
+class test_event_store(unittest.TestCase):
+
+    def get_records(self, count, time_start_e = 1700000000000):
+        '''
+        Return the given number of records a second apart
+        '''
+        return [{ 'id': i, 'eventTime': time_start_e + i * 1000 }
+                for i in range(count)]
+
+    def test_query_rotated(self):
+        '''
+        Rotate and compress the segments as they fill up, and return
+        the records of a time range across compressed and active
+        segments in the order written
+        '''
+        records = self.get_records(500)
+        with tempfile.TemporaryDirectory() as directory:
+            with vco_api_event_store(directory + '/events', 'events',
+            'eventTime', rotate_bytes=4096, block_records=16) as store:
+                self.assertEqual(store.write(iter(records[:300])), 300)
+                self.assertEqual(store.write(records[300:]), 200)
+
+            store = vco_api_event_store(directory + '/events', 'events',
+                        'eventTime')
+            self.assertTrue(any(segment['compressed']
+                                for segment in store.segments))
+            self.assertEqual(list(store.query(
+                records[100]['eventTime'], records[449]['eventTime'])),
+                records[100:450])
+            self.assertEqual(list(store.query(0, 1)), [])
+
+    def test_time_field(self):
+        '''
+        Find the records of a time in ISO 8601 format, and keep those
+        of no valid time out of any query
+        '''
+        records = [{ 'id': 0, 'eventTime': '2023-11-14T22:13:20.000Z' },
+                   { 'id': 1, 'eventTime': True },
+                   { 'id': 2 },
+                   { 'id': 3, 'eventTime': 1700000001000 }]
+        with tempfile.TemporaryDirectory() as directory:
+            with vco_api_event_store(directory, 'events',
+            'eventTime') as store:
+                store.write(records)
+                self.assertEqual(list(store.query(0, 2 ** 62)),
+                                 [records[0], records[3]])
+
+    def test_interrupted(self):
+        '''
+        Index the records written to the active segment by a run
+        interrupted before it saved the index, leaving out a last line
+        cut short
+        '''
+        records = self.get_records(50)
+        with tempfile.TemporaryDirectory() as directory:
+            with vco_api_event_store(directory, 'events',
+            'eventTime') as store:
+                store.write(records[:20])
+                file_name = directory + '/' + store.segments[-1]['file']
+            with open(file_name, 'a') as f:
+                for record in records[20:]:
+                    f.write(json.dumps(record) + '\n')
+                f.write('{"id": 50, "eventTi')
+
+            store = vco_api_event_store(directory, 'events', 'eventTime')
+            self.assertEqual(store.segments[-1]['count'], 50)
+            self.assertEqual(list(store.query(0, 2 ** 62)), records)
+            self.assertEqual(sorted(os.listdir(directory)),
+                             sorted([store.segments[-1]['file'],
+                                     'events.index.json']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import gzip
+import os
+import tempfile
+import unittest
+from vco_api_file import open_atomic
+
+class test_open_atomic(unittest.TestCase):
+
+    def test_replace(self):
+        '''
+        Replace the file once written, with the given opener
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'state.json.gz')
+            for data in (b'old', b'new'):
+                with open_atomic(file_name, 'wb', gzip.open) as f:
+                    f.write(data)
+            with gzip.open(file_name) as f:
+                self.assertEqual(f.read(), b'new')
+            self.assertEqual(os.listdir(directory), ['state.json.gz'])
+
+    def test_interrupted(self):
+        '''
+        Keep the previous file and remove the temporary one should the
+        write fail
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'state.json')
+            with open_atomic(file_name) as f:
+                f.write('old')
+            with self.assertRaises(ValueError):
+                with open_atomic(file_name) as f:
+                    f.write('partly')
+                    raise ValueError
+            with open(file_name) as f:
+                self.assertEqual(f.read(), 'old')
+            self.assertEqual(os.listdir(directory), ['state.json'])
+
+if __name__ == '__main__':
+    unittest.main()
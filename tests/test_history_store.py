@@ -0,0 +1,105 @@
+import tempfile
+import unittest
+import numpy as np
+from vco_api_history_store import vco_api_history_store
+from vco_api_parser import WAN_QUALITY
+
+class test_history_store(unittest.TestCase):
+
+    def get_columns(self, start, end):
+        '''
+        Return the columns of the samples of the given range of steps
+        of 5 minutes, with each WAN quality the step times its position
+        '''
+        step = np.arange(start, end)
+        columns = { 'timestamp': step * 300000 }
+        for i, quality in enumerate(WAN_QUALITY):
+            columns[quality] = step * (i + 1.0)
+        return columns
+
+    def assert_columns(self, columns, expected, qualities = WAN_QUALITY):
+        '''
+        Assert that the given columns are those expected, of the
+        timestamps and the given WAN qualities
+        '''
+        self.assertEqual(sorted(columns),
+                         sorted(('timestamp',) + tuple(qualities)))
+        for column in columns:
+            np.testing.assert_array_equal(columns[column],
+                                          expected[column])
+
+    def test_query(self):
+        '''
+        Return the samples of a time range across sealed chunks and the
+        tail once saved and opened again, of the WAN qualities asked
+        for only
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            store = vco_api_history_store(directory, chunk_rows=10)
+            for start in range(0, 35, 7):
+                store.append(1, { 'wan': self.get_columns(start,
+                                                          start + 7) })
+            store.save()
+
+            store = vco_api_history_store(directory, chunk_rows=10)
+            expected = self.get_columns(8, 33)
+            self.assert_columns(store.query(1, 'wan', 8 * 300000,
+                                32 * 300000), expected)
+            self.assert_columns(store.query(1, 'wan', 8 * 300000 - 1,
+                                32 * 300000 + 1, WAN_QUALITY[:1]),
+                                { column: expected[column] for column
+                                  in ('timestamp', WAN_QUALITY[0]) },
+                                WAN_QUALITY[:1])
+            self.assertIsNone(store.query(1, 'wan', 35 * 300000,
+                              40 * 300000))
+            self.assertIsNone(store.query(2, 'wan', 0, 40 * 300000))
+
+    def test_append_new(self):
+        '''
+        Append only the samples newer than the latest one stored of a
+        link, in time order, with a WAN quality missing stored as NaN
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            store = vco_api_history_store(directory, chunk_rows=4)
+            self.assertEqual(store.append(1, { 'wan':
+                             self.get_columns(0, 6) }), 6)
+            columns = self.get_columns(3, 9)
+            order = np.array([5, 0, 4, 1, 3, 2])
+            columns = { column: values[order]
+                        for column, values in columns.items() }
+            del columns[WAN_QUALITY[-1]]
+            self.assertEqual(store.append(1, { 'wan': columns }), 3)
+            self.assertEqual(store.get_time_last_e(), { 1: 8 * 300000 })
+
+            result = store.query(1, 'wan', 0, 8 * 300000)
+            expected = self.get_columns(0, 9)
+            expected[WAN_QUALITY[-1]][6:] = np.nan
+            self.assert_columns(result, expected)
+
+    def test_interrupted(self):
+        '''
+        Leave out the samples appended by a run interrupted before it
+        saved the index, and overwrite them with the next append
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            store = vco_api_history_store(directory, chunk_rows=10)
+            store.append(1, { 'wan': self.get_columns(0, 5) })
+            store.save()
+            store.append(1, { 'wan': self.get_columns(5, 8) })
+
+            store = vco_api_history_store(directory, chunk_rows=10)
+            self.assertEqual(store.get_time_last_e(), { 1: 4 * 300000 })
+            columns = self.get_columns(5, 12)
+            columns[WAN_QUALITY[0]] = columns[WAN_QUALITY[0]] + 0.5
+            store.append(1, { 'wan': columns })
+            store.save()
+
+            store = vco_api_history_store(directory, chunk_rows=10)
+            expected = self.get_columns(0, 12)
+            expected[WAN_QUALITY[0]][5:] += 0.5
+            self.assert_columns(store.query_all(0, 12 * 300000)[1]['wan'],
+                                expected)
+            self.assertEqual(store.query_all(0, 12 * 300000, [2]), {})
+
+if __name__ == '__main__':
+    unittest.main()
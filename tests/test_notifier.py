@@ -0,0 +1,107 @@
+import os
+import smtplib
+import tempfile
+import unittest
+from unittest import mock
+from vco_api_detect import wan_anomaly
+from vco_api_notifier import vco_api_alert_suppressor, vco_api_notifier
+
+class test_notifier(unittest.TestCase):
+
+    def get_server(self, failures = 0):
+        '''
+        Return a mock SMTP server class whose connections keep the
+        emails sent, the first given number of sends failing as of a
+        server that closed the connection
+        '''
+        server = mock.MagicMock()
+        server.emails = []
+        server.failures = failures
+
+        def sendmail(sender, receiver, email_msg):
+            if server.failures:
+                server.failures -= 1
+                raise smtplib.SMTPServerDisconnected('closed')
+            server.emails.append(email_msg)
+
+        server.return_value.sendmail.side_effect = sendmail
+        return server
+
+    def test_digest(self):
+        '''
+        Coalesce the notifications queued within digest_sec into one
+        email
+        '''
+        server = self.get_server()
+        with mock.patch('vco_api_notifier.smtplib.SMTP_SSL', server):
+            notifier = vco_api_notifier('smtp.example', 465, 'a', 'b', 'p',
+                        digest_sec = 0.5)
+            for i in range(3):
+                notifier.notify('WAN anomaly', 'body %s' % i)
+            notifier.close()
+        self.assertEqual(server.emails, ['Subject: WAN anomaly (3)\n\n'
+                                         'body 0\nbody 1\nbody 2'])
+        self.assertEqual(server.call_count, 1)
+        self.assertEqual(notifier.emails_sent, 1)
+
+    def test_retry(self):
+        '''
+        Reconnect and retry should sending fail, and give up after
+        max_retries
+        '''
+        for failures, sent in ((2, 1), (3, 0)):
+            with self.subTest(failures = failures):
+                server = self.get_server(failures)
+                with mock.patch('vco_api_notifier.smtplib.SMTP_SSL',
+                server), mock.patch('vco_api_notifier.time.sleep'):
+                    notifier = vco_api_notifier('smtp.example', 465, 'a',
+                                'b', 'p', max_retries = 2)
+                    notifier.notify('WAN anomaly', 'body')
+                    notifier.close()
+                self.assertEqual(len(server.emails), sent)
+                self.assertEqual(server.call_count, min(failures + 1, 3))
+                self.assertEqual((notifier.emails_sent,
+                                  notifier.emails_failed), (sent, 1 - sent))
+
+class test_alert_suppressor(unittest.TestCase):
+
+    def get_anomaly(self, edge, quality = 'latencyMsRx'):
+        '''
+        Return an anomaly of the given WAN quality of a WAN of an Edge
+        '''
+        return wan_anomaly(edge, 'wan', quality, 20.0, 10.0, 1.0, 2.0)
+
+    def test_persist(self):
+        '''
+        Alert an anomaly when new, then once it has persisted for the
+        cooldown, and again as new once it has cleared
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'alert_state.json')
+            anomalies = [self.get_anomaly(1)]
+            alerted = []
+            for time_now, found in ((0, True), (300, True), (3600, True),
+            (3900, False), (4200, True)):
+                suppressor = vco_api_alert_suppressor(file_name)
+                alerted.append(len(suppressor.filter(
+                    anomalies if found else [], time_now)))
+            self.assertEqual(alerted, [1, 0, 1, 0, 1])
+
+    def test_edges(self):
+        '''
+        Keep the state of the anomalies of the Edges not looked into,
+        and clear that of those looked into and found with none
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            suppressor = vco_api_alert_suppressor(
+                            os.path.join(directory, 'alert_state.json'),
+                            cooldown_sec = 600)
+            anomalies = [self.get_anomaly(1), self.get_anomaly(2),
+                         self.get_anomaly(2, 'jitterMsRx')]
+            self.assertEqual(suppressor.filter(anomalies, 0), anomalies)
+            self.assertEqual(suppressor.filter([], 300, [2]), [])
+            self.assertEqual(suppressor.filter(anomalies, 400),
+                             anomalies[1:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import math
+import unittest
+from vco_api_parser import WAN_QUALITY, parse_link_quality, parse_timestamp_e
+
+class test_parser(unittest.TestCase):
+
+    def test_parse_timestamp_e(self):
+        '''
+        Parse the timestamps in epoch and in milliseconds and in ISO
+        8601 format, and reject a bool and a fraction of a millisecond
+        '''
+        self.assertEqual(parse_timestamp_e(1700000000000), 1700000000000)
+        self.assertEqual(parse_timestamp_e(1700000000000.0), 1700000000000)
+        self.assertEqual(parse_timestamp_e('2023-11-14T22:13:20Z'),
+                         1700000000000)
+        self.assertEqual(parse_timestamp_e('2023-11-14T22:13:20'),
+                         1700000000000)
+        self.assertRaises(TypeError, parse_timestamp_e, True)
+        self.assertRaises(ValueError, parse_timestamp_e, 1700000000000.5)
+        self.assertRaises(ValueError, parse_timestamp_e, math.nan)
+
+    def test_parse_link_quality(self):
+        '''
+        Parse the samples of a link into columns, with a missing or
+        null quality as NaN, and leave out the malformed samples
+        '''
+        detail = { quality: 1.0 for quality in WAN_QUALITY }
+        sample = lambda timestamp, detail: { 'timestamp': timestamp,
+                    'metadata': { 'detail': detail } }
+        wan = parse_link_quality({
+            'overallLinkQuality': { 'timeseries': [] },
+            'link-1': { 'timeseries': [
+                sample(1000, detail),
+                sample(True, detail),
+                sample(1500.5, detail),
+                { 'timestamp': 1700 },
+                sample('1970-01-01T00:00:02Z', dict(detail,
+                    latencyMsTx=None)),
+                sample(3000, { 'jitterMsRx': 2.0 })] },
+            'link-2': { 'timeseries': [sample(None, detail)] },
+            'link-3': None })
+
+        self.assertEqual(list(wan), ['link-1'])
+        columns = wan['link-1']
+        self.assertEqual(columns['timestamp'].tolist(), [1000, 2000, 3000])
+        self.assertEqual(columns['timestamp'].dtype, 'int64')
+        self.assertTrue(math.isnan(columns['latencyMsTx'][1]))
+        self.assertEqual(columns['jitterMsRx'].tolist()[2], 2.0)
+        self.assertTrue(math.isnan(columns['lossPctRx'][2]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import tempfile
+import unittest
+from vco_api_detect import wan_anomaly
+from vco_api_main import vco_api_main
+from vco_api_parser import WAN_QUALITY
+
+class test_prefilter(unittest.TestCase):
+
+    def get_main(self, directory, best):
+        '''
+        Return a vco_api_main of three Edges, with no login, whose
+        aggregate metrics are of a link per Edge with all its best
+        values those the given function returns of the Edge and whether
+        of the present interval
+        '''
+        main = object.__new__(vco_api_main)
+        main.enterprise = None
+        main.edge_id = [1, 2, 3]
+        main.time_now = 1700000000
+        main.prefilter_ratio = 0.1
+        main.prefilter_max_staleness = 1800
+        main._get_ent_dir = lambda: directory + '/'
+
+        class client:
+            def call_api(self, path, parameters):
+                present = parameters['interval']['end'] \
+                            == main.time_now * 1000
+                metrics = []
+                for edge in main.edge_id:
+                    link = { 'linkLogicalId': 'link-%s' % edge,
+                             'link': { 'edgeId': edge } }
+                    for key in WAN_QUALITY:
+                        link['best' + key[0].upper() + key[1:]] = \
+                            best(edge, present)
+                    metrics.append(link)
+                return metrics
+
+        main.client = client()
+        return main
+
+    def test_screen(self):
+        '''
+        Pass the Edges never polled, then only those of a best value
+        above that of the interval before by more than the ratio
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            main = self.get_main(directory, lambda edge, present:
+                                 12.0 if edge == 2 and present else 10.0)
+            self.assertEqual(main._get_candidate_edges(300), [1, 2, 3])
+            main._save_prefilter_state([1, 2, 3], [])
+            main.time_now += 300
+            self.assertEqual(main._get_candidate_edges(300), [2])
+
+    def test_anomaly_staleness(self):
+        '''
+        Pass an Edge with an anomaly found in its last poll until one
+        is found with none, and any Edge not polled for
+        prefilter_max_staleness seconds, whatever its aggregates
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            main = self.get_main(directory, lambda edge, present: 10.0)
+            main._save_prefilter_state([1, 2, 3], [wan_anomaly(3,
+                'link-3', WAN_QUALITY[0], 20.0, 10.0, 1.0, 2.0)])
+            main.time_now += 300
+            self.assertEqual(main._get_candidate_edges(300), [3])
+            main._save_prefilter_state([3], [])
+            main.time_now += 300
+            self.assertEqual(main._get_candidate_edges(300), [])
+
+            main.time_now += 1200
+            self.assertEqual(main._get_candidate_edges(300), [1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+import numpy as np
+from vco_api_detect import vco_api_anomaly_engine
+from vco_api_history_store import vco_api_history_store
+from vco_api_parser import WAN_QUALITY
+from vco_api_replay import PARAMS, _detect_windows
+
+class test_replay(unittest.TestCase):
+
+    def test_detect_windows_engine(self):
+        '''
+        Replay the windows of a history store and look into each with
+        the anomaly engine as detect_wan_anomaly does, and find the same
+        anomalies for each key in each window
+        '''
+        rng = np.random.default_rng(0)
+        time_step_e = PARAMS['min_per_sample'] * 60 * 1000
+        timestamp = np.arange(288, dtype='int64') * time_step_e
+        with tempfile.TemporaryDirectory() as directory:
+            store = vco_api_history_store(directory, chunk_rows=100)
+            for edge in (1, 2, 3):
+                for wan in ('a', 'b'):
+                    columns = { 'timestamp': timestamp }
+                    for quality in WAN_QUALITY:
+                        values = rng.normal(50, 5, len(timestamp))
+                        values[rng.random(len(timestamp)) < 0.05] += 40
+                        values[rng.random(len(timestamp)) < 0.05] = np.nan
+                        columns[quality] = values
+                    store.append(edge, { wan: columns })
+            store.save()
+
+            params = dict(PARAMS, std_factor=1.5)
+            time_end_e = timestamp[20:] + 1000
+            count = 0
+            for edge, wan in sorted(store.links):
+                columns = store.query(edge, wan, 0, int(timestamp[-1]))
+                is_anomaly = { quality: _detect_windows(columns['timestamp'],
+                                columns[quality], time_end_e, params)
+                               for quality in WAN_QUALITY }
+                for i, time_end in enumerate(time_end_e.tolist()):
+                    time_split = time_end - params['interval_sec_present'] \
+                                 * 1000
+                    time_start = time_split - params['interval_sec_hist'] \
+                                 * 1000
+                    window = store.query(edge, wan, time_start, time_end)
+                    present = window['timestamp'] >= time_split
+                    engine = vco_api_anomaly_engine(params['std_factor'])
+                    engine.add(
+                        { edge: { wan: { column: window[column][present]
+                                         for column in window } } },
+                        { edge: { wan: { column: window[column][~present]
+                                         for column in window } } })
+                    found = set(each.quality for each in engine.detect())
+                    for quality in WAN_QUALITY:
+                        self.assertEqual(quality in found,
+                            bool(is_anomaly[quality][i]),
+                            (edge, wan, quality, time_end))
+                    count += len(found)
+            self.assertGreater(count, 0)
+
+if __name__ == '__main__':
+    unittest.main()
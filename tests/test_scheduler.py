@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from vco_api_scheduler import vco_api_poll_scheduler
+
+class test_poll_scheduler(unittest.TestCase):
+
+    def run_polls(self, scheduler, deviation, runs, time_now = 0):
+        '''
+        Run the scheduler every 5 minutes, with each Edge polled of the
+        deviation the given function returns of it, and return the
+        Edges polled on each run
+        '''
+        polled = []
+        for run in range(runs):
+            edges = scheduler.pop_due([1, 2], time_now + run * 300)
+            for edge in edges:
+                scheduler.update(edge, time_now + run * 300,
+                                 deviation(edge), 2)
+            polled.append(sorted(edges))
+        return polled
+
+    def test_backoff(self):
+        '''
+        Poll an Edge with an anomaly, or not looked into, on every
+        run, and back a stable Edge off up to the maximum staleness
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            for deviation in (3, None):
+                with self.subTest(deviation = deviation):
+                    scheduler = vco_api_poll_scheduler(
+                                    os.path.join(directory, 'schedule'),
+                                    300, 1200)
+                    polled = self.run_polls(scheduler, lambda edge:
+                                            deviation if edge == 1 else 0,
+                                            12)
+                    self.assertTrue(all(1 in edges for edges in polled))
+                    self.assertEqual([run for run, edges in enumerate(polled)
+                                      if 2 in edges], [0, 2, 6, 10])
+
+    def test_budget(self):
+        '''
+        Poll no more Edges than the budget of API calls allows, the
+        most overdue first among those of the same polling interval,
+        and defer the rest
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            scheduler = vco_api_poll_scheduler(
+                            os.path.join(directory, 'schedule'), 300, 1200,
+                            calls_per_min = 0.2)
+            polled = self.run_polls(scheduler, lambda edge: 3, 4)
+            self.assertEqual(polled, [[1], [2], [1], [2]])
+
+    def test_save(self):
+        '''
+        Carry the schedule over to the next run through the file, drop
+        the Edges no longer given, and poll a new Edge, or one popped
+        but never scheduled again, on the next run
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'schedule')
+            scheduler = vco_api_poll_scheduler(file_name, 300, 1200)
+            self.run_polls(scheduler, lambda edge: 0, 2)
+            scheduler.save()
+
+            scheduler = vco_api_poll_scheduler(file_name, 300, 1200)
+            self.assertEqual(scheduler.interval, { 1: 600, 2: 600 })
+            self.assertEqual(scheduler.pop_due([1, 3], 540), [3])
+            self.assertEqual(sorted(scheduler.pop_due([1, 3], 570)), [1, 3])
+            self.assertEqual(sorted(scheduler.interval), [1, 3])
+
+if __name__ == '__main__':
+    unittest.main()
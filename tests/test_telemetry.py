@@ -0,0 +1,23 @@
+import unittest
+from vco_api_telemetry import vco_api_telemetry
+
+class test_telemetry(unittest.TestCase):
+
+    def test_render_mixed_label_types(self):
+        '''
+        Render the retries of a method recorded both with the name of
+        a connection error and with an HTTP status code as the reason
+        '''
+        telemetry = vco_api_telemetry({ 'enterprise': 1 })
+        telemetry.inc('vco_api_retries_total', method='m',
+            reason='ConnectionError')
+        telemetry.inc('vco_api_retries_total', method='m', reason=503)
+        telemetry.inc('vco_api_retries_total', method='m', reason=503)
+        text = telemetry.render()
+        self.assertIn('vco_api_retries_total{enterprise="1",method="m",'
+            'reason="503"} 2.0\n', text)
+        self.assertIn('vco_api_retries_total{enterprise="1",method="m",'
+            'reason="ConnectionError"} 1.0\n', text)
+
+if __name__ == '__main__':
+    unittest.main()
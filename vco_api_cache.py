@@ -0,0 +1,223 @@
+import json
+import time
+from vco_api_file import open_atomic
+
+class vco_api_sample_cache():
+    '''
+    A rolling window of the WAN quality samples of each of the links
+    of each of the Edges, held as columns of NumPy arrays ordered by
+    the timestamp in epoch and in milliseconds, and saved to disk as
+    a compressed NumPy archive between runs. NumPy is imported by
+    the methods that need it rather than with the module, so that the
+    topology cache alone does not pay for it.
+    '''
+
+    def __init__(self, file_name, ent_id, min_per_sample):
+        '''
+        Initiate an empty cache for the given enterpriseId and
+        sampling interval in minutes
+        '''
+        self.file_name = file_name
+        self.ent_id = ent_id
+        self.min_per_sample = min_per_sample
+        self.samples = {}
+
+    @property
+    def time_step_e(self):
+        '''
+        Return the sampling interval in milliseconds
+        '''
+        return int(self.min_per_sample * 60 * 1000)
+
+    def load(self):
+        '''
+        Load the cache from disk, leaving it empty should the file be
+        absent or unreadable, or should it have been saved for another
+        enterprise or sampling interval
+        '''
+        import numpy as np
+        self.samples = {}
+        try:
+            with np.load(self.file_name) as archive:
+                meta = json.loads(str(archive['meta']))
+                if meta['ent_id'] != self.ent_id \
+                or meta['min_per_sample'] != self.min_per_sample:
+                    return
+                for i, (edge, wan, column) in enumerate(meta['index']):
+                    self.samples.setdefault(edge, {}).setdefault(wan, {})[
+                        column] = archive['a%d' % i]
+        except (OSError, KeyError, ValueError):
+            self.samples = {}
+
+    def save(self):
+        '''
+        Save the cache to disk as a compressed NumPy archive
+        '''
+        import numpy as np
+        arrays = {}
+        index = []
+        for edge in self.samples:
+            for wan in self.samples[edge]:
+                for column in self.samples[edge][wan]:
+                    arrays['a%d' % len(index)] = \
+                        self.samples[edge][wan][column]
+                    index.append([edge, wan, column])
+        meta = { 'ent_id': self.ent_id,
+                 'min_per_sample': self.min_per_sample,
+                 'index': index }
+
+        with open_atomic(self.file_name, 'wb') as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta)),
+                                **arrays)
+
+    def get_time_last_e(self, edge):
+        '''
+        Return the timestamp of the latest sample of any of the
+        links of the given Edge, or None if nothing is cached
+        '''
+        time_last_e = None
+        for wan in self.samples.get(edge, {}).values():
+            if len(wan['timestamp']):
+                time_last = int(wan['timestamp'][-1])
+                if time_last_e is None or time_last > time_last_e:
+                    time_last_e = time_last
+        return time_last_e
+
+    def is_gap(self, edge, wan_new, time_end_e):
+        '''
+        Return True should the given newly polled samples of an Edge
+        not continue on from the cached ones within one sampling
+        interval, or should there be none even though more than one
+        sampling interval has elapsed, in which case a full poll of
+        the Edge is needed instead
+        '''
+        time_last_e = self.get_time_last_e(edge)
+        if time_last_e is None:
+            return True
+
+        time_first_new_e = None
+        for wan in wan_new.values():
+            if len(wan['timestamp']):
+                time_first = int(wan['timestamp'][0])
+                if time_first_new_e is None or time_first < time_first_new_e:
+                    time_first_new_e = time_first
+
+        if time_first_new_e is None:
+            return time_end_e - time_last_e > 2 * self.time_step_e
+        return time_first_new_e - time_last_e > self.time_step_e
+
+    def update(self, edge, wan_new):
+        '''
+        Merge the given newly polled samples of the links of an Edge
+        into the cache, with the new samples taking precedence over
+        the cached ones of the same timestamp
+        '''
+        cached = self.samples.setdefault(edge, {})
+        for wan in wan_new:
+            if wan in cached:
+                cached[wan] = self._merge(cached[wan], wan_new[wan])
+            else:
+                cached[wan] = self._sort(wan_new[wan])
+
+    def replace(self, edge, wan_new):
+        '''
+        Replace the cached samples of an Edge with those given
+        '''
+        self.samples[edge] = {}
+        self.update(edge, wan_new)
+
+    def expire(self, time_start_e, edges = None):
+        '''
+        Drop the samples older than the given timestamp, the links
+        left with no sample, and the Edges not in the given list
+        '''
+        for edge in list(self.samples):
+            if edges is not None and edge not in edges:
+                del self.samples[edge]
+                continue
+            for wan in list(self.samples[edge]):
+                columns = self.samples[edge][wan]
+                keep = columns['timestamp'] >= time_start_e
+                if not keep.any():
+                    del self.samples[edge][wan]
+                elif not keep.all():
+                    self.samples[edge][wan] = {
+                        column: columns[column][keep] for column in columns }
+            if not self.samples[edge]:
+                del self.samples[edge]
+
+    def get(self, edge):
+        '''
+        Return the cached samples of the links of the given Edge
+        '''
+        return self.samples.get(edge, {})
+
+    def _sort(self, columns):
+        '''
+        Return the given columns ordered by the timestamp, keeping
+        only the last sample of a duplicated timestamp
+        '''
+        import numpy as np
+        timestamp = columns['timestamp']
+        # Reverse so that np.unique keeps the last occurrence
+        _, index = np.unique(timestamp[::-1], return_index=True)
+        index = len(timestamp) - 1 - index
+        return { column: columns[column][index] for column in columns }
+
+    def _merge(self, columns_cached, columns_new):
+        '''
+        Return the union of the cached and the new columns, with the
+        samples of any column absent from either side left as NaN
+        '''
+        import numpy as np
+        size_cached = len(columns_cached['timestamp'])
+        size_new = len(columns_new['timestamp'])
+        merged = {}
+        for column in list(columns_cached) + [column for column in
+        columns_new if column not in columns_cached]:
+            merged[column] = np.concatenate([
+                columns_cached[column] if column in columns_cached
+                    else np.full(size_cached, np.nan),
+                columns_new[column] if column in columns_new
+                    else np.full(size_new, np.nan)])
+        return self._sort(merged)
+
+class vco_api_topology_cache():
+    '''
+    The enterprise identity, the Edges and the WAN names resolved
+    at startup, saved to disk as JSON and reused until they are
+    older than a given time to live
+    '''
+
+    def __init__(self, file_name, identity, ttl_sec):
+        '''
+        Initiate the cache for the given identity, which ties the
+        cache to the VCO and the credentials it was resolved with
+        '''
+        self.file_name = file_name
+        self.identity = identity
+        self.ttl_sec = ttl_sec
+
+    def load(self):
+        '''
+        Return the cached topology, or None should the file be absent
+        or unreadable, expired, or saved for another identity
+        '''
+        try:
+            with open(self.file_name) as f:
+                cache = json.load(f)
+            if cache['identity'] != self.identity \
+            or time.time() - cache['time_saved'] > self.ttl_sec:
+                return None
+            return cache['topology']
+        except (OSError, KeyError, TypeError, ValueError):
+            return None
+
+    def save(self, topology):
+        '''
+        Save the given topology to disk with the time now
+        '''
+        with open_atomic(self.file_name) as f:
+            json.dump({ 'identity': self.identity,
+                        'time_saved': time.time(),
+                        'topology': topology }, f)
@@ -1,96 +1,484 @@
-import requests
-import json
-import re
-
-class vco_api_client():
-    def __init__(self, hostname, verify_ssl=True):
-        '''
-        Initiate the Session object, the HTTP headers,
-        the paths and all the associated parameters.
-        '''
-        self.session = requests.Session()
-        self.hostname = self._hostname_https(hostname)
-        self.headers = { 'Content-Type': 'application/json' }
-        self.verify_ssl = verify_ssl
-        self.seq = 0
-
-    def _hostname_https(self, hostname):
-        '''
-        Change the scheme to HTTPS if it is not already by
-        regular expression operation for a secure connection
-        '''
-        if hostname.startswith('http'):
-            re.sub('http(s)?://', '', hostname)
-        https = 'https://'
-
-        return https + hostname
-
-    def token_auth(self, token):
-        '''
-        Update the HTTP headers with the given API token
-        '''
-        self.headers.update( { 'Authorization': 'Token ' + token })
-
-    def cookies_auth(self, username, password, is_operator=False):
-        '''
-        Authenticate with the given username and password, and
-        store the cookies in the Session object authentication on success.
-        '''
-        self.seq += 1
-
-        if is_operator:
-            url = self.hostname + '/login/operatorLogin'
-        else:
-            url = self.hostname + '/login/enterpriseLogin'
-
-        payload = { 'username': username, 'password': password }
-
-        call = self.session.post(url, headers=self.headers,
-            data=json.dumps(payload), allow_redirects=False,
-            verify=self.verify_ssl)
-
-        try:
-            self.session.cookies.get_dict()['velocloud.session']
-        except KeyError:
-            # Raise a system exit on error authenticating
-            try:
-                message = str.replace(self.session.cookies.get_dict(
-                    )['velocloud.message'], '%20', ' ')
-            except KeyError:
-                message = 'Error authenticating'
-            finally:
-                raise SystemExit(message)
-
-    def call_api(self, path, parameters):
-        '''
-        Call the given path with the given parameters
-        '''
-        self.seq += 1
-        path = path.strip('/')
-        payload = { 'jsonrpc': '2.0',
-                    'id': self.seq,
-                    'method': path,
-                    'params': parameters }
-
-        if path in ('liveMode/readLiveData',
-        'liveMode/requestLiveActions', 'liveMode/clientExitLiveMode'):
-            # Use the livepull path instead should the call require live mode
-            url = self.hostname + '/livepull/liveData/'
-        else:
-            # Otherwise use the portal path
-            url = self.hostname + '/portal/'
-
-        call = self.session.post(url, headers=self.headers,
-            data=json.dumps(payload), verify=self.verify_ssl)
-
-        response = call.json()
-
-        if 'error' in response:
-            # Raise a system exit on call error
-            raise SystemExit(response['error']['message'])
-
-        if response:
-            return response['result']
-        else:
-            # Raise a system exit on empty response
-            raise SystemExit('Call returns empty')
+import requests
+import json
+import re
+import gzip
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from os import chmod
+from vco_api_file import open_atomic
+
+class vco_api_error(Exception):
+    '''
+    Base class of all the errors raised by the VCO client
+    '''
+
+class vco_api_auth_error(vco_api_error):
+    '''
+    Raised on error authenticating with the VCO
+    '''
+
+class vco_api_http_error(vco_api_error):
+    '''
+    Raised on a connection error, a timeout, or an HTTP status
+    or a response body that is not a JSON-RPC response, after
+    all the retries are exhausted
+    '''
+    def __init__(self, message, status = None):
+        super().__init__(message)
+        self.status = status
+
+class vco_api_call_error(vco_api_error):
+    '''
+    Raised on a JSON-RPC error or an empty result returned by the VCO
+    '''
+    def __init__(self, message, code = None):
+        super().__init__(message)
+        self.code = code
+
+class vco_api_rate_limiter():
+    def __init__(self, calls_per_sec):
+        '''
+        Space the calls evenly so that no more than the given
+        number of calls per second are made across all threads
+        '''
+        self.interval = 1 / calls_per_sec
+        self.time_next = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Block until the next call is allowed
+        '''
+        with self.lock:
+            time_now = time.monotonic()
+            wait = self.time_next - time_now
+            self.time_next = max(self.time_next, time_now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+class vco_api_shared_rate_limiter(vco_api_rate_limiter):
+    def __init__(self, calls_per_sec):
+        '''
+        Space the calls evenly so that no more than the given
+        number of calls per second are made across all threads of
+        all the processes the limiter is passed on to on creation
+        '''
+        import multiprocessing
+        self.interval = 1 / calls_per_sec
+        self.time_next = multiprocessing.Value('d', time.monotonic())
+
+    def acquire(self):
+        '''
+        Block until the next call is allowed
+        '''
+        with self.time_next.get_lock():
+            time_now = time.monotonic()
+            wait = self.time_next.value - time_now
+            self.time_next.value = max(self.time_next.value,
+                                       time_now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+class vco_api_client():
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    '''
+    HTTP status codes of transient errors to retry on
+    '''
+
+    RETRY_AFTER_MAX_SECS = 60
+    '''
+    60 seconds at most to wait as requested by a Retry-After header
+    '''
+
+    def __init__(self, hostname, verify_ssl=True, calls_per_sec=None,
+    pool_size=10, timeout=(5, 60), max_retries=3, backoff_factor=0.5,
+    compress=False, batch_size=50):
+        '''
+        Initiate the Session object, the HTTP headers,
+        the paths and all the associated parameters.
+        The client may be shared by multiple threads, optionally
+        with a limit on the number of calls per second, with a
+        connection pool of pool_size connections, and a connect and
+        read timeout in seconds. Transient errors are retried up to
+        max_retries times with an exponential backoff of
+        backoff_factor seconds doubled on each retry, unless the VCO
+        asks for otherwise with a Retry-After header. A limit on the
+        number of calls per second shared with other clients may be
+        set as rate_limiter_global after creation, and so may a
+        vco_api_telemetry as telemetry to record the latency, the
+        bytes and the retries of each method. With compress
+        the request payloads are sent gzip compressed. Batch calls
+        are sent in JSON-RPC batches of up to batch_size calls.
+        '''
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.hostname = self._hostname_https(hostname)
+        self.headers = { 'Content-Type': 'application/json',
+                         'Accept-Encoding': 'gzip' }
+        self.verify_ssl = verify_ssl
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.compress = compress
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.batch_supported = True
+        self.seq = 0
+        self.seq_lock = threading.Lock()
+        self.auth_lock = threading.Lock()
+        self.credentials = None
+        self.rate_limiter = vco_api_rate_limiter(calls_per_sec) \
+            if calls_per_sec else None
+        self.rate_limiter_global = None
+        self.telemetry = None
+
+    def _next_seq(self):
+        '''
+        Increment and return the JSON-RPC id in a thread-safe manner
+        '''
+        with self.seq_lock:
+            self.seq += 1
+            return self.seq
+
+    def _hostname_https(self, hostname):
+        '''
+        Change the scheme to HTTPS if it is not already by
+        regular expression operation for a secure connection
+        '''
+        if hostname.startswith('http'):
+            hostname = re.sub('http(s)?://', '', hostname)
+        https = 'https://'
+
+        return https + hostname.rstrip('/')
+
+    def token_auth(self, token):
+        '''
+        Update the HTTP headers with the given API token
+        '''
+        self.headers.update( { 'Authorization': 'Token ' + token })
+
+    def cookies_auth(self, username, password, is_operator=False,
+    session_file=None):
+        '''
+        Authenticate with the given username and password, and
+        store the cookies in the Session object authentication on success.
+        Should a session file be given, the velocloud.session cookie
+        is saved to it, and read from it instead of authenticating
+        again should it be there from a previous run. An expired
+        session is renewed by authenticating again on the first call
+        that is refused.
+        '''
+        self.credentials = (username, password, is_operator, session_file)
+        if session_file and self._load_session(session_file):
+            return
+        self._login()
+
+    def _login(self):
+        '''
+        Authenticate with the stored credentials
+        '''
+        username, password, is_operator, session_file = self.credentials
+        self._next_seq()
+
+        if is_operator:
+            url = self.hostname + '/login/operatorLogin'
+        else:
+            url = self.hostname + '/login/enterpriseLogin'
+
+        payload = { 'username': username, 'password': password }
+
+        try:
+            self.session.post(url, headers=self.headers,
+                data=json.dumps(payload), allow_redirects=False,
+                verify=self.verify_ssl, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise vco_api_auth_error('Error authenticating: %s' % e)
+
+        try:
+            self.session.cookies.get_dict()['velocloud.session']
+        except KeyError:
+            # Raise an authentication error on error authenticating
+            try:
+                message = str.replace(self.session.cookies.get_dict(
+                    )['velocloud.message'], '%20', ' ')
+            except KeyError:
+                message = 'Error authenticating'
+            raise vco_api_auth_error(message)
+
+        if session_file:
+            self._save_session(session_file)
+
+    def _session_key(self):
+        '''
+        Return the VCO and the user a saved session belongs to
+        '''
+        username, _, is_operator, _ = self.credentials
+        return [self.hostname, username, is_operator]
+
+    def _load_session(self, session_file):
+        '''
+        Read the velocloud.session cookie from the given file into
+        the Session object and return True should it be there for
+        the same VCO and user
+        '''
+        try:
+            with open(session_file) as f:
+                session = json.load(f)
+            if session['key'] != self._session_key():
+                return False
+            self.session.cookies.set('velocloud.session',
+                session['cookie'])
+            return True
+        except (OSError, KeyError, TypeError, ValueError):
+            return False
+
+    def _save_session(self, session_file):
+        '''
+        Write the velocloud.session cookie to the given file readable
+        and writable by the owner only
+        '''
+        with open_atomic(session_file) as f:
+            chmod(f.name, 0o600)
+            json.dump({ 'key': self._session_key(), 'cookie':
+                self.session.cookies.get_dict()['velocloud.session'] }, f)
+
+    def _retry_wait(self, retry, call = None):
+        '''
+        Return the seconds to wait before the given retry, as asked
+        for by the Retry-After header of the call if any, in either
+        seconds or an HTTP date, or otherwise by exponential backoff
+        with jitter
+        '''
+        if call is not None and 'Retry-After' in call.headers:
+            retry_after = call.headers['Retry-After']
+            try:
+                wait = float(retry_after)
+            except ValueError:
+                try:
+                    wait = parsedate_to_datetime(retry_after).timestamp() \
+                            - time.time()
+                except (TypeError, ValueError):
+                    wait = None
+            if wait is not None:
+                return min(max(wait, 0), self.RETRY_AFTER_MAX_SECS)
+        return self.backoff_factor * 2 ** retry * random.uniform(0.5, 1)
+
+    def _post(self, url, payload):
+        '''
+        Post the given payload to the given URL and return the
+        decoded JSON response, retrying on connection errors, timeouts
+        and transient HTTP errors, and authenticating again once
+        should a session cookie be refused
+        '''
+        data = json.dumps(payload).encode()
+        headers = self.headers
+        if self.compress:
+            data = gzip.compress(data)
+            headers = dict(headers, **{ 'Content-Encoding': 'gzip' })
+        method = 'batch' if isinstance(payload, list) \
+                    else payload['method']
+
+        reauthenticated = False
+        retry = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            if self.rate_limiter_global:
+                self.rate_limiter_global.acquire()
+
+            time_start = time.monotonic()
+            try:
+                call = self.session.post(url, headers=headers, data=data,
+                    verify=self.verify_ssl, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.telemetry:
+                    self.telemetry.inc('vco_api_retries_total',
+                        method=method, reason=type(e).__name__)
+                if retry >= self.max_retries:
+                    raise vco_api_http_error(str(e))
+                time.sleep(self._retry_wait(retry))
+                retry += 1
+                continue
+            except requests.RequestException as e:
+                raise vco_api_http_error(str(e))
+
+            if self.telemetry:
+                self.telemetry.observe('vco_api_request_seconds',
+                    time.monotonic() - time_start, method=method)
+                self.telemetry.inc('vco_api_requests_total',
+                    method=method, status=call.status_code)
+                self.telemetry.inc('vco_api_sent_bytes_total', len(data),
+                    method=method)
+                # The length of the body on the wire i.e. compressed if any
+                self.telemetry.inc('vco_api_received_bytes_total',
+                    int(call.headers.get('Content-Length',
+                        len(call.content))), method=method)
+
+            if call.status_code in (401, 403) and self.credentials \
+            and not reauthenticated:
+                with self.auth_lock:
+                    self._login()
+                reauthenticated = True
+                continue
+
+            if call.status_code in self.RETRY_STATUS:
+                if self.telemetry:
+                    self.telemetry.inc('vco_api_retries_total',
+                        method=method, reason=call.status_code)
+                if retry >= self.max_retries:
+                    raise vco_api_http_error('HTTP %s from %s' % (
+                        call.status_code, url), call.status_code)
+                time.sleep(self._retry_wait(retry, call))
+                retry += 1
+                continue
+
+            try:
+                return call.json()
+            except ValueError:
+                raise vco_api_http_error('HTTP %s from %s is not JSON' % (
+                    call.status_code, url), call.status_code)
+
+    def call_api(self, path, parameters):
+        '''
+        Call the given path with the given parameters
+        '''
+        seq = self._next_seq()
+        path = path.strip('/')
+        payload = { 'jsonrpc': '2.0',
+                    'id': seq,
+                    'method': path,
+                    'params': parameters }
+
+        if path in ('liveMode/readLiveData',
+        'liveMode/requestLiveActions', 'liveMode/clientExitLiveMode'):
+            # Use the livepull path instead should the call require live mode
+            url = self.hostname + '/livepull/liveData/'
+        else:
+            # Otherwise use the portal path
+            url = self.hostname + '/portal/'
+
+        response = self._post(url, payload)
+
+        return self._get_result(response)
+
+    def _get_result(self, response):
+        '''
+        Return the result of the given JSON-RPC response
+        '''
+        if 'error' in response:
+            # Raise a call error on call error
+            raise vco_api_call_error(response['error'].get('message'),
+                response['error'].get('code'))
+
+        if response:
+            return response['result']
+        else:
+            # Raise a call error on empty response
+            raise vco_api_call_error('Call returns empty')
+
+    def _call_api_or_error(self, path, parameters):
+        '''
+        Call the given path with the given parameters and return
+        the result, or the error should the call fail
+        '''
+        try:
+            return self.call_api(path, parameters)
+        except vco_api_error as e:
+            return e
+
+    def _call_batch(self, calls):
+        '''
+        Send the given calls as one JSON-RPC batch and return the
+        results, or the errors, in the order of the calls by matching
+        the responses to the calls by their id. Return None should
+        the VCO not support batching.
+        '''
+        payload = []
+        for path, parameters in calls:
+            payload.append({ 'jsonrpc': '2.0',
+                             'id': self._next_seq(),
+                             'method': path.strip('/'),
+                             'params': parameters })
+
+        response = self._post(self.hostname + '/portal/', payload)
+        if not isinstance(response, list):
+            # The VCO answers a batch it does not support with one error
+            return None
+
+        response_id = {}
+        for each in response:
+            try:
+                response_id[each['id']] = each
+            except (KeyError, TypeError):
+                pass
+
+        results = []
+        for each in payload:
+            try:
+                results.append(self._get_result(response_id[each['id']]))
+            except KeyError:
+                results.append(vco_api_call_error(
+                    'No response to call %s' % each['id']))
+            except vco_api_error as e:
+                results.append(e)
+        return results
+
+    def _call_batch_or_error(self, calls):
+        '''
+        Send the given calls as one JSON-RPC batch and return the
+        results as with _call_batch, or the error should the batch
+        fail as a whole
+        '''
+        try:
+            return self._call_batch(calls)
+        except vco_api_error as e:
+            return e
+
+    def call_api_batch(self, calls):
+        '''
+        Call each of the given (path, parameters) pairs and return
+        their results in the same order, with the error in place of
+        the result of each call that fails rather than raising it.
+        The calls are sent as JSON-RPC batches of up to batch_size
+        calls, with up to pool_size batches in flight at once.
+        Should the VCO not support batching, the calls are sent one
+        by one concurrently instead, as they are from then on. Should
+        a batch fail as a whole, the calls of that batch only are sent
+        one by one for this time only, and the results of the batches
+        that succeeded are kept.
+        '''
+        calls = list(calls)
+        if not calls:
+            return []
+
+        results = [None] * len(calls)
+        single = list(range(len(calls)))
+        if self.batch_supported and self.batch_size > 1:
+            chunks = range(0, len(calls), self.batch_size)
+            with ThreadPoolExecutor(max_workers=min(self.pool_size,
+            len(chunks))) as executor:
+                chunk_results = list(executor.map(self._call_batch_or_error,
+                    [calls[i:i + self.batch_size] for i in chunks]))
+            if any(result is None for result in chunk_results):
+                self.batch_supported = False
+
+            single = []
+            for i, result in zip(chunks, chunk_results):
+                size = min(self.batch_size, len(calls) - i)
+                if isinstance(result, list):
+                    results[i:i + size] = result
+                else:
+                    single.extend(range(i, i + size))
+
+        if single:
+            with ThreadPoolExecutor(max_workers=min(self.pool_size,
+            len(single))) as executor:
+                for i, result in zip(single, executor.map(
+                lambda i: self._call_api_or_error(*calls[i]), single)):
+                    results[i] = result
+        return results
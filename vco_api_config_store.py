@@ -0,0 +1,183 @@
+import gzip
+import hashlib
+import json
+import time
+from os import listdir, makedirs
+from os.path import exists
+from vco_api_file import open_atomic
+
+def canonical_json(config):
+    '''
+    Return the canonical JSON of a config, with the keys sorted and
+    no whitespace, so that equal configs hash to the same
+    '''
+    return json.dumps(config, sort_keys=True, separators=(',', ':'))
+
+def diff_config(config_a, config_b, path = ''):
+    '''
+    Return the structural differences between two configs as a list
+    of (path, value in a, value in b) with None for a value that is
+    absent. Lists of objects that all have a unique id, or otherwise
+    a unique name, are matched by it rather than by position, so that
+    a reordered config stack is not reported as changed throughout.
+    '''
+    if isinstance(config_a, dict) and isinstance(config_b, dict):
+        diff = []
+        for key in list(config_a) + [key for key in config_b
+        if key not in config_a]:
+            diff += diff_config(config_a.get(key), config_b.get(key),
+                                '%s/%s' % (path, key))
+        return diff
+
+    if isinstance(config_a, list) and isinstance(config_b, list):
+        for key in ('id', 'name'):
+            keyed_a = _key_list(config_a, key)
+            keyed_b = _key_list(config_b, key)
+            if keyed_a is not None and keyed_b is not None:
+                return diff_config(keyed_a, keyed_b, path)
+        diff = []
+        for i in range(max(len(config_a), len(config_b))):
+            diff += diff_config(config_a[i] if i < len(config_a) else None,
+                                config_b[i] if i < len(config_b) else None,
+                                '%s/%s' % (path, i))
+        return diff
+
+    if config_a == config_b:
+        return []
+    return [(path or '/', config_a, config_b)]
+
+def _key_list(items, key):
+    '''
+    Return the given list of objects as a dict by the given key, or
+    None should any of them not have a unique value of it
+    '''
+    keyed = {}
+    for item in items:
+        if not isinstance(item, dict) or key not in item \
+        or str(item[key]) in keyed:
+            return None
+        keyed[str(item[key])] = item
+    return keyed
+
+class vco_api_config_store():
+    '''
+    A content-addressed store of Edge config stacks. Each config is
+    canonicalised and hashed with SHA-256, and each unique config is
+    stored once as a gzip compressed object named by its hash. Each
+    snapshot is a small manifest of the Edge names and the hashes of
+    their configs, so that disk use grows with the rate the configs
+    change rather than the rate they are polled, and the Edges that
+    changed between two snapshots are found from the manifests alone.
+    .
+    └── configs/
+        ├── objects/
+        │   └── ab/
+        │       └── abcdef....json.gz
+        ├── manifests/
+        │   └── YYYY-MM-DD-HH-MM-SS.json
+        └── diffs/
+            └── YYYY-MM-DD-HH-MM-SS/
+                └── edgeName.json
+    '''
+
+    def __init__(self, directory):
+        '''
+        Open the store in the given directory, creating it should it
+        not exist
+        '''
+        self.directory = directory.rstrip('/') + '/'
+        for each in ('objects', 'manifests', 'diffs'):
+            makedirs(self.directory + each, exist_ok=True)
+
+    def _object_file(self, config_hash):
+        '''
+        Return the file name of the object of the given hash
+        '''
+        return '%sobjects/%s/%s.json.gz' % (self.directory,
+                                           config_hash[:2], config_hash)
+
+    def put(self, config):
+        '''
+        Store the given config should it not be stored already, and
+        return its hash. Safe to call from concurrent threads.
+        '''
+        data = canonical_json(config).encode()
+        config_hash = hashlib.sha256(data).hexdigest()
+        file_name = self._object_file(config_hash)
+        if not exists(file_name):
+            makedirs(file_name.rsplit('/', 1)[0], exist_ok=True)
+            with open_atomic(file_name, 'wb', gzip.open) as f:
+                f.write(data)
+        return config_hash
+
+    def get(self, config_hash):
+        '''
+        Return the config of the given hash
+        '''
+        with gzip.open(self._object_file(config_hash), 'rb') as f:
+            return json.loads(f.read())
+
+    def list_snapshots(self):
+        '''
+        Return the names of all the snapshots from the oldest
+        '''
+        return sorted(each[:-len('.json')] for each in
+                      listdir(self.directory + 'manifests')
+                      if each.endswith('.json'))
+
+    def save_manifest(self, edges, snapshot = None):
+        '''
+        Record a snapshot of the given Edge names and config hashes,
+        named by the time now in UTC unless a name is given, and
+        return its name
+        '''
+        if snapshot is None:
+            snapshot = time.strftime('%Y-%m-%d-%H-%M-%S', time.gmtime())
+        file_name = '%smanifests/%s.json' % (self.directory, snapshot)
+        with open_atomic(file_name) as f:
+            json.dump({ 'snapshot': snapshot, 'edges': edges }, f,
+                      sort_keys=True)
+        return snapshot
+
+    def load_manifest(self, snapshot):
+        '''
+        Return the Edge names and config hashes of a snapshot
+        '''
+        with open('%smanifests/%s.json' % (self.directory, snapshot)) as f:
+            return json.load(f)['edges']
+
+    def changes(self, snapshot_a, snapshot_b):
+        '''
+        Return the Edges added, removed and changed from snapshot a
+        to snapshot b by comparing their manifests only
+        '''
+        edges_a = self.load_manifest(snapshot_a)
+        edges_b = self.load_manifest(snapshot_b)
+        return {
+            'added': sorted(set(edges_b) - set(edges_a)),
+            'removed': sorted(set(edges_a) - set(edges_b)),
+            'changed': sorted(edge for edge in edges_a
+                              if edge in edges_b
+                              and edges_a[edge] != edges_b[edge]) }
+
+    def diff(self, snapshot_a, snapshot_b, edge):
+        '''
+        Return the structural differences of the config of an Edge
+        from snapshot a to snapshot b
+        '''
+        edges_a = self.load_manifest(snapshot_a)
+        edges_b = self.load_manifest(snapshot_b)
+        config_a = self.get(edges_a[edge]) if edge in edges_a else None
+        config_b = self.get(edges_b[edge]) if edge in edges_b else None
+        return diff_config(config_a, config_b)
+
+    def save_diff(self, snapshot, edge, diff):
+        '''
+        Write the structural differences of the config of an Edge
+        in a snapshot from the one before as a JSON file
+        '''
+        directory = '%sdiffs/%s/' % (self.directory, snapshot)
+        makedirs(directory, exist_ok=True)
+        with open(directory + edge + '.json', 'w') as f:
+            json.dump([{ 'path': path, 'before': before, 'after': after }
+                       for path, before, after in diff], f)
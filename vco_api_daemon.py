@@ -0,0 +1,124 @@
+import logging
+import math
+import signal
+import threading
+import time
+from vco_api_telemetry import profile
+
+logger = logging.getLogger(__name__)
+
+class vco_api_daemon():
+    INTERVAL_SECS = 300
+    '''
+    300 seconds i.e. 5 minutes interval as default between
+    two detection cycles
+    '''
+
+    INTERVAL_SECS_TOPOLOGY = 3600
+    '''
+    3600 seconds i.e. 60 minutes interval as default between
+    two refreshes of the enterprise and Edge topology
+    '''
+
+    def __init__(self, conn, interval_sec = None,
+    interval_sec_topology = None, profile_file = None):
+        '''
+        Keep the given VCO object, and with it the authenticated
+        client Session, warm in one long-running process and
+        schedule the detection cycles on a monotonic clock, and
+        profile the first cycle to profile_file should it be given
+        '''
+        self.conn = conn
+        self.interval_sec = self.INTERVAL_SECS \
+            if interval_sec is None else interval_sec
+        self.interval_sec_topology = self.INTERVAL_SECS_TOPOLOGY \
+            if interval_sec_topology is None else interval_sec_topology
+        self.cycles_run = 0
+        self.cycles_skipped = 0
+        self.profile_file = profile_file
+        self._stop = threading.Event()
+
+    def stop(self, signum = None, frame = None):
+        '''
+        Request the daemon to stop once the cycle in progress, if
+        any, has completed. Doubles as the signal handler.
+        '''
+        if signum is not None:
+            logger.info('Received signal %s, shutting down', signum)
+        self._stop.set()
+
+    def install_signal_handlers(self):
+        '''
+        Stop cleanly on SIGTERM e.g. from docker stop, and on SIGINT
+        '''
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+    def _refresh_topology(self):
+        '''
+        Refresh the enterprise and Edge topology from the VCO and
+        keep the previous one should the refresh fail
+        '''
+        try:
+            self.conn.refresh_topology(force = True)
+        except (Exception, SystemExit) as e:
+            logger.error('Topology refresh failed, keeping the '
+                'previous topology: %s', e)
+
+    def _run_cycle(self, cycle, **kwargs):
+        '''
+        Run one cycle with the time now updated and make sure
+        that an error in one cycle does not end the daemon
+        '''
+        time_start = time.monotonic()
+        try:
+            self.conn.refresh_time()
+            if self.profile_file and not self.cycles_run:
+                with profile(self.profile_file):
+                    cycle(**kwargs)
+            else:
+                cycle(**kwargs)
+        except (Exception, SystemExit) as e:
+            logger.error('Cycle failed: %s', e)
+        self.cycles_run += 1
+        logger.info('Cycle completed in %.3f second(s)',
+            time.monotonic() - time_start)
+
+    def _next_deadline(self, deadline):
+        '''
+        Return the deadline of the next cycle on the fixed schedule,
+        skipping the ticks that a cycle overrunning its interval
+        has missed rather than running them back to back
+        '''
+        deadline += self.interval_sec
+        now = time.monotonic()
+        if now > deadline:
+            skipped = math.ceil((now - deadline) / self.interval_sec)
+            deadline += skipped * self.interval_sec
+            self.cycles_skipped += skipped
+            logger.warning('Cycle overran its interval of %s second(s), '
+                'skipping %s cycle(s)', self.interval_sec, skipped)
+        return deadline
+
+    def run(self, cycle = None, **kwargs):
+        '''
+        Run the given cycle, or detect_wan_anomaly by default, with
+        the given arguments once every interval_sec until stopped,
+        and refresh the topology once every interval_sec_topology
+        '''
+        if cycle is None:
+            cycle = self.conn.detect_wan_anomaly
+
+        deadline = time.monotonic()
+        deadline_topology = deadline + self.interval_sec_topology
+        while not self._stop.is_set():
+            if time.monotonic() >= deadline_topology:
+                self._refresh_topology()
+                deadline_topology += self.interval_sec_topology
+
+            self._run_cycle(cycle, **kwargs)
+
+            deadline = self._next_deadline(deadline)
+            self._stop.wait(max(0, deadline - time.monotonic()))
+        logger.info('Stopped after %s cycle(s) with %s skipped',
+            self.cycles_run, self.cycles_skipped)
@@ -0,0 +1,559 @@
+import json
+import numpy as np
+from collections import namedtuple
+from os import makedirs
+from vco_api_file import open_atomic
+
+wan_anomaly = namedtuple('wan_anomaly', ['edge', 'wan', 'quality',
+    'present_mean', 'hist_mean', 'hist_std', 'std_factor'])
+'''
+A WAN quality of a WAN of an Edge whose mean in the present interval
+is found to be more than std_factor standard deviations above the
+mean of the historical baseline
+'''
+
+class vco_api_anomaly_engine():
+    '''
+    Detect WAN anomaly for all the Edges, WANs and WAN qualities at
+    once. The samples are laid out in a single columnar structure
+    of values, group keys for each (Edge, WAN, WAN quality) and a
+    present or historical flag, and the means, the standard
+    deviations and the threshold test of every group are computed
+    in one grouped NumPy pass.
+    '''
+
+    def __init__(self, std_factor = 2):
+        '''
+        Initiate an empty engine with the number of standard deviations
+        above the historical mean for a present mean to be an anomaly
+        '''
+        self.std_factor = std_factor
+        self.keys = []
+        self.key_index = {}
+        self.values = []
+        self.groups = []
+        self.present = []
+
+    def _add(self, edge, wan, columns, is_present):
+        '''
+        Add the given columns of WAN quality samples of a WAN of an
+        Edge. Groups are created in the order the present samples
+        are added, and historical samples of a group with no present
+        samples are of no use and are hence left out.
+        '''
+        for quality in columns:
+            if quality == 'timestamp':
+                continue
+            key = (edge, wan, quality)
+            try:
+                group = self.key_index[key]
+            except KeyError:
+                if not is_present:
+                    continue
+                group = self.key_index[key] = len(self.keys)
+                self.keys.append(key)
+            values = np.asarray(columns[quality], dtype='float64')
+            self.values.append(values)
+            self.groups.append(np.full(len(values), group, dtype='int64'))
+            self.present.append(np.full(len(values), is_present))
+
+    def add_present(self, edge, wan, columns):
+        '''
+        Add the given columns of WAN quality samples of the present
+        interval of a WAN of an Edge
+        '''
+        self._add(edge, wan, columns, True)
+
+    def add_hist(self, edge, wan, columns):
+        '''
+        Add the given columns of WAN quality samples of the historical
+        baseline of a WAN of an Edge
+        '''
+        self._add(edge, wan, columns, False)
+
+    def add(self, wan_quality_present, wan_quality_hist):
+        '''
+        Add the present and historical WAN quality samples of all the
+        Edges given as dictionaries of Edge, WAN and columns
+        '''
+        for edge in wan_quality_present:
+            for wan in wan_quality_present[edge]:
+                self.add_present(edge, wan, wan_quality_present[edge][wan])
+        for edge in wan_quality_hist:
+            for wan in wan_quality_hist[edge]:
+                self.add_hist(edge, wan, wan_quality_hist[edge][wan])
+
+    def _group_mean_std(self, values, groups, size):
+        '''
+        Return the means and the sample standard deviations of the
+        given values by group, ignoring NaN as pandas does. Groups
+        with no value have a NaN mean and those with fewer than two
+        values a NaN standard deviation.
+        '''
+        valid = ~np.isnan(values)
+        values = values[valid]
+        groups = groups[valid]
+        count = np.bincount(groups, minlength=size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.bincount(groups, weights=values,
+                               minlength=size) / count
+            deviation = values - mean[groups]
+        std = self.get_std(count, np.bincount(groups,
+                weights=deviation * deviation, minlength=size))
+        return mean, std
+
+    @staticmethod
+    def get_std(count, m2, count2 = None):
+        '''
+        Return the sample standard deviations of groups given their
+        counts or weights of samples and their sums of the squared
+        deviations from the mean, with that of a group of fewer than
+        two samples left as NaN. Should the sums of the squared weights
+        be given as well, the samples are of unequal weights, and the
+        standard deviations those of reliability weights, with the
+        effective number of samples the squared sum of the weights
+        over the sum of their squares. The detection of WAN anomaly,
+        online or replayed, finds its standard deviations here alone.
+        '''
+        if count2 is None:
+            count2 = count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.sqrt(np.maximum(m2, 0) / (count - count2 / count))
+            std[~(count * count / count2 >= 2)] = np.nan
+        return std
+
+    @staticmethod
+    def is_anomaly(present_mean, hist_mean, hist_std, std_factor):
+        '''
+        Return whether each present mean is an anomaly, i.e. more than
+        std_factor historical standard deviations above the historical
+        mean. The detection of WAN anomaly, online or replayed, applies
+        its threshold here alone.
+        '''
+        # A comparison with NaN is False hence no anomaly without a baseline
+        with np.errstate(invalid='ignore'):
+            return present_mean > hist_mean + hist_std * std_factor
+
+    def compute(self):
+        '''
+        Return the group keys, the present means, the historical means
+        and the historical standard deviations of all the groups, and
+        whether each is an anomaly, as arrays aligned by group
+        '''
+        size = len(self.keys)
+        if not size:
+            empty = np.empty(0)
+            return [], empty, empty, empty, np.empty(0, dtype=bool)
+
+        values = np.concatenate(self.values)
+        groups = np.concatenate(self.groups)
+        present = np.concatenate(self.present)
+
+        present_mean, _ = self._group_mean_std(values[present],
+                            groups[present], size)
+        hist_mean, hist_std = self._group_mean_std(values[~present],
+                                groups[~present], size)
+        is_anomaly = self.is_anomaly(present_mean, hist_mean, hist_std,
+                        self.std_factor)
+        return self.keys, present_mean, hist_mean, hist_std, is_anomaly
+
+    def get_deviation_edge(self):
+        '''
+        Return the largest deviation of the present mean from the
+        historical mean of any of the WAN quality of each Edge, in
+        historical standard deviations, by Edge, leaving out the
+        groups with no baseline
+        '''
+        keys, present_mean, hist_mean, hist_std, _ = self.compute()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            deviation = (present_mean - hist_mean) / hist_std
+        deviation_edge = {}
+        for key, value in zip(keys, deviation.tolist()):
+            if value == value \
+            and value > deviation_edge.get(key[0], float('-inf')):
+                deviation_edge[key[0]] = value
+        return deviation_edge
+
+    def detect(self):
+        '''
+        Return the anomalies found as a list of wan_anomaly in the
+        order the present samples were added
+        '''
+        keys, present_mean, hist_mean, hist_std, is_anomaly = self.compute()
+        return [wan_anomaly(*keys[i], float(present_mean[i]),
+                    float(hist_mean[i]), float(hist_std[i]), self.std_factor)
+                for i in np.flatnonzero(is_anomaly)]
+
+class vco_api_online_detector():
+    '''
+    Detect WAN anomaly against a running baseline of each WAN quality
+    of each WAN of each Edge, kept as a state of constant size rather
+    than recomputed from the raw samples on every run. Each (Edge,
+    WAN, WAN quality) holds the weight, the sum of the squared weights,
+    the mean and the sum of the squared deviations of the samples
+    folded in so far, merged batch by batch with the parallel form of
+    Welford's algorithm, along with the timestamp of the latest sample
+    folded in so that a sample is never folded in twice. Should a
+    half-life be given, the weight of a sample halves with every
+    half-life of age for an exponentially weighted mean and variance,
+    and otherwise all the samples are of equal weight. The state is
+    held in NumPy arrays of BUCKETS cells per key and saved to disk as
+    a NumPy archive between runs.
+    '''
+
+    BUCKETS = 1
+    '''
+    1 cell of state per key i.e. a single baseline of all the samples
+    '''
+
+    def __init__(self, file_name, ent_id, std_factor = 2,
+    half_life_sec = None):
+        '''
+        Initiate an empty state for the given enterpriseId with the
+        number of standard deviations above the baseline mean for a
+        present mean to be an anomaly, and the half-life in seconds
+        of the weight of a sample, if any
+        '''
+        self.file_name = file_name
+        self.ent_id = ent_id
+        self.std_factor = std_factor
+        self.half_life_sec = half_life_sec or None
+        self._reset()
+
+    def _reset(self):
+        '''
+        Empty the state
+        '''
+        self.keys = []
+        self.key_index = {}
+        self.weight = np.zeros(0)
+        self.w2 = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.time_last = np.zeros(0, dtype='int64')
+        self.time_last_key = np.zeros(0, dtype='int64')
+
+    def _get_meta(self):
+        '''
+        Return the metadata saved along with the state
+        '''
+        return { 'ent_id': self.ent_id,
+                 'half_life_sec': self.half_life_sec,
+                 'keys': self.keys,
+                 'time_last_key': self.time_last_key.tolist() }
+
+    def _set_keys(self, meta):
+        '''
+        Set the keys of the given metadata and the timestamp of the
+        latest sample folded in of each, and return False should it
+        have been saved for another enterprise or half-life
+        '''
+        if meta['ent_id'] != self.ent_id \
+        or meta['half_life_sec'] != self.half_life_sec \
+        or len(meta['time_last_key']) != len(meta['keys']):
+            return False
+        self.keys = [tuple(key) for key in meta['keys']]
+        self.key_index = { key: i for i, key in enumerate(self.keys) }
+        self.time_last_key = np.array(meta['time_last_key'], dtype='int64')
+        return True
+
+    def load(self):
+        '''
+        Load the state from disk, leaving it empty should the file be
+        absent or unreadable, e.g. of an older version with an array
+        missing, or should it have been saved for another enterprise or
+        half-life
+        '''
+        self._reset()
+        try:
+            with np.load(self.file_name) as archive:
+                if not self._set_keys(json.loads(str(archive['meta']))):
+                    return self._reset()
+                self.weight = archive['weight']
+                self.w2 = archive['w2']
+                self.mean = archive['mean']
+                self.m2 = archive['m2']
+                self.time_last = archive['time_last']
+        except (OSError, KeyError, ValueError):
+            self._reset()
+
+    def save(self):
+        '''
+        Save the state to disk as a NumPy archive
+        '''
+        with open_atomic(self.file_name, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(self._get_meta())),
+                     weight=self.weight, w2=self.w2, mean=self.mean,
+                     m2=self.m2, time_last=self.time_last)
+
+    def _store(self, weight, w2, mean, m2, time_last):
+        '''
+        Replace the arrays of the state with those given, e.g. once
+        keys are added or dropped
+        '''
+        self.weight = weight
+        self.w2 = w2
+        self.mean = mean
+        self.m2 = m2
+        self.time_last = time_last
+
+    def _cell(self, index, timestamps):
+        '''
+        Return the cells of the state of the given key indices and
+        timestamps in epoch and in milliseconds
+        '''
+        return index
+
+    def get_time_last_e(self):
+        '''
+        Return the timestamp in epoch and in milliseconds of the latest
+        sample folded in of any of the links of each Edge by Edge, from
+        that kept of each key rather than from all its cells
+        '''
+        time_last_e = {}
+        for key, time_last in zip(self.keys, self.time_last_key.tolist()):
+            if time_last > time_last_e.get(key[0], -1):
+                time_last_e[key[0]] = time_last
+        return time_last_e
+
+    def _flatten(self, wan_quality, add_keys):
+        '''
+        Return the key indices, the timestamps and the values of all
+        the samples of the given dictionary of Edge, WAN and columns
+        as flat arrays, leaving out the NaN values and, unless add_keys
+        is True, the keys with no state
+        '''
+        index = []
+        timestamps = []
+        values = []
+        for edge in wan_quality:
+            for wan in wan_quality[edge]:
+                columns = wan_quality[edge][wan]
+                for quality in columns:
+                    if quality == 'timestamp':
+                        continue
+                    key = (edge, wan, quality)
+                    i = self.key_index.get(key)
+                    if i is None:
+                        if not add_keys:
+                            continue
+                        i = self.key_index[key] = len(self.keys)
+                        self.keys.append(key)
+                    index.append(np.full(len(columns[quality]), i,
+                                 dtype='int64'))
+                    timestamps.append(np.asarray(columns['timestamp'],
+                                      dtype='int64'))
+                    values.append(np.asarray(columns[quality],
+                                  dtype='float64'))
+        if not index:
+            return (np.empty(0, dtype='int64'), np.empty(0, dtype='int64'),
+                    np.empty(0))
+        index = np.concatenate(index)
+        timestamps = np.concatenate(timestamps)
+        values = np.concatenate(values)
+        valid = ~np.isnan(values)
+        return index[valid], timestamps[valid], values[valid]
+
+    def update(self, wan_quality):
+        '''
+        Fold the samples of the given dictionary of Edge, WAN and
+        columns newer than the latest sample folded in of each cell
+        into the state, all the cells at once in one grouped NumPy
+        pass that reads and writes only the cells with new samples
+        '''
+        index, timestamps, values = self._flatten(wan_quality, True)
+        grow = len(self.keys) - len(self.time_last_key)
+        if grow:
+            self.time_last_key = np.concatenate([self.time_last_key,
+                                    np.full(grow, -1, dtype='int64')])
+        grow = len(self.keys) * self.BUCKETS - len(self.weight)
+        if grow:
+            self._store(np.concatenate([self.weight, np.zeros(grow)]),
+                        np.concatenate([self.w2, np.zeros(grow)]),
+                        np.concatenate([self.mean, np.zeros(grow)]),
+                        np.concatenate([self.m2, np.zeros(grow)]),
+                        np.concatenate([self.time_last,
+                            np.full(grow, -1, dtype='int64')]))
+
+        cells = self._cell(index, timestamps)
+        new = timestamps > self.time_last[cells]
+        cells, timestamps, values = cells[new], timestamps[new], values[new]
+        if not len(cells):
+            return
+        cells, group = np.unique(cells, return_inverse=True)
+        size = len(cells)
+
+        time_last = self.time_last[cells]
+        time_ref = time_last.copy()
+        np.maximum.at(time_ref, group, timestamps)
+        if self.half_life_sec:
+            '''
+            Weigh each sample by its age at the latest sample of its
+            cell, and decay the state by the time elapsed since
+            '''
+            half_life_e = self.half_life_sec * 1000
+            weights = 0.5 ** ((time_ref[group] - timestamps) / half_life_e)
+            decay = 0.5 ** ((time_ref - time_last) / half_life_e)
+        else:
+            weights = np.ones(len(values))
+            decay = np.ones(size)
+
+        weight_new = np.bincount(group, weights=weights, minlength=size)
+        w2_new = np.bincount(group, weights=weights * weights,
+                             minlength=size)
+        mean_new = np.bincount(group, weights=weights * values,
+                               minlength=size) / weight_new
+        deviation = values - mean_new[group]
+        m2_new = np.bincount(group, weights=weights * deviation * deviation,
+                             minlength=size)
+
+        weight_old = self.weight[cells] * decay
+        weight = weight_old + weight_new
+        mean = self.mean[cells]
+        delta = mean_new - mean
+        self.mean[cells] = mean + delta * weight_new / weight
+        self.m2[cells] = self.m2[cells] * decay + m2_new \
+                         + delta * delta * weight_old * weight_new / weight
+        self.weight[cells] = weight
+        self.w2[cells] = self.w2[cells] * decay * decay + w2_new
+        self.time_last[cells] = time_ref
+        np.maximum.at(self.time_last_key, cells // self.BUCKETS, time_ref)
+
+    def get_mean_std(self, cells):
+        '''
+        Return the baseline means and standard deviations of the given
+        cells, with the standard deviation of a cell of fewer than two
+        effective samples left as NaN
+        '''
+        return self.mean[cells], vco_api_anomaly_engine.get_std(
+                                    self.weight[cells], self.m2[cells],
+                                    self.w2[cells])
+
+    def detect(self, wan_quality_present):
+        '''
+        Return the anomalies found in the given dictionary of Edge, WAN
+        and columns of the present interval against the baseline of the
+        cell of the latest present sample of each key as a list of
+        wan_anomaly, without folding the present samples in
+        '''
+        index, timestamps, values = self._flatten(wan_quality_present, False)
+        if not len(index):
+            return []
+        keys, group = np.unique(index, return_inverse=True)
+        present_mean = np.bincount(group, weights=values) / \
+                       np.bincount(group)
+        time_present = np.zeros(len(keys), dtype='int64')
+        np.maximum.at(time_present, group, timestamps)
+        hist_mean, hist_std = self.get_mean_std(self._cell(keys,
+                                time_present))
+        is_anomaly = vco_api_anomaly_engine.is_anomaly(present_mean,
+                        hist_mean, hist_std, self.std_factor)
+        return [wan_anomaly(*self.keys[keys[i]], float(present_mean[i]),
+                    float(hist_mean[i]), float(hist_std[i]), self.std_factor)
+                for i in np.flatnonzero(is_anomaly)]
+
+    def expire(self, edges):
+        '''
+        Drop the state of the Edges not in the given list
+        '''
+        edges = set(edges)
+        keep = [i for i, key in enumerate(self.keys) if key[0] in edges]
+        if len(keep) == len(self.keys):
+            return
+        self.keys = [self.keys[i] for i in keep]
+        self.key_index = { key: i for i, key in enumerate(self.keys) }
+        self.time_last_key = self.time_last_key[keep]
+        self._store(*[array.reshape(-1, self.BUCKETS)[keep].ravel()
+                      for array in (self.weight, self.w2, self.mean,
+                                    self.m2, self.time_last)])
+
+class vco_api_seasonal_detector(vco_api_online_detector):
+    '''
+    Detect WAN anomaly as the online detector does, but against a
+    baseline of each hour of the week apart, so that the present
+    interval of e.g. a Monday morning is compared with the Monday
+    mornings before rather than with the night before. The hour of
+    the week is that of the timestamp in UTC, which follows the
+    business hours of any one time zone but for daylight saving
+    time. The state of the 168 cells of each key is held in fixed
+    shape NumPy files in the given directory, memory-mapped on load
+    so that only the pages of the cells read or written are ever
+    touched, with the keys, the timestamp of the latest sample folded
+    in of each and the metadata in a JSON file.
+    '''
+
+    BUCKETS = 168
+    '''
+    168 cells of state per key i.e. one per hour of the week
+    '''
+
+    ARRAYS = ('weight', 'w2', 'mean', 'm2', 'time_last')
+    '''
+    The arrays of the state, each saved to a NumPy file of its name
+    '''
+
+    def _get_file_name(self, name, extension = 'npy'):
+        '''
+        Return the name of the file of the given array in the directory
+        '''
+        return '%s/%s.%s' % (self.file_name, name, extension)
+
+    def _cell(self, index, timestamps):
+        '''
+        Return the cells of the state of the given key indices and
+        timestamps in epoch and in milliseconds, by hour of the week
+        from Monday 00:00 UTC, with the epoch being a Thursday
+        '''
+        return index * self.BUCKETS + (timestamps // 3600000 + 72) \
+               % self.BUCKETS
+
+    def load(self):
+        '''
+        Open the state on disk memory-mapped, leaving it empty should
+        the files be absent or unreadable, e.g. of an older version
+        with an array missing, or should they have been saved for
+        another enterprise or half-life
+        '''
+        self._reset()
+        try:
+            with open(self._get_file_name('keys', 'json')) as f:
+                if not self._set_keys(json.load(f)):
+                    return self._reset()
+            arrays = [np.load(self._get_file_name(name), mmap_mode='r+')
+                      for name in self.ARRAYS]
+        except (OSError, KeyError, TypeError, ValueError):
+            return self._reset()
+
+        '''
+        Arrays longer than the keys are of keys added by an interrupted
+        run, and their extra cells are left out
+        '''
+        size = len(self.keys) * self.BUCKETS
+        if any(len(array) < size for array in arrays):
+            return self._reset()
+        self.weight, self.w2, self.mean, self.m2, self.time_last = [
+            array[:size] for array in arrays]
+
+    def save(self):
+        '''
+        Flush the memory-mapped state to disk, and write the keys
+        '''
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            if isinstance(array, np.memmap):
+                array.flush()
+        file_name = self._get_file_name('keys', 'json')
+        with open_atomic(file_name) as f:
+            json.dump(self._get_meta(), f)
+
+    def _store(self, *arrays):
+        '''
+        Write the given arrays of the state to NumPy files, and open
+        them memory-mapped in their stead
+        '''
+        makedirs(self.file_name, exist_ok=True)
+        for name, array in zip(self.ARRAYS, arrays):
+            file_name = self._get_file_name(name)
+            with open_atomic(file_name, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            setattr(self, name, np.load(file_name, mmap_mode='r+'))
@@ -0,0 +1,286 @@
+import gzip
+import json
+import time
+from os import listdir, mkdir, remove
+from os.path import exists, getsize
+from vco_api_parser import parse_timestamp_e
+from vco_api_file import open_atomic
+
+class vco_api_event_store():
+    '''
+    An append-only store of records such as events or firewall logs
+    as lines of JSON in segment files in a directory. Records are
+    streamed through a buffered writer into the active segment, which
+    is rotated once it grows past rotate_bytes or once the hour it
+    was opened in has passed, and closed segments are gzip compressed.
+    A sidecar index keeps the time range of each segment and of each
+    block of block_records records in it, with the offset of the block
+    in the uncompressed segment, so that a query for a time range
+    reads only the blocks that overlap it.
+    .
+    └── name/
+        ├── name.index.json
+        ├── name-YYYYMMDDHH-000001.json.gz
+        ├── name-YYYYMMDDHH-000002.json.gz
+        └── name-YYYYMMDDHH-000003.json
+    '''
+
+    ROTATE_BYTES = 64 * 1024 * 1024
+    '''
+    64 MiB as default for the active segment to be rotated
+    '''
+
+    BLOCK_RECORDS = 1000
+    '''
+    1000 records as default in each indexed block of a segment
+    '''
+
+    BUFFER_BYTES = 1024 * 1024
+    '''
+    1 MiB of write buffer
+    '''
+
+    def __init__(self, directory, name, time_field, rotate_bytes = None,
+    block_records = None):
+        '''
+        Open the store in the given directory, creating it should it
+        not exist, for records whose time is in the given field either
+        in epoch and in milliseconds or in ISO 8601 format
+        '''
+        self.directory = directory.rstrip('/') + '/'
+        self.name = name
+        self.time_field = time_field
+        self.rotate_bytes = self.ROTATE_BYTES \
+            if rotate_bytes is None else rotate_bytes
+        self.block_records = self.BLOCK_RECORDS \
+            if block_records is None else block_records
+        self.index_file = self.directory + name + '.index.json'
+        self.file = None
+
+        try:
+            mkdir(self.directory)
+        except FileExistsError:
+            pass
+        self._load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _load_index(self):
+        '''
+        Read the index, and index any segment left unindexed or only
+        partly indexed by an interrupted run
+        '''
+        try:
+            with open(self.index_file) as f:
+                self.segments = json.load(f)['segments']
+        except (OSError, KeyError, ValueError):
+            self.segments = []
+
+        indexed = { segment['file']: segment for segment in self.segments }
+        for file_name in sorted(listdir(self.directory)):
+            if not file_name.startswith(self.name + '-') \
+            or not file_name.endswith('.json'):
+                continue
+            segment = indexed.get(file_name)
+            if segment is None:
+                segment = self._new_segment(file_name)
+                self.segments.append(segment)
+            if segment['size'] != getsize(self.directory + file_name):
+                self._scan(segment)
+
+    def _save_index(self):
+        '''
+        Write the index to disk
+        '''
+        with open_atomic(self.index_file) as f:
+            json.dump({ 'segments': self.segments }, f)
+
+    def _new_segment(self, file_name):
+        '''
+        Return the index entry of a new, empty, segment
+        '''
+        return { 'file': file_name,
+                 'hour': file_name.split('-')[-2],
+                 'compressed': False,
+                 'size': 0,
+                 'count': 0,
+                 'time_min': None,
+                 'time_max': None,
+                 'blocks': [] }
+
+    def _get_time_e(self, record):
+        '''
+        Return the time of the given record in epoch and in
+        milliseconds, or None should it not have a valid time
+        '''
+        try:
+            return parse_timestamp_e(record[self.time_field])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _index_record(self, segment, offset, time_e):
+        '''
+        Add a record of the given time at the given offset to the
+        index entry of a segment, starting a new block as needed
+        '''
+        if segment['count'] % self.block_records == 0:
+            segment['blocks'].append([offset, None, None])
+        segment['count'] += 1
+        if time_e is None:
+            return
+        if segment['time_min'] is None or time_e < segment['time_min']:
+            segment['time_min'] = time_e
+        if segment['time_max'] is None or time_e > segment['time_max']:
+            segment['time_max'] = time_e
+
+        block = segment['blocks'][-1]
+        if block[1] is None or time_e < block[1]:
+            block[1] = time_e
+        if block[2] is None or time_e > block[2]:
+            block[2] = time_e
+
+    def _scan(self, segment):
+        '''
+        Index the records of an uncompressed segment beyond the size
+        already indexed, e.g. those written by an interrupted run
+        '''
+        with open(self.directory + segment['file'], 'rb') as f:
+            f.seek(segment['size'])
+            offset = segment['size']
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    time_e = self._get_time_e(json.loads(line))
+                except ValueError:
+                    time_e = None
+                self._index_record(segment, offset, time_e)
+                offset += len(line)
+            segment['size'] = offset
+
+    def _open_segment(self):
+        '''
+        Open the active segment for writing, reusing the latest
+        uncompressed one should it be of this hour and not full
+        '''
+        hour = time.strftime('%Y%m%d%H', time.gmtime())
+        for segment in self.segments:
+            if not segment['compressed'] \
+            and (segment['hour'] != hour
+            or segment['size'] >= self.rotate_bytes):
+                self._compress(segment)
+
+        active = [segment for segment in self.segments
+                  if not segment['compressed']]
+        if active:
+            self.segment = active[-1]
+        else:
+            seq = len(self.segments) + 1
+            self.segment = self._new_segment('%s-%s-%06d.json' % (
+                            self.name, hour, seq))
+            self.segments.append(self.segment)
+
+        self.file = open(self.directory + self.segment['file'], 'ab',
+                         buffering=self.BUFFER_BYTES)
+
+    def _compress(self, segment):
+        '''
+        Compress a closed segment with gzip and remove the original
+        '''
+        file_name = self.directory + segment['file']
+        if exists(file_name):
+            with open(file_name, 'rb') as f_in, \
+            open_atomic(file_name + '.gz', 'wb', gzip.open) as f_out:
+                while True:
+                    chunk = f_in.read(self.BUFFER_BYTES)
+                    if not chunk:
+                        break
+                    f_out.write(chunk)
+            segment['compressed'] = True
+            self._save_index()
+            remove(file_name)
+        else:
+            segment['compressed'] = True
+
+    def _close_segment(self):
+        '''
+        Flush and close the active segment and save the index
+        '''
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self._save_index()
+
+    def write(self, records):
+        '''
+        Append each of the given records, in a list or as they are
+        yielded by a generator, to the store and return the number of
+        records written, holding no more than the write buffer in
+        memory
+        '''
+        count = 0
+        try:
+            for record in records:
+                if self.file is None:
+                    self._open_segment()
+                line = (json.dumps(record) + '\n').encode()
+                self._index_record(self.segment, self.segment['size'],
+                    self._get_time_e(record))
+                self.file.write(line)
+                self.segment['size'] += len(line)
+                count += 1
+                if self.segment['size'] >= self.rotate_bytes:
+                    self._close_segment()
+                    self._compress(self.segment)
+        finally:
+            self._close_segment()
+        return count
+
+    def close(self):
+        '''
+        Flush and close the active segment should it be open
+        '''
+        self._close_segment()
+
+    def query(self, time_start_e, time_end_e):
+        '''
+        Yield the records whose time in epoch and in milliseconds is
+        between the given start and end time inclusive, reading only
+        the segments, and the blocks in them, whose time range
+        overlaps the given one
+        '''
+        self._close_segment()
+        for segment in list(self.segments):
+            if segment['time_min'] is None \
+            or segment['time_max'] < time_start_e \
+            or segment['time_min'] > time_end_e:
+                continue
+
+            if segment['compressed']:
+                f = gzip.open(self.directory + segment['file'] + '.gz', 'rb')
+            else:
+                f = open(self.directory + segment['file'], 'rb')
+
+            with f:
+                blocks = segment['blocks']
+                for i, (offset, time_min, time_max) in enumerate(blocks):
+                    if time_min is None or time_max < time_start_e \
+                    or time_min > time_end_e:
+                        continue
+                    offset_end = blocks[i + 1][0] if i + 1 < len(blocks) \
+                                    else segment['size']
+                    f.seek(offset)
+                    while offset < offset_end:
+                        line = f.readline()
+                        if not line:
+                            break
+                        offset += len(line)
+                        record = json.loads(line)
+                        time_e = self._get_time_e(record)
+                        if time_e is not None \
+                        and time_start_e <= time_e <= time_end_e:
+                            yield record
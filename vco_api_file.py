@@ -0,0 +1,25 @@
+import threading
+from contextlib import contextmanager
+from os import getpid, remove, replace
+
+@contextmanager
+def open_atomic(file_name, mode = 'w', opener = open):
+    '''
+    Open a temporary file of the given name, unique to the process and
+    the thread, with the given mode and opener, e.g. gzip.open, and
+    replace the file of the given name with it once written, so that
+    an interrupted write never leaves a partly written file behind.
+    The temporary file is removed should the write fail.
+    '''
+    file_name_tmp = '%s.%s.%s.tmp' % (file_name, getpid(),
+                                      threading.get_ident())
+    try:
+        with opener(file_name_tmp, mode) as f:
+            yield f
+        replace(file_name_tmp, file_name)
+    except BaseException:
+        try:
+            remove(file_name_tmp)
+        except OSError:
+            pass
+        raise
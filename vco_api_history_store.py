@@ -0,0 +1,263 @@
+import json
+from os import makedirs
+from os.path import exists
+from vco_api_parser import WAN_QUALITY
+from vco_api_file import open_atomic
+
+class vco_api_history_store():
+    '''
+    An append-only columnar store of the WAN quality samples of each
+    of the links of each of the Edges of an enterprise, with a
+    directory per Edge and per link. The samples are appended as
+    fixed-width rows of the timestamp and the six WAN qualities to
+    the tail of the link, which is sealed into a chunk once it holds
+    chunk_rows samples. A chunk is laid out column by column, the
+    timestamps first and then each WAN quality, so that a query reads
+    only the columns asked for. An index keeps the time range of each
+    chunk and of the tail, so that a query for a time range opens only
+    the chunks that overlap it, memory-mapped, and reads only the rows
+    in the range found by a binary search of the timestamps. Samples
+    are appended in time order, and those no newer than the latest
+    one stored are left out. NumPy is imported by the methods that
+    need it rather than with the module.
+    .
+    └── directory/
+        ├── index.json
+        └── edgeId/
+            └── linkId/
+                ├── chunk-000001.bin
+                ├── chunk-000002.bin
+                └── tail.bin
+    '''
+
+    CHUNK_ROWS = 2016
+    '''
+    2016 samples as default in each chunk i.e. a week of samples
+    every 5 minutes
+    '''
+
+    def __init__(self, directory, chunk_rows = None):
+        '''
+        Open the store in the given directory, creating it should it
+        not exist
+        '''
+        self.directory = directory.rstrip('/') + '/'
+        self.chunk_rows = self.CHUNK_ROWS \
+            if chunk_rows is None else chunk_rows
+        self.index_file = self.directory + 'index.json'
+        makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _get_dtype(self):
+        '''
+        Return the NumPy dtype of a row of the tail
+        '''
+        import numpy as np
+        return np.dtype([('timestamp', '<i8')] +
+                        [(quality, '<f8') for quality in WAN_QUALITY])
+
+    def _load_index(self):
+        '''
+        Read the index, leaving the store empty should it be absent or
+        unreadable. Rows of a tail beyond the count in the index are of
+        an interrupted run and are overwritten by the next append.
+        '''
+        try:
+            with open(self.index_file) as f:
+                links = json.load(f)['links']
+        except (OSError, KeyError, ValueError):
+            links = []
+        self.links = { (link['edge'], link['wan']): link for link in links }
+
+    def _save_index(self):
+        '''
+        Write the index to disk
+        '''
+        with open_atomic(self.index_file) as f:
+            json.dump({ 'links': list(self.links.values()) }, f)
+
+    def _get_link_dir(self, edge, wan):
+        '''
+        Return the directory of the given link of an Edge
+        '''
+        return '%s%s/%s/' % (self.directory, edge, wan)
+
+    def get_time_last_e(self):
+        '''
+        Return the timestamp in epoch and in milliseconds of the latest
+        sample stored of any of the links of each Edge by Edge
+        '''
+        time_last_e = {}
+        for (edge, _), link in self.links.items():
+            if link['time_max'] is not None \
+            and link['time_max'] > time_last_e.get(edge, -1):
+                time_last_e[edge] = link['time_max']
+        return time_last_e
+
+    def append(self, edge, wan_new):
+        '''
+        Append the samples of the given columns of the links of an
+        Edge newer than the latest sample stored of each link, and
+        return the number of samples appended. The index is saved by
+        save, once all the Edges are appended.
+        '''
+        import numpy as np
+        count = 0
+        for wan in wan_new:
+            columns = wan_new[wan]
+            link = self.links.get((edge, wan))
+            if link is None:
+                link = self.links[(edge, wan)] = {
+                    'edge': edge, 'wan': wan, 'chunks': [], 'tail': 0,
+                    'time_min': None, 'time_max': None }
+                makedirs(self._get_link_dir(edge, wan), exist_ok=True)
+
+            timestamp = columns['timestamp']
+            new = np.argsort(timestamp, kind='stable')
+            if link['time_max'] is not None:
+                new = new[timestamp[new] > link['time_max']]
+            if not len(new):
+                continue
+
+            rows = np.zeros(len(new), dtype=self._get_dtype())
+            for column in rows.dtype.names:
+                rows[column] = columns[column][new] if column in columns \
+                               else np.nan
+            self._append_rows(link, rows)
+            count += len(rows)
+        return count
+
+    def _append_rows(self, link, rows):
+        '''
+        Write the given rows to the tail of a link after the rows
+        counted in the index, sealing the tail into chunks as it fills
+        '''
+        tail_file = self._get_link_dir(link['edge'], link['wan']) + 'tail.bin'
+        with open(tail_file, 'r+b' if exists(tail_file) else 'w+b') as f:
+            while len(rows):
+                size = min(len(rows), self.chunk_rows - link['tail'])
+                f.seek(link['tail'] * rows.itemsize)
+                f.write(rows[:size].tobytes())
+                link['tail'] += size
+                if link['time_min'] is None:
+                    link['time_min'] = int(rows['timestamp'][0])
+                link['time_max'] = int(rows['timestamp'][size - 1])
+                rows = rows[size:]
+                if link['tail'] >= self.chunk_rows:
+                    self._seal(link, f)
+
+    def _seal(self, link, tail):
+        '''
+        Write the rows of the given open tail of a link to a new chunk
+        column by column, add the chunk to the index and empty the tail
+        '''
+        import numpy as np
+        tail.seek(0)
+        rows = np.frombuffer(tail.read(link['tail'] * self._get_dtype(
+                    ).itemsize), dtype=self._get_dtype())
+        file_name = 'chunk-%06d.bin' % (len(link['chunks']) + 1)
+        chunk_file = self._get_link_dir(link['edge'], link['wan']) + file_name
+        with open_atomic(chunk_file, 'wb') as f:
+            for column in rows.dtype.names:
+                f.write(np.ascontiguousarray(rows[column]).tobytes())
+        link['chunks'].append([file_name, len(rows),
+                               int(rows['timestamp'][0]),
+                               int(rows['timestamp'][-1])])
+        link['tail'] = 0
+        self._save_index()
+        tail.truncate(0)
+
+    def save(self):
+        '''
+        Save the index, making the samples appended since visible to
+        the next run
+        '''
+        self._save_index()
+
+    def _read_chunk(self, link, chunk, time_start_e, time_end_e,
+    qualities):
+        '''
+        Return the columns of the rows of a chunk between the given
+        start and end time inclusive, memory-mapping only the columns
+        asked for and copying only the rows in the range
+        '''
+        import numpy as np
+        file_name, count = chunk[0], chunk[1]
+        file_name = self._get_link_dir(link['edge'], link['wan']) + file_name
+        timestamp = np.memmap(file_name, dtype='<i8', mode='r',
+                              shape=(count,))
+        start = np.searchsorted(timestamp, time_start_e, 'left')
+        end = np.searchsorted(timestamp, time_end_e, 'right')
+        columns = { 'timestamp': np.array(timestamp[start:end]) }
+        for quality in qualities:
+            offset = (1 + WAN_QUALITY.index(quality)) * count * 8
+            column = np.memmap(file_name, dtype='<f8', mode='r',
+                               offset=offset, shape=(count,))
+            columns[quality] = np.array(column[start:end])
+        return columns
+
+    def _read_tail(self, link, time_start_e, time_end_e, qualities):
+        '''
+        Return the columns of the rows of the tail of a link between
+        the given start and end time inclusive
+        '''
+        import numpy as np
+        rows = np.memmap(self._get_link_dir(link['edge'], link['wan'])
+                         + 'tail.bin', dtype=self._get_dtype(), mode='r',
+                         shape=(link['tail'],))
+        start = np.searchsorted(rows['timestamp'], time_start_e, 'left')
+        end = np.searchsorted(rows['timestamp'], time_end_e, 'right')
+        return { column: np.array(rows[column][start:end])
+                 for column in ('timestamp',) + tuple(qualities) }
+
+    def query(self, edge, wan, time_start_e, time_end_e,
+    qualities = WAN_QUALITY):
+        '''
+        Return the samples of a link of an Edge between the given start
+        and end time in epoch and in milliseconds inclusive as columns
+        of NumPy arrays of the timestamps and the given WAN qualities,
+        or None should there be none, reading only the chunks whose
+        time range overlaps the given one
+        '''
+        import numpy as np
+        link = self.links.get((edge, wan))
+        if link is None or link['time_max'] is None \
+        or link['time_max'] < time_start_e \
+        or link['time_min'] > time_end_e:
+            return None
+
+        parts = []
+        for chunk in link['chunks']:
+            if chunk[3] >= time_start_e and chunk[2] <= time_end_e:
+                parts.append(self._read_chunk(link, chunk, time_start_e,
+                                time_end_e, qualities))
+        if link['tail']:
+            parts.append(self._read_tail(link, time_start_e, time_end_e,
+                            qualities))
+        parts = [part for part in parts if len(part['timestamp'])]
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        return { column: np.concatenate([part[column] for part in parts])
+                 for column in parts[0] }
+
+    def query_all(self, time_start_e, time_end_e, edges = None,
+    qualities = WAN_QUALITY):
+        '''
+        Return the samples of all the links of the given Edges, or of
+        all the Edges stored, between the given start and end time in
+        epoch and in milliseconds inclusive as a dictionary of Edge,
+        link and columns as with query
+        '''
+        if edges is not None:
+            edges = set(edges)
+        wan_quality = {}
+        for edge, wan in self.links:
+            if edges is not None and edge not in edges:
+                continue
+            columns = self.query(edge, wan, time_start_e, time_end_e,
+                                 qualities)
+            if columns is not None:
+                wan_quality.setdefault(edge, {})[wan] = columns
+        return wan_quality
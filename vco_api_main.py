@@ -1,551 +1,1856 @@
-import time
-import datetime
-import json
-import numpy as np
-import pandas as pd
-import smtplib, ssl
-from vco_api_client import vco_api_client
-from sys import path
-from os import mkdir, environ
-from dotenv import load_dotenv, find_dotenv
-from textwrap import dedent
-
-class vco_api_main():
-    INTERVAL_SECS = 300
-    '''
-    300 seconds i.e. 5 minutes interval as default for API calls
-    '''
-
-    INTERVAL_SECS_METRICS = 3600
-    '''
-    3600 seconds i.e. 60 minutes interval as default for the
-    aggregate Edge transport metrics call
-    '''
-
-    VCO_THRESHOLD = 600
-    '''
-    600 seconds i.e. 10 minutes for data is often not reflected in API
-    output for up 10 minutes as per the API documentation
-    https://code.vmware.com/apis/1045/velocloud-sdwan-vco-api
-    '''
-
-    def __init__(self):
-        if load_dotenv(find_dotenv()) == False:
-            '''
-            Raise a system exit on error reading environment variables
-            with python-dotenv
-            '''
-            raise SystemExit('Problem locating the .env file')
-
-        '''
-        Read the environment variables for the parameters
-        needed for the VCO client authentication
-        '''
-        try:
-            hostname = environ['VCO_HOSTNAME']
-        except KeyError:
-            # Raise a system exit on error reading the hostname
-            raise SystemExit('VCO_HOSTNAME is not found in the .env')
-
-        try:
-            token = environ['VCO_TOKEN']
-        except KeyError:
-            token = None
-            try:
-                # Read username and password if a token is not found
-                username = environ['VCO_USERNAME']
-                password = environ['VCO_PASSWORD']
-            except KeyError:
-                # Raise a system exit on error reading the parameters
-                raise SystemExit(dedent('''\
-                Neither the VCO_TOKEN nor the VCO_USERNAME and
-                VCO_PASSWORD is found in the .env
-                ''').replace('\n', ' '))
-
-        '''
-        Initiate the VCO client object with the API token or
-        authenticate it with the username and password if a token
-        is not found
-        '''
-        self.client = vco_api_client(hostname)
-        if token:
-            self.client.token_auth(token)
-        else:
-            self.client.cookies_auth(username, password, is_operator=False)
-
-        '''
-        Read and initiate the time now
-        '''
-        self.time_now = self.__update_time()
-
-        '''
-        Read and set the enterpriseName and enterpriseId from
-        a call to the monitoring/getAggregateEdgeLinkMetrics
-        '''
-        self.metrics = self._get_aggre_metrics(self.INTERVAL_SECS_METRICS)
-        self.ent_name = self._get_ent_name(self.metrics)
-        self.ent_id = self._get_ent_id(self.metrics)
-
-        '''
-        Read and set the edgeId from a call to the
-        enterprise/getEnterpriseEdges
-        '''
-        self.ent_edge = self._get_ent_edge()
-        self.edge_id = self._get_edge_id(self.ent_edge)
-
-    def __update_time(self):
-        '''
-        Return the time now minus the VCO API delay
-        threshold in epoch
-        '''
-        time_now = int(time.time() - self.VCO_THRESHOLD)
-        return time_now
-
-    def __name_sanitised(self, name):
-        '''
-        Replace non-alphanumeric character in string with a dash
-        for sanitisation
-        '''
-        return ''.join([c if c.isalnum() else '-' for c in name])
-
-    def _get_time_e(self, interval_sec = None):
-        '''
-        Read the time now minus the VCO API delay threshold and
-        set the start and end time accirdingly in epoch and in
-        milliseconds with a default 5-minute interval unless
-        otherwise specified
-        '''
-        if interval_sec is None:
-            interval_sec = self.INTERVAL_SECS
-        self.time_end_e = self.time_now * 1000
-        self.time_start_e = (self.time_now - int(interval_sec)) * 1000
-
-    def _get_time(self, interval_sec = None):
-        '''
-        Read the time now minus the VCO API delay threshold and
-        set the start and end time in UTC and in ISO 8601 format
-        with a default 5-minute interval unless otherwise specified
-        '''
-        if interval_sec is None:
-            interval_sec = self.INTERVAL_SECS
-        self.time_end = datetime.datetime.utcfromtimestamp(
-                        self.time_now).isoformat()
-        self.time_start = datetime.datetime.utcfromtimestamp(
-                            self.time_now - int(interval_sec)).isoformat()
-
-    def _get_aggre_metrics(self, interval_sec):
-        '''
-        Poll and return the aggregate Edge transport metrics
-        of all the Edges given a specified time interval
-        '''
-        self._get_time_e(interval_sec)
-        metrics = self.client.call_api(
-                    'monitoring/getAggregateEdgeLinkMetrics', {
-                        'interval': {
-                            'start': self.time_start_e,
-                            'end': self.time_end_e
-                        }
-        })
-        return metrics
-
-    def _get_ent_id(self, metric):
-        '''
-        Return the enterpriseId
-        '''
-        try:
-            return metric[0]['link']['enterpriseId']
-        except KeyError:
-            # Raise a system exit on error reading the enterpriseId
-            raise SystemExit('enterpriseID is not found in metric')
-        except IndexError:
-            # Raise a system exit on error locating the enterpriseId
-            raise SystemExit('enterpriseID cannot be located in metric')
-        except TypeError:
-            # Raise a system exit on error accessing metric
-            raise SystemExit('Problem accessing metric')
-
-    def _get_ent_edge(self):
-        '''
-        Poll and return details of all the Edges given the enterpriseId
-        '''
-        ent_edge = self.client.call_api(
-                    'enterprise/getEnterpriseEdges', {
-                        'enterpriseId': self.ent_id,
-                    })
-        return ent_edge
-
-    def _get_edge_id(self, ent_edge):
-        '''
-        Return a list of the edgeId for all the Edges given
-        '''
-        edge_list = []
-        for each in ent_edge:
-            try:
-                if isinstance(each['id'], int):
-                    edge_list.append(each['id'])
-            except KeyError:
-                pass
-
-        if edge_list:
-            return list(set(edge_list))
-        else:
-            # Raise a system exit on error reading the edgeID
-            raise SystemExit('No edgeID is found in ent_edge')
-
-    def _get_ent_name(self, metric):
-        '''
-        Return the enterpriseName
-        '''
-        try:
-            return metric[0]['link']['enterpriseName']
-        except KeyError:
-            # Raise a system exit on error reading the enterpriseName
-            raise SystemExit('enterpriseName is not found in metric')
-        except IndexError:
-            # Raise a system exit on error locating the enterpriseName
-            raise SystemExit('enterpriseName cannot be located in metric')
-        except TypeError:
-            # Raise a system exit on error accessing metric
-            raise SystemExit('Problem accessing metric')
-
-    def _get_edge_name(self, edge_id, ent_edge):
-        '''
-        Return the Edge name given its ID
-        '''
-        try:
-            for edge in ent_edge:
-                if edge['id'] == edge_id:
-                    return edge['name']
-        except KeyError:
-            pass
-        # Return the Edge ID instead if the name is not found
-        return edge_id
-
-    def _get_wan_name(self, link_id, metrics):
-        '''
-        Return the WAN name given its ID
-        '''
-        try:
-            for link in metrics:
-                if link['linkLogicalId'] == link_id:
-                    return link['link']['displayName']
-        except KeyError:
-            pass
-        # Return the link ID instead if the name is not found
-        return link_id
-
-    def _get_wan_quality_name(self, quality):
-        '''
-        Return a human readable WAN qaulity name given its key
-        '''
-        wan_qaulity_key_value = {
-            'latencyMsTx': 'Latency (upload, ms)',
-            'latencyMsRx': 'Latency (download, ms)',
-            'jitterMsTx': 'Jitter (upload, ms)',
-            'jitterMsRx': 'Jitter (download, ms)',
-            'lossPctTx': 'Packet Loss (upload, %)',
-            'lossPctRx': 'Packet Loss (download, %)'
-        }
-        for key in wan_qaulity_key_value:
-            if key == quality:
-                return wan_qaulity_key_value[key]
-        # Return the WAN qaulity key instead if the name is not found
-        return quality
-
-    def __get_wan_quality(self, edge_id, min_per_sample,
-    interval_sec = None, time_offset = None, indiv_score = True):
-        '''
-        Return the quality of the WAN associated with
-        an Edge given its ID and a specified time interval
-        '''
-        self._get_time_e(interval_sec)
-        wan_quality = self.client.call_api(
-            'linkQualityEvent/getLinkQualityEvents', {
-            'enterpriseId': self.ent_id,
-            'edgeId': edge_id,
-            'interval': {
-                'start': self.time_start_e if time_offset == None
-                    else self.time_start_e - time_offset,
-                'end': self.time_end_e if time_offset == None
-                    else self.time_end_e - time_offset,
-            },
-            'minutesPerSample': min_per_sample,
-            'individualScores': indiv_score
-        })
-        return wan_quality
-
-    def _get_wan_quality_dataframe(self, min_per_sample,
-    interval_sec = None, time_offset = None):
-        '''
-        Return the quality of the WAN associated with
-        all the Edges given a specified time interval
-        as pandas DataFrames
-        '''
-        wan_quality_dataframe = {}
-        for edge in self.edge_id:
-            wan_quality = self.__get_wan_quality(edge, min_per_sample,
-                interval_sec, time_offset)
-            wan = {}
-            for wan_id in wan_quality:
-                if not wan_id == 'overallLinkQuality':
-                    dict = []
-                    try:
-                        for timeseries in wan_quality[wan_id]['timeseries']:
-                            try:
-                                timeseries['timestamp']
-                                timeseries['metadata']['detail']
-                            except KeyError:
-                                pass
-                            else:
-                                sample = {'timestamp': timeseries['timestamp']}
-                                sample.update(timeseries['metadata']['detail'])
-                            if sample: dict.append(sample)
-                    except KeyError:
-                        pass
-                    if dict:
-                        wan[wan_id] = pd.DataFrame.from_dict(dict)
-            if wan:
-                wan_quality_dataframe[edge] = wan
-
-        if wan_quality_dataframe:
-            return wan_quality_dataframe
-        else:
-            # Raise a system exit on error reading the WAN quality
-            raise SystemExit('Of all the Edges no WAN quality is found')
-
-    def _email_wan_anomaly(self, email_msg):
-        '''
-        Send an email notification given a email subject and body
-        '''
-        ssl_context = ssl.create_default_context()
-
-        '''
-        Read the environment variables for the parameters
-        needed for the VCO client authentication
-        '''
-        try:
-            email_sslp = environ['EMAIL_SSL_PORT']
-            email_smtp = environ['EMAIL_SMTP_SERVER']
-            email_sender = environ['EMAIL_SENDER']
-            email_receiver = environ['EMAIL_RECEIVER']
-            email_sender_pw = environ['EMAIL_SENDER_PASSWORD']
-        except KeyError:
-            # Raise a system exit on error reading the parameters
-            raise SystemExit(dedent('''\
-            Either one or all of EMAIL_SSL_PORT, EMAIL_SMTP_SERVER
-            EMAIL_SENDER, EMAIL_RECEIVER and EMAIL_SENDER_PASSWORD
-            is not found in the .env
-            ''').replace('\n', ' '))
-
-        with smtplib.SMTP_SSL(email_smtp, email_sslp,
-        context=ssl_context) as server:
-            server.login(email_sender, email_sender_pw)
-            server.sendmail(email_sender, email_receiver, email_msg)
-
-    def detect_wan_anomaly(self, min_per_sample, interval_sec_present,
-    interval_sec_hist):
-        '''
-        Detect WAN anomoly by comparing the means of the upload and
-        download latency, jitter and packet loss of a recent timeframe
-        to a historical baseline of given durations. Send an email
-        notification with the details should an anomoly be found.
-        '''
-        if min(interval_sec_present, interval_sec_hist) / 60 < min_per_sample:
-            '''
-            Raise a system exit if either sampling durations
-            is smaller than the sampling interval in minutes
-            '''
-            raise SystemExit('Sampling duration is smaller than the sampling interval')
-
-        wan_quality_dataframe_present = self._get_wan_quality_dataframe(
-                                        min_per_sample,
-                                        interval_sec_present)
-        wan_quality_dataframe_hist = self._get_wan_quality_dataframe(
-                                        min_per_sample,
-                                        interval_sec_hist, interval_sec_present)
-        wan_anomaly = ''
-        for edge in wan_quality_dataframe_present:
-            for wan in wan_quality_dataframe_present[edge]:
-                for quality in wan_quality_dataframe_present[edge][wan]:
-                    if not quality == 'timestamp':
-                        '''
-                        WAN anomaly detection requires the WAN quality
-                        to be present in interval_sec_hist as well as
-                        interval_sec_present for obvious reason. The
-                        for-loop attests to its existence in
-                        interval_sec_present which leaves
-                        interval_sec_hist to be checked.
-                        '''
-                        try:
-                            wan_quality_dataframe_hist[edge][wan][quality]
-                        except KeyError:
-                            pass
-                        else:
-                            wan_quality_present_mean = \
-                                wan_quality_dataframe_present[edge][wan][quality].mean()
-                            wan_quality_hist_mean = \
-                                wan_quality_dataframe_hist[edge][wan][quality].mean()
-                            wan_quality_hist_std = \
-                                wan_quality_dataframe_hist[edge][wan][quality].std()
-                            wan_quality_hist_std_factor = 2
-
-                            if wan_quality_present_mean \
-                            > wan_quality_hist_mean \
-                            + wan_quality_hist_std * wan_quality_hist_std_factor:
-                                wan_anomaly_msg = '''\
-                                %s of WAN %s between Edge %s and its associated
-                                Gateway is found to be %s and is %s standard
-                                deviation(s) away from the mean of %s and
-                                standard deviation of %s of the %s minute(s) before.
-                                ''' % (
-                                self._get_wan_quality_name(quality),
-                                self._get_wan_name(wan, self.metrics),
-                                self._get_edge_name(edge, self.ent_edge),
-                                str(round(wan_quality_present_mean, 2)),
-                                str(round(wan_quality_hist_std_factor, 2)),
-                                str(round(wan_quality_hist_mean, 2)),
-                                str(round(wan_quality_hist_std, 2)),
-                                str(round(interval_sec_hist / 60), 2))
-
-                                wan_anomaly_msg = dedent(wan_anomaly_msg).replace('\n', ' ')
-                                wan_anomaly += wan_anomaly_msg + '\n'
-        if wan_anomaly:
-            self._get_time()
-            email_msg = 'Subject: WAN Anomoly Alert' \
-                        + '\n\n' \
-                        + 'As of ' + self.time_end + ' UTC:' \
-                        + '\n' \
-                        + wan_anomaly
-            self._email_wan_anomaly(email_msg)
-
-    def get_ent_events(self, interval_sec = None):
-        '''
-        Poll and return events given the enterpriseId and a specified
-        time interval
-        '''
-        self._get_time(interval_sec)
-        events = self.client.call_api('event/getEnterpriseEvents',
-                    {
-                        'enterpriseId': self.ent_id,
-                        'interval': {
-                            'start': self.time_start,
-                            'end': self.time_end
-                    }
-        })
-        try:
-            return events['data']
-        except KeyError:
-            raise SystemExit('Event is not found in getEnterpriseEvents')
-
-    def get_ent_fw_logs(self, interval_sec = None):
-        '''
-        Poll and return firewall logs given the enterpriseId and a
-        specified time interval
-        '''
-        self._get_time(interval_sec)
-        fw_logs = self.client.call_api(
-                    'firewall/getEnterpriseFirewallLogs', {
-                        'enterpriseId': self.ent_id,
-                        'interval': {
-                            'start': self.time_start,
-                            'end': self.time_end
-                    }
-        })
-        try:
-            return fw_logs['data']
-        except KeyError:
-            raise SystemExit('Firewall log is not found in getEnterpriseFirewallLogs')
-
-
-    def get_ent_edge_config(self):
-        '''
-        Poll and return the Edge config moodule given the
-        enterpriseId and the edgeId
-        '''
-        edge_configs = {}
-        for edge in self.edge_id:
-            edge_config = self.client.call_api(
-                            'edge/getEdgeConfigurationStack', {
-                                'enterpriseId': self.ent_id,
-                                'edgeId': edge
-                            })
-            edge_configs[self._get_edge_name(edge,
-                self.ent_edge)] = edge_config
-
-        if edge_configs:
-            return edge_configs
-        else:
-            raise SystemExit('No Edge config is found in getEdgeConfigurationStack')
-
-    def write_ent_edge_config(self, edge_configs):
-        '''
-        Write each of the Edge config stacks as JSON files in a
-        directory named by the sanitised enterpriseName, and nested
-        in a number of subdirectories named respectively by the year,
-        the month and the day, and finally by the the full date and
-        time now to ease access.
-        .
-        └── enterpriseName/
-            └── Year/
-                └── Month/
-                    └── Date/
-                        └── YYYY-MM-DD-HH-MM-SS/
-                            ├── edgeName1.json
-                            ├── edgeName2.json
-                            ├── edgeName3.json
-                            └── edgeName4.json
-        '''
-        ent_name_sanitised = self.__name_sanitised(self.ent_name)
-        time_stamp = time.strftime('%Y-%m-%d-%H-%M-%S',
-                        time.gmtime(self.__update_time()))
-        date_time = datetime.datetime.strptime(time_stamp,
-                    '%Y-%m-%d-%H-%M-%S')
-
-        ent_edge_config_dir_list = [ent_name_sanitised,
-                                    date_time.year,
-                                    date_time.month,
-                                    date_time.day,
-                                    time_stamp]
-
-        ent_edge_config_dir = path[0] + '/'
-
-        for i in range(len(ent_edge_config_dir_list)):
-            ent_edge_config_dir += str(ent_edge_config_dir_list[i]) + '/'
-
-            try:
-                mkdir(ent_edge_config_dir)
-            except FileExistsError:
-                pass
-
-        for each in edge_configs:
-            each_sanitised = self.__name_sanitised(each)
-            with open(ent_edge_config_dir + each_sanitised + '.json',
-            'w') as f:
-                f.write(json.dumps(edge_configs[each]))
-
-    def write_ent_events(self, events):
-        '''
-        Write each of the event in a JSON file named 'events' in
-        a directory by the name of the sanitised enterpriseName.
-        Each event will be logged in a new line in the JSON file.
-        .
-        └── enterpriseName/
-            └── events.json
-        '''
-        if events:
-            ent_name_sanitised = self.__name_sanitised(self.ent_name)
-            ent_event_dir = path[0] + '/' + ent_name_sanitised + '/'
-            ent_event_file_name = 'events'
-
-            try:
-                mkdir(ent_event_dir)
-            except FileExistsError:
-                pass
-
-            event = ''
-            for each in events:
-                event += json.dumps(each) + '\n'
-
-            with open(ent_event_dir + ent_event_file_name + '.json',
-            'a') as f:
-                f.write(event)
+import time
+import datetime
+import json
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from vco_api_client import vco_api_client, vco_api_error
+from vco_api_cache import vco_api_topology_cache
+from vco_api_parser import WAN_QUALITY, parse_timestamp_e
+from vco_api_event_store import vco_api_event_store
+from vco_api_config_store import vco_api_config_store
+from vco_api_telemetry import vco_api_telemetry
+from vco_api_file import open_atomic
+from sys import path
+from os import mkdir, environ
+from dotenv import load_dotenv, find_dotenv
+from textwrap import dedent
+
+logger = logging.getLogger(__name__)
+
+class vco_api_main():
+    INTERVAL_SECS = 300
+    '''
+    300 seconds i.e. 5 minutes interval as default for API calls
+    '''
+
+    INTERVAL_SECS_METRICS = 3600
+    '''
+    3600 seconds i.e. 60 minutes interval as default for the
+    aggregate Edge transport metrics call
+    '''
+
+    VCO_THRESHOLD = 600
+    '''
+    600 seconds i.e. 10 minutes for data is often not reflected in API
+    output for up 10 minutes as per the API documentation
+    https://code.vmware.com/apis/1045/velocloud-sdwan-vco-api
+    '''
+
+    MAX_WORKERS = 8
+    '''
+    8 concurrent API calls at most as default when polling all the
+    Edges, which may be overridden with VCO_MAX_WORKERS in the .env
+    '''
+
+    MAX_CALLS_PER_SEC = 10
+    '''
+    10 API calls per second at most as default across all the
+    concurrent calls, which may be overridden with
+    VCO_MAX_CALLS_PER_SEC in the .env
+    '''
+
+    CONNECT_TIMEOUT_SECS = 5
+    '''
+    5 seconds as default to connect to the VCO, which may be
+    overridden with VCO_CONNECT_TIMEOUT in the .env
+    '''
+
+    READ_TIMEOUT_SECS = 60
+    '''
+    60 seconds as default for the VCO to respond, which may be
+    overridden with VCO_READ_TIMEOUT in the .env
+    '''
+
+    MAX_RETRIES = 3
+    '''
+    3 retries at most as default of an API call on a transient error,
+    which may be overridden with VCO_MAX_RETRIES in the .env
+    '''
+
+    BATCH_SIZE = 0
+    '''
+    0 i.e. no JSON-RPC batch as default for the per Edge API calls,
+    which may be overridden with VCO_BATCH_SIZE in the .env to send
+    up to that many calls in one batch
+    '''
+
+    TOPOLOGY_TTL_SECS = 3600
+    '''
+    3600 seconds i.e. 60 minutes as default for the enterprise
+    and its Edges to be read from the topology cache instead of the
+    API, which may be overridden with VCO_TOPOLOGY_TTL in the .env
+    '''
+
+    OPERATOR_PROCESSES = 0
+    '''
+    0 i.e. as many worker processes as there are CPUs as default in
+    operator mode, which may be overridden with VCO_OPERATOR_PROCESSES
+    in the .env
+    '''
+
+    OPERATOR_MAX_CALLS_PER_SEC = 0
+    '''
+    0 i.e. no limit as default on the API calls per second across all
+    the enterprises in operator mode, which may be overridden with
+    VCO_OPERATOR_MAX_CALLS_PER_SEC in the .env
+    '''
+
+    STD_FACTOR = 2
+    '''
+    2 standard deviations above the mean of the historical baseline
+    as default for a present mean to be an anomaly, which may be
+    overridden with VCO_STD_FACTOR in the .env
+    '''
+
+    BASELINE_HALF_LIFE_SECS = 0
+    '''
+    0 i.e. all the samples of equal weight as default in the running
+    baseline of the online detector, which may be overridden with
+    VCO_BASELINE_HALF_LIFE in the .env for the weight of a sample to
+    halve with every so many seconds of age
+    '''
+
+    PREFILTER_RATIO = 0.1
+    '''
+    10% above the aggregate of the interval before as default for an
+    aggregate of the present interval to pass the prefilter, which may
+    be overridden with VCO_PREFILTER_RATIO in the .env
+    '''
+
+    PREFILTER_MAX_STALENESS_SECS = 1800
+    '''
+    1800 seconds i.e. 30 minutes as default at most between two polls
+    of an Edge screened out by the prefilter, which may be overridden
+    with VCO_PREFILTER_MAX_STALENESS in the .env
+    '''
+
+    STREAM_CHUNK_EDGES = 64
+    '''
+    64 Edges at a time as default polled and looked into in streaming
+    mode, which may be overridden with VCO_STREAM_CHUNK in the .env
+    '''
+
+    DETECT_MODES = ('separate', 'combined', 'stream', 'sample_cache',
+                    'adaptive', 'history_store', 'online', 'seasonal')
+    '''
+    The modes of detect_wan_anomaly, i.e. how the samples of the two
+    timeframes are polled and kept or how the baseline is kept
+    '''
+
+    PREFILTER_MODES = ('separate', 'combined', 'stream', 'sample_cache',
+                       'adaptive')
+    '''
+    The modes of detect_wan_anomaly that poll only the Edges looked into
+    hence combine with the prefilter, unlike those that keep the
+    samples or the baseline of every Edge
+    '''
+
+    WAN_QUALITY_NAME = {
+        'latencyMsTx': 'Latency (upload, ms)',
+        'latencyMsRx': 'Latency (download, ms)',
+        'jitterMsTx': 'Jitter (upload, ms)',
+        'jitterMsRx': 'Jitter (download, ms)',
+        'lossPctTx': 'Packet Loss (upload, %)',
+        'lossPctRx': 'Packet Loss (download, %)'
+    }
+    '''
+    Human readable WAN quality names by their keys
+    '''
+
+    def __init__(self, refresh_topology = False, enterprise = None):
+        if load_dotenv(find_dotenv()) == False \
+        and 'VCO_HOSTNAME' not in environ:
+            '''
+            Raise a system exit on error reading environment variables
+            with python-dotenv, unless they are set in the environment
+            already e.g. by the container runtime
+            '''
+            raise SystemExit('Problem locating the .env file')
+
+        '''
+        Read the environment variables for the parameters
+        needed for the VCO client authentication
+        '''
+        try:
+            hostname = environ['VCO_HOSTNAME']
+        except KeyError:
+            # Raise a system exit on error reading the hostname
+            raise SystemExit('VCO_HOSTNAME is not found in the .env')
+
+        try:
+            token = environ['VCO_TOKEN']
+        except KeyError:
+            token = None
+            try:
+                # Read username and password if a token is not found
+                username = environ['VCO_USERNAME']
+                password = environ['VCO_PASSWORD']
+            except KeyError:
+                # Raise a system exit on error reading the parameters
+                raise SystemExit(dedent('''\
+                Neither the VCO_TOKEN nor the VCO_USERNAME and
+                VCO_PASSWORD is found in the .env
+                ''').replace('\n', ' '))
+
+        '''
+        Read the optional environment variables for the concurrency,
+        the rate limit and the transport of the API calls, for the
+        topology cache, and for the detection of WAN anomaly
+        '''
+        self.max_workers = self.__get_environ_number('VCO_MAX_WORKERS',
+                            self.MAX_WORKERS, int)
+        self.max_calls_per_sec = self.__get_environ_number(
+                                    'VCO_MAX_CALLS_PER_SEC',
+                                    self.MAX_CALLS_PER_SEC)
+        topology_ttl = self.__get_environ_number('VCO_TOPOLOGY_TTL',
+                        self.TOPOLOGY_TTL_SECS)
+        timeout = (self.__get_environ_number('VCO_CONNECT_TIMEOUT',
+                    self.CONNECT_TIMEOUT_SECS),
+                   self.__get_environ_number('VCO_READ_TIMEOUT',
+                    self.READ_TIMEOUT_SECS))
+        max_retries = self.__get_environ_number('VCO_MAX_RETRIES',
+                        self.MAX_RETRIES, int)
+        self.batch_size = self.__get_environ_number('VCO_BATCH_SIZE',
+                            self.BATCH_SIZE, int)
+        self.std_factor = self.__get_environ_number('VCO_STD_FACTOR',
+                            self.STD_FACTOR)
+        self.baseline_half_life = self.__get_environ_number(
+                                    'VCO_BASELINE_HALF_LIFE',
+                                    self.BASELINE_HALF_LIFE_SECS)
+        self.prefilter_ratio = self.__get_environ_number(
+                                'VCO_PREFILTER_RATIO',
+                                self.PREFILTER_RATIO)
+        self.prefilter_max_staleness = self.__get_environ_number(
+                                        'VCO_PREFILTER_MAX_STALENESS',
+                                        self.PREFILTER_MAX_STALENESS_SECS)
+        self.stream_chunk = max(1, self.__get_environ_number(
+                                    'VCO_STREAM_CHUNK',
+                                    self.STREAM_CHUNK_EDGES, int))
+        compress = environ.get('VCO_COMPRESS', '').lower() \
+                    in ('1', 'true', 'yes')
+
+        '''
+        Read the optional environment variables for the operator mode,
+        in which the VCO is logged in to as an operator and each of the
+        given enterprise, a dictionary of its id and name, is served
+        by an object of its own
+        '''
+        self.is_operator = environ.get('VCO_OPERATOR', '').lower() \
+                            in ('1', 'true', 'yes')
+        self.operator_processes = self.__get_environ_number(
+                                    'VCO_OPERATOR_PROCESSES',
+                                    self.OPERATOR_PROCESSES, int)
+        self.operator_max_calls_per_sec = self.__get_environ_number(
+                                            'VCO_OPERATOR_MAX_CALLS_PER_SEC',
+                                            self.OPERATOR_MAX_CALLS_PER_SEC)
+        self.enterprise = enterprise
+
+        '''
+        Tie the topology cache to the VCO and the credentials, with
+        the token hashed so that it is not written to disk
+        '''
+        identity = hostname + '/' + (username if token is None else
+                    hashlib.sha256(token.encode()).hexdigest())
+        topology_cache_file = '/topology_cache.json'
+        if enterprise is not None:
+            identity += '/%s' % enterprise['id']
+            topology_cache_file = '/topology_cache-%s.json' % enterprise['id']
+        self.topology_cache = vco_api_topology_cache(
+                                path[0] + topology_cache_file,
+                                identity, topology_ttl)
+
+        '''
+        Initiate the VCO client object with the API token or
+        authenticate it with the username and password if a token
+        is not found
+        '''
+        self.client = vco_api_client(hostname,
+                        calls_per_sec=self.max_calls_per_sec,
+                        pool_size=self.max_workers, timeout=timeout,
+                        max_retries=max_retries, compress=compress,
+                        batch_size=self.batch_size)
+        self.sample_cache = None
+        self.online_detector = None
+        self.poll_scheduler = None
+        self.edges_polled = None
+        self.notifier = None
+
+        '''
+        Record the latency, the bytes and the retries of the API calls,
+        the time taken by each phase of a cycle and the number of Edges,
+        WAN and samples processed, with the enterprise as a label in
+        operator mode, and serve them on VCO_METRICS_PORT should it be
+        set, unless as an operator with no enterprise given
+        '''
+        self.telemetry = vco_api_telemetry({ 'enterprise':
+                            enterprise['name'] } if enterprise else None)
+        self.client.telemetry = self.telemetry
+        metrics_port = self.__get_environ_number('VCO_METRICS_PORT', 0, int)
+        if metrics_port and enterprise is None:
+            self.telemetry.serve(metrics_port)
+        self.metrics = None
+        try:
+            if token:
+                self.client.token_auth(token)
+            else:
+                '''
+                Reuse the session of the previous run should it be
+                saved to disk instead of authenticating on every run
+                '''
+                self.client.cookies_auth(username, password,
+                    is_operator=self.is_operator,
+                    session_file=path[0] + '/session_cookie.json')
+
+            '''
+            Read and initiate the time now
+            '''
+            self.refresh_time()
+
+            '''
+            Read and set the enterprise and its Edges from the topology
+            cache, or from the API should the cache be expired or a
+            refresh be forced, unless as an operator with no enterprise
+            given, in which case the object serves to list them only
+            '''
+            if not self.is_operator or enterprise is not None:
+                self.refresh_topology(force = refresh_topology)
+        except vco_api_error as e:
+            # Raise a system exit on error starting up
+            raise SystemExit(str(e))
+
+    def __get_environ_number(self, name, default, cast = float):
+        '''
+        Return the number in the optional environment variable of
+        the given name, or the default should it not be found
+        '''
+        try:
+            return cast(environ.get(name, default))
+        except ValueError:
+            # Raise a system exit on error parsing the parameter
+            raise SystemExit('%s in the .env must be a number' % name)
+
+    def refresh_time(self):
+        '''
+        Read and set the time now minus the VCO API delay threshold
+        for the next round of API calls
+        '''
+        self.time_now = self.__update_time()
+
+    def refresh_topology(self, force = False):
+        '''
+        Read and set the enterpriseName and enterpriseId from
+        a call to the monitoring/getAggregateEdgeLinkMetrics, and
+        the edgeId from a call to the enterprise/getEnterpriseEdges,
+        unless the topology cache is fresh and a refresh is not forced
+        '''
+        if not force:
+            topology = self.topology_cache.load()
+            if topology:
+                self._set_topology(topology)
+                return
+
+        self.metrics = self._get_aggre_metrics(self.INTERVAL_SECS_METRICS)
+        if self.enterprise is None:
+            self.ent_name = self._get_ent_name(self.metrics)
+            self.ent_id = self._get_ent_id(self.metrics)
+        else:
+            self.ent_name = self.enterprise['name']
+            self.ent_id = self.enterprise['id']
+
+        self.ent_edge = self._get_ent_edge()
+        self.edge_id = self._get_edge_id(self.ent_edge)
+
+        topology = self._get_topology()
+        self._set_topology(topology)
+        self.topology_cache.save(topology)
+
+    def _get_topology(self):
+        '''
+        Return the enterprise, the ID and name of its Edges and the
+        names of the WAN by their ID for the topology cache
+        '''
+        edges = []
+        for edge in self.ent_edge:
+            try:
+                edges.append({ 'id': edge['id'], 'name': edge['name'] })
+            except KeyError:
+                pass
+
+        wan_name = {}
+        for link in self.metrics:
+            try:
+                wan_name[link['linkLogicalId']] = link['link']['displayName']
+            except (KeyError, TypeError):
+                pass
+
+        return { 'ent_id': self.ent_id,
+                 'ent_name': self.ent_name,
+                 'ent_edge': edges,
+                 'wan_name': wan_name }
+
+    def _set_topology(self, topology):
+        '''
+        Set the enterprise and its Edges given a topology, and build
+        the indexes of the Edge and WAN names by their ID once
+        '''
+        self.ent_id = topology['ent_id']
+        self.ent_name = topology['ent_name']
+        self.ent_edge = topology['ent_edge']
+        self.edge_id = self._get_edge_id(self.ent_edge)
+        self.edge_name = { edge['id']: edge['name']
+                           for edge in self.ent_edge }
+        self.wan_name = topology['wan_name']
+
+    def __update_time(self):
+        '''
+        Return the time now minus the VCO API delay
+        threshold in epoch
+        '''
+        time_now = int(time.time() - self.VCO_THRESHOLD)
+        return time_now
+
+    def __name_sanitised(self, name):
+        '''
+        Replace non-alphanumeric character in string with a dash
+        for sanitisation
+        '''
+        return ''.join([c if c.isalnum() else '-' for c in name])
+
+    def _get_ent_dir(self):
+        '''
+        Create should it not exist and return the directory named
+        by the sanitised enterpriseName
+        '''
+        ent_dir = path[0] + '/' + self.__name_sanitised(self.ent_name) + '/'
+        try:
+            mkdir(ent_dir)
+        except FileExistsError:
+            pass
+        return ent_dir
+
+    def _get_interval_e(self, interval_sec = None, time_offset = None):
+        '''
+        Return the start and end time given the time now minus the
+        VCO API delay threshold in epoch and in milliseconds, with a
+        default 5-minute interval unless otherwise specified, and
+        offset into the past by a number of seconds if specified.
+        No state is altered hence it is safe to call from concurrent
+        threads.
+        '''
+        if interval_sec is None:
+            interval_sec = self.INTERVAL_SECS
+        if time_offset is None:
+            time_offset = 0
+        time_end_e = (self.time_now - int(time_offset)) * 1000
+        time_start_e = time_end_e - int(interval_sec) * 1000
+        return { 'start': time_start_e, 'end': time_end_e }
+
+    def _get_time_e(self, interval_sec = None):
+        '''
+        Read the time now minus the VCO API delay threshold and
+        set the start and end time accirdingly in epoch and in
+        milliseconds with a default 5-minute interval unless
+        otherwise specified
+        '''
+        interval = self._get_interval_e(interval_sec)
+        self.time_end_e = interval['end']
+        self.time_start_e = interval['start']
+
+    def _get_interval(self, interval_sec = None):
+        '''
+        Return the start and end time given the time now minus the
+        VCO API delay threshold in UTC and in ISO 8601 format with
+        a default 5-minute interval unless otherwise specified,
+        without altering any state
+        '''
+        if interval_sec is None:
+            interval_sec = self.INTERVAL_SECS
+        return { 'start': datetime.datetime.utcfromtimestamp(
+                            self.time_now - int(interval_sec)).isoformat(),
+                 'end': datetime.datetime.utcfromtimestamp(
+                            self.time_now).isoformat() }
+
+    def _get_time(self, interval_sec = None):
+        '''
+        Read the time now minus the VCO API delay threshold and
+        set the start and end time in UTC and in ISO 8601 format
+        with a default 5-minute interval unless otherwise specified
+        '''
+        interval = self._get_interval(interval_sec)
+        self.time_end = interval['end']
+        self.time_start = interval['start']
+
+    def _get_aggre_metrics(self, interval_sec, time_offset = None):
+        '''
+        Poll and return the aggregate Edge transport metrics
+        of all the Edges given a specified time interval, offset
+        into the past by a number of seconds if specified
+        '''
+        parameters = { 'interval': self._get_interval_e(interval_sec,
+                                                        time_offset) }
+        if self.enterprise is not None:
+            # Narrow the metrics down to the enterprise as an operator
+            parameters['enterprises'] = [self.enterprise['id']]
+        try:
+            metrics = self.client.call_api(
+                    'monitoring/getAggregateEdgeLinkMetrics', parameters)
+        except vco_api_error as e:
+            # Raise a system exit on error polling the metrics
+            raise SystemExit(str(e))
+        return metrics
+
+    def get_enterprises(self):
+        '''
+        Poll and return the id and name of all the enterprises on the
+        VCO as a list of dictionaries, which requires an operator login
+        '''
+        try:
+            network_ent = self.client.call_api(
+                            'network/getNetworkEnterprises', {})
+        except vco_api_error as e:
+            # Raise a system exit on error polling the enterprises
+            raise SystemExit(str(e))
+
+        enterprises = []
+        for each in network_ent:
+            try:
+                enterprises.append({ 'id': each['id'],
+                                     'name': each['name'] })
+            except (KeyError, TypeError):
+                pass
+
+        if enterprises:
+            return enterprises
+        else:
+            raise SystemExit('No enterprise is found in getNetworkEnterprises')
+
+    def _get_ent_id(self, metric):
+        '''
+        Return the enterpriseId
+        '''
+        try:
+            return metric[0]['link']['enterpriseId']
+        except KeyError:
+            # Raise a system exit on error reading the enterpriseId
+            raise SystemExit('enterpriseID is not found in metric')
+        except IndexError:
+            # Raise a system exit on error locating the enterpriseId
+            raise SystemExit('enterpriseID cannot be located in metric')
+        except TypeError:
+            # Raise a system exit on error accessing metric
+            raise SystemExit('Problem accessing metric')
+
+    def _get_ent_edge(self):
+        '''
+        Poll and return details of all the Edges given the enterpriseId
+        '''
+        try:
+            ent_edge = self.client.call_api(
+                    'enterprise/getEnterpriseEdges', {
+                        'enterpriseId': self.ent_id,
+                    })
+        except vco_api_error as e:
+            # Raise a system exit on error polling the Edges
+            raise SystemExit(str(e))
+        return ent_edge
+
+    def _get_edge_id(self, ent_edge):
+        '''
+        Return a list of the edgeId for all the Edges given
+        '''
+        edge_list = []
+        for each in ent_edge:
+            try:
+                if isinstance(each['id'], int):
+                    edge_list.append(each['id'])
+            except KeyError:
+                pass
+
+        if edge_list:
+            return list(set(edge_list))
+        else:
+            # Raise a system exit on error reading the edgeID
+            raise SystemExit('No edgeID is found in ent_edge')
+
+    def _get_ent_name(self, metric):
+        '''
+        Return the enterpriseName
+        '''
+        try:
+            return metric[0]['link']['enterpriseName']
+        except KeyError:
+            # Raise a system exit on error reading the enterpriseName
+            raise SystemExit('enterpriseName is not found in metric')
+        except IndexError:
+            # Raise a system exit on error locating the enterpriseName
+            raise SystemExit('enterpriseName cannot be located in metric')
+        except TypeError:
+            # Raise a system exit on error accessing metric
+            raise SystemExit('Problem accessing metric')
+
+    def _get_edge_name(self, edge_id, ent_edge = None):
+        '''
+        Return the Edge name given its ID, from the index of the
+        Edge names unless a list of Edges is given
+        '''
+        if ent_edge is None:
+            # Return the Edge ID instead if the name is not found
+            return self.edge_name.get(edge_id, edge_id)
+        try:
+            for edge in ent_edge:
+                if edge['id'] == edge_id:
+                    return edge['name']
+        except KeyError:
+            pass
+        # Return the Edge ID instead if the name is not found
+        return edge_id
+
+    def _get_wan_name(self, link_id, metrics = None):
+        '''
+        Return the WAN name given its ID, from the index of the WAN
+        names unless the aggregate metrics are given
+        '''
+        if metrics is None:
+            # Return the link ID instead if the name is not found
+            return self.wan_name.get(link_id, link_id)
+        try:
+            for link in metrics:
+                if link['linkLogicalId'] == link_id:
+                    return link['link']['displayName']
+        except KeyError:
+            pass
+        # Return the link ID instead if the name is not found
+        return link_id
+
+    def _get_wan_quality_name(self, quality):
+        '''
+        Return a human readable WAN qaulity name given its key
+        '''
+        # Return the WAN qaulity key instead if the name is not found
+        return self.WAN_QUALITY_NAME.get(quality, quality)
+
+    def _map_edge(self, func, edges = None):
+        '''
+        Call the given function with each of the edgeId, all the
+        Edges by default, on a pool of up to max_workers threads and
+        return the edgeId and the results as a list of tuples in the
+        order of the Edges given regardless of the completion order.
+        An Edge whose API call fails is logged and left out so that
+        the others are unaffected.
+        '''
+        if edges is None:
+            edges = self.edge_id
+
+        def func_edge(edge):
+            try:
+                return True, func(edge)
+            except vco_api_error as e:
+                logger.warning('Skipping Edge %s: %s',
+                    self._get_edge_name(edge), e)
+                return False, None
+
+        if self.max_workers <= 1 or len(edges) <= 1:
+            results = [func_edge(edge) for edge in edges]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers,
+            len(edges))) as executor:
+                results = list(executor.map(func_edge, edges))
+
+        return [(edge, result) for edge, (ok, result)
+                in zip(edges, results) if ok]
+
+    def _call_api_edge(self, path, parameters, edges = None):
+        '''
+        Call the given path for each of the edgeId, all the Edges by
+        default, with the parameters returned by the given function
+        of the edgeId, and return the edgeId and the results as a
+        list of tuples in the order of the Edges given. The calls are
+        sent in JSON-RPC batches should batch_size be more than one,
+        or concurrently one by one otherwise. An Edge whose API call
+        fails is logged and left out so that the others are unaffected.
+        '''
+        if edges is None:
+            edges = self.edge_id
+        if not edges:
+            return []
+
+        if self.batch_size <= 1:
+            return self._map_edge(lambda edge:
+                    self.client.call_api(path, parameters(edge)), edges)
+
+        results = self.client.call_api_batch(
+                    [(path, parameters(edge)) for edge in edges])
+        edge_results = []
+        for edge, result in zip(edges, results):
+            if isinstance(result, vco_api_error):
+                logger.warning('Skipping Edge %s: %s',
+                    self._get_edge_name(edge), result)
+            else:
+                edge_results.append((edge, result))
+        return edge_results
+
+    def __get_wan_quality_params(self, edge_id, min_per_sample, interval,
+    indiv_score = True):
+        '''
+        Return the parameters to poll the quality of the WAN
+        associated with an Edge given its ID and a specified
+        time interval
+        '''
+        return {
+            'enterpriseId': self.ent_id,
+            'edgeId': edge_id,
+            'interval': interval,
+            'minutesPerSample': min_per_sample,
+            'individualScores': indiv_score
+        }
+
+    def _parse_wan_quality(self, wan_quality):
+        '''
+        Return the quality of each of the WAN in the given
+        linkQualityEvent/getLinkQualityEvents result as columns
+        of typed NumPy arrays
+        '''
+        # Import NumPy on first use rather than on every start
+        from vco_api_parser import parse_link_quality
+        with self.telemetry.timer('vco_api_phase_seconds', phase='parse'):
+            return parse_link_quality(wan_quality)
+
+    def _poll_wan_quality_edge(self, min_per_sample,
+    interval_sec = None, time_offset = None, edges = None):
+        '''
+        Return the quality of the WAN associated with
+        all the Edges, or with the given ones only, given
+        a specified time interval as columns of typed NumPy
+        arrays, polling the Edges concurrently or in batches,
+        with the Edges of no WAN quality left out
+        '''
+        interval = self._get_interval_e(interval_sec, time_offset)
+        wan_quality_edge = self._call_api_edge(
+                            'linkQualityEvent/getLinkQualityEvents',
+                            lambda edge: self.__get_wan_quality_params(
+                                edge, min_per_sample, interval), edges)
+
+        wan_quality = {}
+        for edge, result in wan_quality_edge:
+            wan = self._parse_wan_quality(result)
+            if wan:
+                wan_quality[edge] = wan
+        return wan_quality
+
+    def _get_wan_quality_edge(self, min_per_sample,
+    interval_sec = None, time_offset = None, edges = None):
+        '''
+        Return the quality of the WAN associated with
+        all the Edges, or with the given ones only, as with
+        _poll_wan_quality_edge, should any be found
+        '''
+        if edges is None:
+            edges = self.edge_id
+        wan_quality = self._poll_wan_quality_edge(min_per_sample,
+                        interval_sec, time_offset, edges)
+
+        if wan_quality or not edges:
+            return wan_quality
+        else:
+            # Raise a system exit on error reading the WAN quality
+            raise SystemExit('Of all the Edges no WAN quality is found')
+
+    def _get_wan_quality_dataframe(self, min_per_sample,
+    interval_sec = None, time_offset = None):
+        '''
+        Return the quality of the WAN associated with
+        all the Edges given a specified time interval
+        as pandas DataFrames
+        '''
+        # Import pandas only should the DataFrames be asked for
+        import pandas as pd
+        wan_quality = self._get_wan_quality_edge(min_per_sample,
+                        interval_sec, time_offset)
+        return { edge: { wan: pd.DataFrame(wan_quality[edge][wan])
+                         for wan in wan_quality[edge] }
+                 for edge in wan_quality }
+
+    def _split_wan_quality(self, wan_quality, time_split_e):
+        '''
+        Split the quality of the WAN associated with all the Edges
+        by timestamp into the samples at or after the given time
+        in epoch and in milliseconds, and those before it
+        '''
+        wan_quality_after = {}
+        wan_quality_before = {}
+        for edge in wan_quality:
+            for wan in wan_quality[edge]:
+                columns = wan_quality[edge][wan]
+                after = columns['timestamp'] >= time_split_e
+                if after.any():
+                    wan_quality_after.setdefault(edge, {})[wan] = {
+                        quality: columns[quality][after]
+                        for quality in columns }
+                if not after.all():
+                    wan_quality_before.setdefault(edge, {})[wan] = {
+                        quality: columns[quality][~after]
+                        for quality in columns }
+        return wan_quality_after, wan_quality_before
+
+    def _get_wan_quality_cached(self, min_per_sample,
+    interval_sec_present, interval_sec_hist, edges = None):
+        '''
+        Return the quality of the WAN associated with all the Edges,
+        or with the given ones only, for both the present and the
+        historical interval as with _get_wan_quality_split, but poll
+        each Edge only for the samples newer than those kept in the
+        rolling window cache from the previous run. An Edge is polled
+        in full should it be absent from the cache, should its latest
+        cached sample have fallen out of the window, or should a gap
+        be found between the cached and the newly polled samples.
+        '''
+        if self.sample_cache is None \
+        or self.sample_cache.ent_id != self.ent_id \
+        or self.sample_cache.min_per_sample != min_per_sample:
+            from vco_api_cache import vco_api_sample_cache
+            self.sample_cache = vco_api_sample_cache(
+                self._get_ent_dir() + 'wan_quality_cache.npz',
+                self.ent_id, min_per_sample)
+            self.sample_cache.load()
+        cache = self.sample_cache
+
+        interval_full = self._get_interval_e(
+                            interval_sec_present + interval_sec_hist)
+
+        '''
+        Poll each Edge from its latest cached sample onwards,
+        inclusive, to stay on the same sampling grid and to refresh
+        the latest sample, or over the full interval otherwise
+        '''
+        if edges is None:
+            edges = self.edge_id
+        interval_edge = {}
+        for edge in edges:
+            time_last_e = cache.get_time_last_e(edge)
+            if time_last_e is not None \
+            and time_last_e >= interval_full['start']:
+                interval_edge[edge] = { 'start': time_last_e,
+                                        'end': interval_full['end'] }
+            else:
+                interval_edge[edge] = interval_full
+
+        edge_full = []
+        for edge, result in self._call_api_edge(
+        'linkQualityEvent/getLinkQualityEvents',
+        lambda edge: self.__get_wan_quality_params(edge, min_per_sample,
+            interval_edge[edge]), edges):
+            wan = self._parse_wan_quality(result)
+            if interval_edge[edge] is interval_full:
+                cache.replace(edge, wan)
+            elif cache.is_gap(edge, wan, interval_full['end']):
+                edge_full.append(edge)
+            else:
+                cache.update(edge, wan)
+
+        '''
+        Poll the Edges with a gap over the full interval
+        '''
+        for edge, result in self._call_api_edge(
+        'linkQualityEvent/getLinkQualityEvents',
+        lambda edge: self.__get_wan_quality_params(edge, min_per_sample,
+            interval_full), edge_full):
+            cache.replace(edge, self._parse_wan_quality(result))
+        cache.expire(interval_full['start'], self.edge_id)
+        cache.save()
+
+        wan_quality = {}
+        for edge in edges:
+            wan = cache.get(edge)
+            if wan:
+                wan_quality[edge] = wan
+
+        if not wan_quality and edges:
+            # Raise a system exit on error reading the WAN quality
+            raise SystemExit('Of all the Edges no WAN quality is found')
+
+        time_split_e = (self.time_now - int(interval_sec_present)) * 1000
+        return self._split_wan_quality(wan_quality, time_split_e)
+
+    def _get_aggre_quality(self, metrics):
+        '''
+        Return the aggregate WAN quality of each of the links in the
+        given aggregate Edge transport metrics by link, the best
+        latency, jitter and packet loss reported for each, with None
+        for those not reported, and the Edge of each link by link
+        '''
+        aggre_quality = {}
+        link_edge = {}
+        for link in metrics:
+            try:
+                wan = link['linkLogicalId']
+                link_edge[wan] = link['link']['edgeId']
+            except (KeyError, TypeError):
+                continue
+            quality = {}
+            for key in WAN_QUALITY:
+                value = link.get('best' + key[0].upper() + key[1:])
+                quality[key] = value \
+                    if isinstance(value, (int, float)) else None
+            aggre_quality[wan] = quality
+        return aggre_quality, link_edge
+
+    def _get_candidate_edges(self, interval_sec_present):
+        '''
+        Return the Edges with a link whose aggregate latency, jitter or
+        packet loss of the present interval is more than
+        prefilter_ratio above that of an interval as long just before
+        it, from two calls for all the Edges at once rather than one
+        per Edge. A link of which either aggregate is missing passes
+        the prefilter, as does an Edge with no link in the present
+        aggregate at all, so that only the Edges found stable are left
+        out of the polls.
+        The aggregates are the best of each interval, i.e. its minimum,
+        hence those of two intervals as long, for them to be of as
+        many samples, rather than of the historical interval, the
+        minimum of which is lower for its length alone. A rise of the
+        mean that leaves the minimum as it is, e.g. of spikes between
+        good samples, does not show in them, nor does a rise too slow
+        to exceed prefilter_ratio from one interval to the next. An
+        Edge with an anomaly found in its last poll, or not polled for
+        prefilter_max_staleness seconds, hence passes the prefilter
+        regardless of its aggregates, for such an anomaly to be found
+        within that time at the latest and for one found to be
+        followed until it clears.
+        '''
+        aggre_present, link_edge = self._get_aggre_quality(
+                                    self._get_aggre_metrics(
+                                        interval_sec_present))
+        aggre_hist, _ = self._get_aggre_quality(self._get_aggre_metrics(
+                            interval_sec_present, interval_sec_present))
+
+        edges = set(self.edge_id) - set(link_edge.values())
+        for wan, present in aggre_present.items():
+            hist = aggre_hist.get(wan)
+            for key in WAN_QUALITY:
+                if hist is None or present[key] is None or hist[key] is None \
+                or present[key] > hist[key] * (1 + self.prefilter_ratio):
+                    edges.add(link_edge[wan])
+                    break
+
+        prefilter_state = self._load_prefilter_state()
+        for edge in self.edge_id:
+            time_polled, anomaly = prefilter_state.get(str(edge),
+                                                        (None, False))
+            if anomaly or time_polled is None \
+            or self.time_now - time_polled >= self.prefilter_max_staleness:
+                edges.add(edge)
+
+        return [edge for edge in self.edge_id if edge in edges]
+
+    def _load_prefilter_state(self):
+        '''
+        Return the time in epoch of the last poll of each Edge passed
+        by the prefilter and whether an anomaly was found in it, by
+        the edgeId as a string, empty should the file be absent or
+        unreadable
+        '''
+        try:
+            with open(self._get_ent_dir() + 'prefilter_state.json') as f:
+                return { edge: (time_polled, anomaly) for edge,
+                         (time_polled, anomaly) in json.load(f).items() }
+        except (OSError, AttributeError, TypeError, ValueError):
+            return {}
+
+    def _save_prefilter_state(self, edges, wan_anomalies):
+        '''
+        Record the given Edges passed by the prefilter as polled now,
+        with whether an anomaly was found in each, keeping the state of
+        the rest, and write it to disk
+        '''
+        edges_anomaly = set(str(each.edge) for each in wan_anomalies)
+        prefilter_state = self._load_prefilter_state()
+        for edge in edges:
+            prefilter_state[str(edge)] = (self.time_now,
+                                          str(edge) in edges_anomaly)
+        edges_ent = set(str(edge) for edge in self.edge_id)
+        prefilter_state = { edge: state for edge, state
+                            in prefilter_state.items() if edge in edges_ent }
+
+        with open_atomic(self._get_ent_dir() + 'prefilter_state.json') as f:
+            json.dump(prefilter_state, f)
+
+    def _get_poll_scheduler(self, min_per_sample):
+        '''
+        Return the scheduler of the polls of the Edges, initiating it
+        on first use, or should the enterprise or the sampling
+        interval change, with the optional environment variables for
+        the maximum staleness of an Edge and the budget of API calls
+        '''
+        file_name = self._get_ent_dir() + 'poll_schedule.json'
+        if self.poll_scheduler is None \
+        or self.poll_scheduler.file_name != file_name \
+        or self.poll_scheduler.min_interval_sec != min_per_sample * 60:
+            from vco_api_scheduler import vco_api_poll_scheduler
+            self.poll_scheduler = vco_api_poll_scheduler(file_name,
+                min_per_sample * 60,
+                self.__get_environ_number('VCO_POLL_MAX_STALENESS',
+                    vco_api_poll_scheduler.MAX_STALENESS_SECS),
+                self.__get_environ_number('VCO_POLL_CALLS_PER_MIN',
+                    vco_api_poll_scheduler.CALLS_PER_MIN))
+        return self.poll_scheduler
+
+    def _get_wan_quality_online(self, min_per_sample,
+    interval_sec_present, interval_sec_hist, seasonal = False):
+        '''
+        Return the quality of the WAN associated with all the Edges
+        for the present interval, and the online detector, or the
+        seasonal one should seasonal be True, with the samples before
+        the present interval folded into its running baseline. Each
+        Edge is polled only from its latest sample folded in onwards,
+        which covers the present interval and the time since the
+        previous run, or over the historical interval as well to seed
+        the baseline should the Edge be new to the detector or its
+        latest sample folded in be older still. The present samples
+        are folded in by a later run, once they are out of the present
+        interval, so that the baseline is always of the samples before
+        it.
+        '''
+        if seasonal:
+            from vco_api_detect import vco_api_seasonal_detector as \
+                detector_class
+            file_name = 'wan_quality_seasonal'
+        else:
+            from vco_api_detect import vco_api_online_detector as \
+                detector_class
+            file_name = 'wan_quality_baseline.npz'
+        if type(self.online_detector) is not detector_class \
+        or self.online_detector.ent_id != self.ent_id:
+            self.online_detector = detector_class(
+                self._get_ent_dir() + file_name, self.ent_id,
+                self.std_factor, self.baseline_half_life)
+            self.online_detector.load()
+        detector = self.online_detector
+
+        interval_full = self._get_interval_e(
+                            interval_sec_present + interval_sec_hist)
+        time_last_e = detector.get_time_last_e()
+        interval_edge = {}
+        for edge in self.edge_id:
+            if time_last_e.get(edge, -1) >= interval_full['start']:
+                interval_edge[edge] = { 'start': time_last_e[edge],
+                                        'end': interval_full['end'] }
+            else:
+                interval_edge[edge] = interval_full
+
+        wan_quality = {}
+        for edge, result in self._call_api_edge(
+        'linkQualityEvent/getLinkQualityEvents',
+        lambda edge: self.__get_wan_quality_params(edge, min_per_sample,
+            interval_edge[edge])):
+            wan = self._parse_wan_quality(result)
+            if wan:
+                wan_quality[edge] = wan
+
+        if not wan_quality:
+            # Raise a system exit on error reading the WAN quality
+            raise SystemExit('Of all the Edges no WAN quality is found')
+
+        time_split_e = (self.time_now - int(interval_sec_present)) * 1000
+        wan_quality_present, wan_quality_before = self._split_wan_quality(
+                                                    wan_quality, time_split_e)
+        detector.update(wan_quality_before)
+        detector.expire(self.edge_id)
+        detector.save()
+        return wan_quality_present, wan_quality_before, detector
+
+    def _get_history_store(self, min_per_sample):
+        '''
+        Return the WAN quality history store of the given sampling
+        interval in minutes in a directory by the name of the
+        sanitised enterpriseName
+        .
+        └── enterpriseName/
+            └── wan_quality-5min/
+                ├── index.json
+                └── edgeId/
+        '''
+        from vco_api_history_store import vco_api_history_store
+        return vco_api_history_store(self._get_ent_dir() +
+                                     'wan_quality-%gmin' % min_per_sample)
+
+    def _get_wan_quality_history(self, min_per_sample,
+    interval_sec_present, interval_sec_hist):
+        '''
+        Return the quality of the WAN associated with all the Edges
+        for both the present and the historical interval as with
+        _get_wan_quality_split, but poll each Edge only for the
+        samples newer than those in the history store, append them to
+        it, and read both intervals back from the store. An Edge is
+        polled over the full interval should it be absent from the
+        store or its latest sample stored be older still.
+        '''
+        store = self._get_history_store(min_per_sample)
+        interval_full = self._get_interval_e(
+                            interval_sec_present + interval_sec_hist)
+        time_last_e = store.get_time_last_e()
+        interval_edge = {}
+        for edge in self.edge_id:
+            if time_last_e.get(edge, -1) >= interval_full['start']:
+                interval_edge[edge] = { 'start': time_last_e[edge],
+                                        'end': interval_full['end'] }
+            else:
+                interval_edge[edge] = interval_full
+
+        for edge, result in self._call_api_edge(
+        'linkQualityEvent/getLinkQualityEvents',
+        lambda edge: self.__get_wan_quality_params(edge, min_per_sample,
+            interval_edge[edge])):
+            store.append(edge, self._parse_wan_quality(result))
+        store.save()
+
+        wan_quality = store.query_all(interval_full['start'],
+                        interval_full['end'], self.edge_id)
+        if not wan_quality:
+            # Raise a system exit on error reading the WAN quality
+            raise SystemExit('Of all the Edges no WAN quality is found')
+
+        time_split_e = (self.time_now - int(interval_sec_present)) * 1000
+        return self._split_wan_quality(wan_quality, time_split_e)
+
+    def query_ent_wan_quality(self, min_per_sample, time_start, time_end):
+        '''
+        Return the WAN quality samples of all the Edges kept in the
+        history store of the given sampling interval in minutes
+        between the given start and end time, either in epoch and in
+        milliseconds or in ISO 8601 format, as a dictionary of Edge,
+        WAN and columns of NumPy arrays, reading only the chunks of the
+        store needed rather than calling the API
+        '''
+        return self._get_history_store(min_per_sample).query_all(
+                parse_timestamp_e(time_start), parse_timestamp_e(time_end))
+
+    def _get_wan_quality_split(self, min_per_sample,
+    interval_sec_present, interval_sec_hist, edges = None):
+        '''
+        Return the quality of the WAN associated with all the Edges,
+        or with the given ones only, for both the present and the
+        historical interval with one call per Edge over the two
+        intervals combined, split locally by timestamp into the
+        present and the historical samples
+        '''
+        wan_quality = self._get_wan_quality_edge(min_per_sample,
+                        interval_sec_present + interval_sec_hist,
+                        edges = edges)
+        time_split_e = (self.time_now - int(interval_sec_present)) * 1000
+        return self._split_wan_quality(wan_quality, time_split_e)
+
+    def _detect_wan_anomaly_chunk(self, min_per_sample,
+    interval_sec_present, interval_sec_hist, edges):
+        '''
+        Poll, parse and look into the quality of the WAN associated
+        with the given Edges only, both timeframes in one call per Edge,
+        and return the anomalies found and the number of Edges, WAN and
+        samples of each interval, so that the samples are released once
+        it returns
+        '''
+        with self.telemetry.timer('vco_api_phase_seconds', phase='poll'):
+            wan_quality_present, wan_quality_hist = \
+                self._split_wan_quality(self._poll_wan_quality_edge(
+                    min_per_sample,
+                    interval_sec_present + interval_sec_hist,
+                    edges = edges),
+                    (self.time_now - int(interval_sec_present)) * 1000)
+
+        with self.telemetry.timer('vco_api_phase_seconds', phase='detect'):
+            from vco_api_detect import vco_api_anomaly_engine
+            engine = vco_api_anomaly_engine(std_factor = self.std_factor)
+            engine.add(wan_quality_present, wan_quality_hist)
+            wan_anomalies = engine.detect()
+        return wan_anomalies, \
+               self._get_wan_quality_count(wan_quality_present), \
+               self._get_wan_quality_count(wan_quality_hist)
+
+    def _iter_wan_anomaly(self, min_per_sample, interval_sec_present,
+    interval_sec_hist, edges = None):
+        '''
+        Yield the anomalies found and the number of Edges, WAN and
+        samples of each interval of all the Edges, or of the given ones
+        only, chunk by chunk of stream_chunk Edges. A chunk is polled
+        only once the one before it is consumed, and its samples are
+        released before the next one is polled, so that the memory
+        held is that of one chunk however many Edges there are. The
+        anomalies of each (Edge, WAN, WAN quality) are independent of
+        those of the others, hence the anomalies of all the chunks
+        are those of all the Edges at once, in the same order.
+        '''
+        if edges is None:
+            edges = self.edge_id
+        for i in range(0, len(edges), self.stream_chunk):
+            yield self._detect_wan_anomaly_chunk(min_per_sample,
+                    interval_sec_present, interval_sec_hist,
+                    edges[i:i + self.stream_chunk])
+
+    def _get_notifier(self):
+        '''
+        Return the notifier that sends the email notifications in the
+        background, initiating it on first use
+        '''
+        if self.notifier is None:
+            from vco_api_notifier import vco_api_notifier
+
+            '''
+            Read the environment variables for the parameters
+            needed for the email notification
+            '''
+            try:
+                email_sslp = environ['EMAIL_SSL_PORT']
+                email_smtp = environ['EMAIL_SMTP_SERVER']
+                email_sender = environ['EMAIL_SENDER']
+                email_receiver = environ['EMAIL_RECEIVER']
+                email_sender_pw = environ['EMAIL_SENDER_PASSWORD']
+            except KeyError:
+                # Raise a system exit on error reading the parameters
+                raise SystemExit(dedent('''\
+                Either one or all of EMAIL_SSL_PORT, EMAIL_SMTP_SERVER
+                EMAIL_SENDER, EMAIL_RECEIVER and EMAIL_SENDER_PASSWORD
+                is not found in the .env
+                ''').replace('\n', ' '))
+
+            self.notifier = vco_api_notifier(email_smtp, email_sslp,
+                                email_sender, email_receiver,
+                                email_sender_pw,
+                                digest_sec=self.__get_environ_number(
+                                    'EMAIL_DIGEST',
+                                    vco_api_notifier.DIGEST_SECS),
+                                telemetry=self.telemetry)
+        return self.notifier
+
+    def _email_wan_anomaly(self, email_msg):
+        '''
+        Queue an email notification given the email body to be sent
+        in the background, so that the detection does not wait on
+        the mail server
+        '''
+        self._get_notifier().notify('WAN Anomoly Alert', email_msg)
+
+    def _suppress_wan_anomaly(self, wan_anomalies):
+        '''
+        Return those of the given anomalies to be alerted, leaving out
+        those already alerted that persist, until they clear or until
+        EMAIL_COOLDOWN seconds, 3600 by default, have passed, with
+        those of the Edges left out of the last polls as they are
+        '''
+        from vco_api_notifier import vco_api_alert_suppressor
+        suppressor = vco_api_alert_suppressor(
+                        self._get_ent_dir() + 'alert_state.json',
+                        self.__get_environ_number('EMAIL_COOLDOWN',
+                            vco_api_alert_suppressor.COOLDOWN_SECS))
+        return suppressor.filter(wan_anomalies, self.time_now,
+                                 self.edges_polled)
+
+    def close(self):
+        '''
+        Send the email notifications still queued and close the
+        connection to the mail server
+        '''
+        if self.notifier is not None:
+            self.notifier.close()
+            self.notifier = None
+
+    def _get_wan_anomaly_msg(self, wan_anomaly, interval_sec_hist,
+    mode = None):
+        '''
+        Return a human readable description of the given WAN anomaly
+        found in the given mode, against the historical interval or the
+        running baseline
+        '''
+        if mode == 'seasonal':
+            baseline = 'the running baseline of the same hour of the week'
+        elif mode == 'online':
+            baseline = 'the running baseline'
+        else:
+            baseline = 'the %s minute(s) before' % \
+                       str(round(interval_sec_hist / 60, 2))
+        wan_anomaly_msg = '''\
+        %s of WAN %s between Edge %s and its associated
+        Gateway is found to be %s and is %s standard
+        deviation(s) away from the mean of %s and
+        standard deviation of %s of %s.
+        ''' % (
+        self._get_wan_quality_name(wan_anomaly.quality),
+        self._get_wan_name(wan_anomaly.wan),
+        self._get_edge_name(wan_anomaly.edge),
+        str(round(wan_anomaly.present_mean, 2)),
+        str(round(wan_anomaly.std_factor, 2)),
+        str(round(wan_anomaly.hist_mean, 2)),
+        str(round(wan_anomaly.hist_std, 2)),
+        baseline)
+
+        return dedent(wan_anomaly_msg).replace('\n', ' ')
+
+    def _get_wan_anomaly_email(self, wan_anomaly):
+        '''
+        Return the email body of the given description of the WAN
+        anomalies found as of the end of the present interval
+        '''
+        self._get_time()
+        return 'As of ' + self.time_end + ' UTC:' \
+                + '\n' \
+                + wan_anomaly
+
+    def detect_wan_anomaly(self, min_per_sample, interval_sec_present,
+    interval_sec_hist, mode = 'separate', prefilter = False, email = True):
+        '''
+        Detect WAN anomoly by comparing the means of the upload and
+        download latency, jitter and packet loss of a recent timeframe
+        to a historical baseline of given durations. Send an email
+        notification with the details should an anomoly be found.
+        The mode is one of DETECT_MODES:
+        separate polls the two timeframes in one call each per Edge.
+        combined polls both timeframes in one call per Edge and splits
+        them locally, halving the number of API calls.
+        stream polls as combined, but polls and looks into the Edges
+        stream_chunk at a time, with the samples of a chunk released
+        before the next one is polled and the anomalies collected as
+        each chunk is looked into, for a memory use that does not grow
+        with the number of Edges.
+        sample_cache polls only the samples newer than those of the
+        previous run, with the rest read from a rolling window cache
+        kept on disk.
+        adaptive polls the sample cache for the Edges due only, each
+        more often the closer it comes to an anomaly and less often the
+        longer it stays stable, within a budget of API calls.
+        history_store polls as sample_cache, but with every sample
+        polled kept in the columnar history store on disk, from which
+        the two timeframes are read.
+        online compares the present means to a running baseline kept on
+        disk and updated with the new samples only, of which
+        interval_sec_hist is the seed on the first run, for a baseline
+        of days or weeks at a constant cost per run.
+        seasonal keeps the running baseline for each hour of the week
+        apart, and compares the present interval with that of its hour,
+        of which an interval_sec_hist of a week seeds all.
+        With prefilter the aggregate metrics of all the links for the
+        present timeframe and one as long before it are polled first in
+        two calls, and only the Edges with a link whose aggregate is
+        worse in the present by more than prefilter_ratio, with an
+        anomaly found in the last poll, or not polled for
+        prefilter_max_staleness seconds are polled and looked into, in
+        any of PREFILTER_MODES. Without email no notification is sent,
+        e.g. for it to be merged with those of other enterprises. The
+        email is sent in the background, and leaves out the anomalies
+        already alerted that persist. Return all the anomalies found
+        as a list of wan_anomaly.
+        '''
+        if min(interval_sec_present, interval_sec_hist) / 60 < min_per_sample:
+            '''
+            Raise a system exit if either sampling durations
+            is smaller than the sampling interval in minutes
+            '''
+            raise SystemExit('Sampling duration is smaller than the sampling interval')
+
+        if mode not in self.DETECT_MODES:
+            # Raise a system exit on a mode unknown
+            raise SystemExit('Mode is not one of %s' %
+                             ', '.join(self.DETECT_MODES))
+
+        if prefilter and mode not in self.PREFILTER_MODES:
+            # Raise a system exit on a mode keeping all the Edges
+            raise SystemExit('The prefilter works with the modes %s only' %
+                             ', '.join(self.PREFILTER_MODES))
+
+        edges = None
+        if prefilter:
+            with self.telemetry.timer('vco_api_phase_seconds',
+            phase='prefilter'):
+                edges = self._get_candidate_edges(interval_sec_present)
+            self.telemetry.set('vco_api_edges_candidate', len(edges))
+
+        if mode == 'adaptive':
+            scheduler = self._get_poll_scheduler(min_per_sample)
+            edges_due = scheduler.pop_due(self.edge_id, self.time_now)
+            self.telemetry.set('vco_api_edges_due', len(edges_due))
+            '''
+            Leave the Edges due but found stable by the prefilter out
+            of the polls, which are scheduled again as stable Edges
+            '''
+            edges = edges_due if edges is None \
+                    else [edge for edge in edges_due if edge in set(edges)]
+
+        # None for all the Edges, for the suppression of the alerts
+        self.edges_polled = edges
+        if mode == 'stream':
+            '''
+            Collect the anomalies and the counts chunk by chunk, with
+            no more than a chunk of samples held at a time
+            '''
+            wan_anomalies = []
+            count_present = [0, 0, 0]
+            count_hist = [0, 0, 0]
+            for wan_anomalies_chunk, count_present_chunk, count_hist_chunk \
+            in self._iter_wan_anomaly(min_per_sample, interval_sec_present,
+            interval_sec_hist, edges):
+                wan_anomalies.extend(wan_anomalies_chunk)
+                count_present = [a + b for a, b
+                                 in zip(count_present, count_present_chunk)]
+                count_hist = [a + b for a, b
+                              in zip(count_hist, count_hist_chunk)]
+
+            # Raise a system exit should no WAN quality be found at all
+            if (edges is None or edges) \
+            and not (count_present[0] or count_hist[0]):
+                raise SystemExit('Of all the Edges no WAN quality is found')
+        else:
+            with self.telemetry.timer('vco_api_phase_seconds',
+            phase='poll'):
+                if mode in ('online', 'seasonal'):
+                    wan_quality_present, wan_quality_hist, detector = \
+                        self._get_wan_quality_online(min_per_sample,
+                            interval_sec_present, interval_sec_hist,
+                            mode == 'seasonal')
+                elif mode == 'history_store':
+                    wan_quality_present, wan_quality_hist = \
+                        self._get_wan_quality_history(min_per_sample,
+                            interval_sec_present, interval_sec_hist)
+                elif mode in ('sample_cache', 'adaptive'):
+                    wan_quality_present, wan_quality_hist = \
+                        self._get_wan_quality_cached(min_per_sample,
+                            interval_sec_present, interval_sec_hist, edges)
+                elif mode == 'combined':
+                    wan_quality_present, wan_quality_hist = \
+                        self._get_wan_quality_split(min_per_sample,
+                            interval_sec_present, interval_sec_hist, edges)
+                else:
+                    wan_quality_present = self._get_wan_quality_edge(
+                                            min_per_sample,
+                                            interval_sec_present,
+                                            edges = edges)
+                    wan_quality_hist = self._get_wan_quality_edge(
+                                            min_per_sample,
+                                            interval_sec_hist,
+                                            interval_sec_present, edges)
+
+            '''
+            WAN anomaly detection requires the WAN quality to be present
+            in interval_sec_hist as well as interval_sec_present for
+            obvious reason, which the engine attests to for each of the
+            WAN quality of each of the WAN of each of the Edge at once.
+            '''
+            with self.telemetry.timer('vco_api_phase_seconds',
+            phase='detect'):
+                if mode in ('online', 'seasonal'):
+                    wan_anomalies = detector.detect(wan_quality_present)
+                else:
+                    from vco_api_detect import vco_api_anomaly_engine
+                    engine = vco_api_anomaly_engine(
+                                std_factor = self.std_factor)
+                    engine.add(wan_quality_present, wan_quality_hist)
+                    wan_anomalies = engine.detect()
+
+            count_present = self._get_wan_quality_count(wan_quality_present)
+            count_hist = self._get_wan_quality_count(wan_quality_hist)
+
+        if mode == 'adaptive':
+            '''
+            Back off the Edges found stable by the prefilter, and poll
+            those due but not looked into, e.g. on a failed poll or
+            with no baseline yet, again as soon as possible
+            '''
+            deviation_edge = engine.get_deviation_edge()
+            edges_polled = set(edges)
+            for edge in edges_due:
+                scheduler.update(edge, self.time_now,
+                    deviation_edge.get(edge) if edge in edges_polled
+                    else 0, self.std_factor)
+            scheduler.save()
+
+        if prefilter:
+            self._save_prefilter_state(edges, wan_anomalies)
+
+        if email:
+            with self.telemetry.timer('vco_api_phase_seconds',
+            phase='alert'):
+                wan_anomaly = ''
+                for each in self._suppress_wan_anomaly(wan_anomalies):
+                    wan_anomaly += self._get_wan_anomaly_msg(each,
+                                    interval_sec_hist, mode) + '\n'
+                if wan_anomaly:
+                    self._email_wan_anomaly(
+                        self._get_wan_anomaly_email(wan_anomaly))
+
+        self._count_wan_quality(count_present, count_hist)
+        self.telemetry.inc('vco_api_cycles_total')
+        self.telemetry.set('vco_api_anomalies', len(wan_anomalies))
+        self._export_telemetry()
+        return wan_anomalies
+
+    def _get_wan_quality_count(self, wan_quality):
+        '''
+        Return the number of Edges, WAN and samples of the given
+        quality of the WAN associated with the Edges
+        '''
+        wan = [columns for edge in wan_quality
+               for columns in wan_quality[edge].values()]
+        return [len(wan_quality), len(wan),
+                sum(len(columns['timestamp']) for columns in wan)]
+
+    def _count_wan_quality(self, count_present, count_hist):
+        '''
+        Record the number of Edges, WAN and samples processed of
+        each interval
+        '''
+        for interval, count in (('present', count_present),
+        ('hist', count_hist)):
+            edges, wan, samples = count
+            self.telemetry.set('vco_api_edges', edges, interval=interval)
+            self.telemetry.set('vco_api_wan', wan, interval=interval)
+            self.telemetry.set('vco_api_samples', samples,
+                interval=interval)
+
+    def _export_telemetry(self):
+        '''
+        Write the telemetry in the Prometheus text format to
+        VCO_METRICS_FILE should it be set, with the enterpriseId
+        appended to the file name in operator mode
+        '''
+        metrics_file = environ.get('VCO_METRICS_FILE')
+        if not metrics_file:
+            return
+        if self.enterprise is not None:
+            metrics_file = '%s-%s.prom' % (metrics_file.rsplit('.prom', 1)[0],
+                                           self.enterprise['id'])
+        try:
+            self.telemetry.write(metrics_file)
+        except OSError as e:
+            logger.warning('Metrics failed to be written: %s', e)
+
+    def _iter_ent_pages(self, path, interval_sec = None, limit = None):
+        '''
+        Poll the given path for the enterpriseId and a specified time
+        interval, and yield the records of each page as it arrives,
+        following the nextPageLink for as long as the metaData says
+        there are more. Raise a KeyError should a page have no data,
+        and a system exit should a page fail to be polled.
+        '''
+        parameters = { 'enterpriseId': self.ent_id,
+                       'interval': self._get_interval(interval_sec) }
+        if limit is not None:
+            parameters['limit'] = limit
+
+        while True:
+            try:
+                page = self.client.call_api(path, parameters)
+            except vco_api_error as e:
+                # Raise a system exit on error polling a page
+                raise SystemExit(str(e))
+            yield from page['data']
+
+            meta = page.get('metaData') or {}
+            if not meta.get('more'):
+                return
+            if not meta.get('nextPageLink'):
+                logger.warning('%s has more records but no nextPageLink '
+                    'to follow, the records are incomplete', path)
+                return
+            parameters = { 'enterpriseId': self.ent_id,
+                           'nextPageLink': meta['nextPageLink'] }
+            if limit is not None:
+                parameters['limit'] = limit
+
+    def _iter_chunk(self, records, chunk_size = None):
+        '''
+        Yield the given records one by one, or as lists of up to
+        chunk_size records should it be given
+        '''
+        if not chunk_size:
+            yield from records
+            return
+
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def iter_ent_events(self, interval_sec = None, limit = None,
+    chunk_size = None):
+        '''
+        Poll and yield events given the enterpriseId and a specified
+        time interval page by page, one by one or in chunks of
+        chunk_size, with a flat memory footprint regardless of the
+        number of events
+        '''
+        try:
+            yield from self._iter_chunk(self._iter_ent_pages(
+                'event/getEnterpriseEvents', interval_sec, limit),
+                chunk_size)
+        except KeyError:
+            raise SystemExit('Event is not found in getEnterpriseEvents')
+
+    def iter_ent_fw_logs(self, interval_sec = None, limit = None,
+    chunk_size = None):
+        '''
+        Poll and yield firewall logs given the enterpriseId and a
+        specified time interval page by page, one by one or in chunks
+        of chunk_size, with a flat memory footprint regardless of the
+        number of firewall logs
+        '''
+        try:
+            yield from self._iter_chunk(self._iter_ent_pages(
+                'firewall/getEnterpriseFirewallLogs', interval_sec, limit),
+                chunk_size)
+        except KeyError:
+            raise SystemExit('Firewall log is not found in getEnterpriseFirewallLogs')
+
+    def get_ent_events(self, interval_sec = None):
+        '''
+        Poll and return events given the enterpriseId and a specified
+        time interval
+        '''
+        return list(self.iter_ent_events(interval_sec))
+
+    def get_ent_fw_logs(self, interval_sec = None):
+        '''
+        Poll and return firewall logs given the enterpriseId and a
+        specified time interval
+        '''
+        return list(self.iter_ent_fw_logs(interval_sec))
+
+    def get_ent_edge_config(self):
+        '''
+        Poll and return the Edge config moodule given the
+        enterpriseId and the edgeId
+        '''
+        edge_configs = {}
+        for edge, edge_config in self._call_api_edge(
+        'edge/getEdgeConfigurationStack', lambda edge: {
+            'enterpriseId': self.ent_id,
+            'edgeId': edge
+        }):
+            edge_configs[self._get_edge_name(edge)] = edge_config
+
+        if edge_configs:
+            return edge_configs
+        else:
+            raise SystemExit('No Edge config is found in getEdgeConfigurationStack')
+
+    def _get_config_store(self):
+        '''
+        Return the content-addressed config store in a directory
+        by the name of the sanitised enterpriseName
+        '''
+        return vco_api_config_store(self._get_ent_dir() + 'configs')
+
+    def write_ent_edge_config(self, edge_configs, diff = False):
+        '''
+        Write the Edge config stacks as a snapshot in the
+        content-addressed config store in a directory named by the
+        sanitised enterpriseName, and return the name of the snapshot,
+        the full date and time now. Each unique config is stored once
+        as a gzip compressed object named by its SHA-256 hash, and each
+        snapshot is a manifest of the Edge names and the hashes of their
+        configs. Should diff be True, the structural differences of the
+        config of each Edge changed since the last snapshot are written
+        as well.
+        .
+        └── enterpriseName/
+            └── configs/
+                ├── objects/
+                │   └── ab/
+                │       └── abcdef....json.gz
+                ├── manifests/
+                │   └── YYYY-MM-DD-HH-MM-SS.json
+                └── diffs/
+                    └── YYYY-MM-DD-HH-MM-SS/
+                        └── edgeName.json
+        '''
+        store = self._get_config_store()
+        return self._save_ent_edge_config_snapshot(store,
+                { each: store.put(edge_configs[each])
+                  for each in edge_configs }, diff)
+
+    def _save_ent_edge_config_snapshot(self, store, edges, diff = False):
+        '''
+        Record a snapshot of the given Edge names and config hashes
+        named by the full date and time now, write the structural
+        differences of the Edges changed since the last snapshot
+        should diff be True, and return the name of the snapshot
+        '''
+        snapshots = store.list_snapshots()
+        snapshot = store.save_manifest(edges, time.strftime(
+                    '%Y-%m-%d-%H-%M-%S', time.gmtime(self.__update_time())))
+
+        if diff and snapshots and snapshots[-1] != snapshot:
+            for each in store.changes(snapshots[-1], snapshot)['changed']:
+                store.save_diff(snapshot, self.__name_sanitised(each),
+                    store.diff(snapshots[-1], snapshot, each))
+        return snapshot
+
+    def backup_ent_edge_config(self, diff = False, max_workers = None):
+        '''
+        Poll the Edge config stack of each of the Edges and write it
+        to the content-addressed config store as a snapshot, as
+        write_ent_edge_config does, but in a pipeline. Up to
+        max_workers Edges, by default as many as the API calls to the
+        VCO are made concurrently with, are polled at once, and each
+        config is serialised and written by the worker that polled it
+        as soon as it arrives and is then dropped, so that no more than
+        max_workers configs are held in memory at once. An Edge whose
+        API call or write fails is logged and left out of the snapshot
+        without stopping the others. Return the name of the snapshot
+        and a report of each Edge as a list of dictionaries of the
+        Edge name, the config hash, the seconds taken to poll and to
+        write the config, and the error should there be one.
+        '''
+        store = self._get_config_store()
+        if max_workers is None:
+            max_workers = self.max_workers
+
+        def backup_edge(edge):
+            report = { 'edge': self._get_edge_name(edge), 'hash': None,
+                       'fetch_secs': None, 'write_secs': None,
+                       'error': None }
+            try:
+                time_start = time.monotonic()
+                edge_config = self.client.call_api(
+                    'edge/getEdgeConfigurationStack', {
+                        'enterpriseId': self.ent_id,
+                        'edgeId': edge })
+                report['fetch_secs'] = time.monotonic() - time_start
+
+                time_start = time.monotonic()
+                report['hash'] = store.put(edge_config)
+                report['write_secs'] = time.monotonic() - time_start
+            except (vco_api_error, OSError, TypeError, ValueError) as e:
+                logger.warning('Skipping the config of Edge %s: %s',
+                    report['edge'], e)
+                report['error'] = str(e)
+            return report
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers,
+        len(self.edge_id)))) as executor:
+            reports = list(executor.map(backup_edge, self.edge_id))
+
+        edges = { report['edge']: report['hash'] for report in reports
+                  if report['error'] is None }
+        if not edges:
+            raise SystemExit('No Edge config is found in getEdgeConfigurationStack')
+
+        return self._save_ent_edge_config_snapshot(store, edges, diff), \
+                reports
+
+    def get_ent_edge_config_changes(self, snapshot_a = None,
+    snapshot_b = None):
+        '''
+        Return the Edges added, removed and changed between two
+        snapshots of the Edge configs, by default the last two, by
+        comparing the manifests of the snapshots only
+        '''
+        store = self._get_config_store()
+        snapshots = store.list_snapshots()
+        if snapshot_a is None or snapshot_b is None:
+            if len(snapshots) < 2:
+                return { 'added': [], 'removed': [], 'changed': [] }
+            snapshot_a, snapshot_b = snapshots[-2], snapshots[-1]
+        return store.changes(snapshot_a, snapshot_b)
+
+    def _write_ent_records(self, records, file_name):
+        '''
+        Append each of the given records, in a list or as they are
+        yielded by a generator, as a line of JSON to the given file
+        in a directory by the name of the sanitised enterpriseName,
+        without holding more than one record in memory. The file is
+        not created should there be no record.
+        '''
+        f = None
+        try:
+            for each in records:
+                if f is None:
+                    f = open(self._get_ent_dir() + file_name, 'a')
+                f.write(json.dumps(each) + '\n')
+        finally:
+            if f is not None:
+                f.close()
+
+    def write_ent_events(self, events):
+        '''
+        Write each of the event in a JSON file named 'events' in
+        a directory by the name of the sanitised enterpriseName.
+        Each event will be logged in a new line in the JSON file.
+        The events may be given as a list or as a generator such
+        as iter_ent_events.
+        .
+        └── enterpriseName/
+            └── events.json
+        '''
+        self._write_ent_records(events, 'events.json')
+
+    def write_ent_fw_logs(self, fw_logs):
+        '''
+        Write each of the firewall log in a JSON file named 'fw_logs'
+        in a directory by the name of the sanitised enterpriseName.
+        Each firewall log will be logged in a new line in the JSON
+        file. The firewall logs may be given as a list or as a
+        generator such as iter_ent_fw_logs.
+        .
+        └── enterpriseName/
+            └── fw_logs.json
+        '''
+        self._write_ent_records(fw_logs, 'fw_logs.json')
+
+    def _get_event_store(self, name, time_field):
+        '''
+        Return the event store of the given name in a directory
+        by the name of the sanitised enterpriseName
+        '''
+        return vco_api_event_store(self._get_ent_dir() + name, name,
+                                   time_field)
+
+    def store_ent_events(self, events):
+        '''
+        Write the events, given as a list or as a generator such as
+        iter_ent_events, to the rotating and compressed event store
+        in a directory by the name of the sanitised enterpriseName,
+        and return the number of events written
+        .
+        └── enterpriseName/
+            └── events/
+                ├── events.index.json
+                └── events-YYYYMMDDHH-000001.json.gz
+        '''
+        with self._get_event_store('events', 'eventTime') as store:
+            return store.write(events)
+
+    def store_ent_fw_logs(self, fw_logs):
+        '''
+        Write the firewall logs, given as a list or as a generator
+        such as iter_ent_fw_logs, to the rotating and compressed event
+        store in a directory by the name of the sanitised
+        enterpriseName, and return the number of firewall logs written
+        .
+        └── enterpriseName/
+            └── fw_logs/
+                ├── fw_logs.index.json
+                └── fw_logs-YYYYMMDDHH-000001.json.gz
+        '''
+        with self._get_event_store('fw_logs', 'timestamp') as store:
+            return store.write(fw_logs)
+
+    def query_ent_events(self, time_start, time_end):
+        '''
+        Yield the stored events between the given start and end time,
+        either in epoch and in milliseconds or in ISO 8601 format,
+        reading only the segments of the event store needed
+        '''
+        with self._get_event_store('events', 'eventTime') as store:
+            yield from store.query(parse_timestamp_e(time_start),
+                                   parse_timestamp_e(time_end))
+
+    def query_ent_fw_logs(self, time_start, time_end):
+        '''
+        Yield the stored firewall logs between the given start and
+        end time, either in epoch and in milliseconds or in ISO 8601
+        format, reading only the segments of the event store needed
+        '''
+        with self._get_event_store('fw_logs', 'timestamp') as store:
+            yield from store.query(parse_timestamp_e(time_start),
+                                   parse_timestamp_e(time_end))
@@ -0,0 +1,242 @@
+import json
+import logging
+import queue
+import smtplib, ssl
+import threading
+import time
+from vco_api_file import open_atomic
+
+logger = logging.getLogger(__name__)
+
+class vco_api_notifier():
+    '''
+    Deliver email notifications in a background thread so that the
+    caller never waits on the mail server. Notifications are queued,
+    and those queued within digest_sec of the first are coalesced into
+    one digest email. The SMTP connection is kept open across emails
+    and reconnected should the server have closed it or should
+    sending fail, up to max_retries times with a backoff.
+    '''
+
+    DIGEST_SECS = 0
+    '''
+    0 seconds as default to wait for more notifications to coalesce
+    into a digest, i.e. only those already queued are coalesced
+    '''
+
+    MAX_RETRIES = 3
+    '''
+    3 retries at most as default of an email that fails to be sent
+    '''
+
+    BACKOFF_SECS = 5
+    '''
+    5 seconds to wait before the first retry, doubled on each retry
+    '''
+
+    def __init__(self, smtp_server, ssl_port, sender, receiver, password,
+    digest_sec = None, max_retries = None, telemetry = None):
+        '''
+        Initiate the notifier with the SMTP server, the sender and the
+        receiver, optionally with a vco_api_telemetry to record the
+        time taken to send each email, and start the background thread
+        '''
+        self.smtp_server = smtp_server
+        self.ssl_port = ssl_port
+        self.sender = sender
+        self.receiver = receiver
+        self.password = password
+        self.digest_sec = self.DIGEST_SECS \
+            if digest_sec is None else digest_sec
+        self.max_retries = self.MAX_RETRIES \
+            if max_retries is None else max_retries
+        self.ssl_context = ssl.create_default_context()
+        self.server = None
+        self.emails_sent = 0
+        self.emails_failed = 0
+        self.telemetry = telemetry
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def notify(self, subject, body):
+        '''
+        Queue an email of the given subject and body and return at once
+        '''
+        self.queue.put((subject, body))
+
+    def close(self):
+        '''
+        Send the emails still queued, stop the background thread and
+        close the SMTP connection
+        '''
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _get_batch(self):
+        '''
+        Block until a notification is queued and return it with those
+        queued within digest_sec of it, and whether to stop after
+        '''
+        first = self.queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.digest_sec
+        while True:
+            try:
+                each = self.queue.get(timeout=max(0,
+                        deadline - time.monotonic())) \
+                    if self.digest_sec else self.queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+            if each is None:
+                return batch, True
+            batch.append(each)
+
+    def _get_digest(self, batch):
+        '''
+        Return the email of the given notifications, coalesced into
+        one digest should there be more than one
+        '''
+        if len(batch) == 1:
+            subject, body = batch[0]
+        else:
+            subject = '%s (%s)' % (batch[0][0], len(batch))
+            body = '\n'.join(body for _, body in batch)
+        return 'Subject: ' + subject + '\n\n' + body
+
+    def _connect(self):
+        '''
+        Open the SMTP connection and log in
+        '''
+        self.server = smtplib.SMTP_SSL(self.smtp_server, self.ssl_port,
+                        context=self.ssl_context)
+        self.server.login(self.sender, self.password)
+
+    def _disconnect(self):
+        '''
+        Close the SMTP connection should it be open, quietly should
+        the server have closed it already
+        '''
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+    def _send(self, email_msg):
+        '''
+        Send the given email over the open SMTP connection, opening
+        it first should it not be open, and reconnecting and retrying
+        with a backoff should sending fail
+        '''
+        retry = 0
+        time_start = time.monotonic()
+        while True:
+            try:
+                if self.server is None:
+                    self._connect()
+                self.server.sendmail(self.sender, self.receiver, email_msg)
+                self.emails_sent += 1
+                if self.telemetry:
+                    self.telemetry.observe('vco_api_email_seconds',
+                        time.monotonic() - time_start)
+                    self.telemetry.inc('vco_api_emails_total',
+                        result='sent')
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                self._disconnect()
+                if retry >= self.max_retries:
+                    self.emails_failed += 1
+                    if self.telemetry:
+                        self.telemetry.inc('vco_api_emails_total',
+                            result='failed')
+                    logger.error('Email failed to be sent: %s', e)
+                    return
+                logger.warning('Email failed to be sent, retrying: %s', e)
+                time.sleep(self.BACKOFF_SECS * 2 ** retry)
+                retry += 1
+
+    def _run(self):
+        '''
+        Send the queued notifications as digests until closed
+        '''
+        stop = False
+        while not stop:
+            batch, stop = self._get_batch()
+            if batch:
+                self._send(self._get_digest(batch))
+        self._disconnect()
+
+class vco_api_alert_suppressor():
+    '''
+    Suppress the repeated alerts of a WAN anomaly, by (Edge, WAN, WAN
+    quality), for as long as it persists from one run to the next,
+    until it clears or until cooldown_sec has passed since it was last
+    alerted, and keep the state in a JSON file so that it carries over
+    from one run to the next in cron as well as in daemon mode
+    '''
+
+    COOLDOWN_SECS = 3600
+    '''
+    3600 seconds i.e. 60 minutes as default before an anomaly that
+    persists is alerted again
+    '''
+
+    def __init__(self, file_name, cooldown_sec = None):
+        '''
+        Initiate the suppressor with the state in the given file
+        '''
+        self.file_name = file_name
+        self.cooldown_sec = self.COOLDOWN_SECS \
+            if cooldown_sec is None else cooldown_sec
+
+    def _load(self):
+        '''
+        Return the time each active anomaly was last alerted by key
+        '''
+        try:
+            with open(self.file_name) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, alerted):
+        '''
+        Write the state to disk
+        '''
+        with open_atomic(self.file_name) as f:
+            json.dump(alerted, f)
+
+    def filter(self, wan_anomalies, time_now = None, edges = None):
+        '''
+        Return those of the given anomalies to be alerted, i.e. those
+        new or last alerted more than cooldown_sec before, and clear
+        the state of those no longer found, of the given Edges only
+        should only those be looked into, keeping that of the rest
+        '''
+        if time_now is None:
+            time_now = time.time()
+        alerted = self._load()
+        alerted_new = {}
+        if edges is not None:
+            edges = set(str(edge) for edge in edges)
+            alerted_new = { key: time_alerted for key, time_alerted
+                            in alerted.items()
+                            if key.split('/', 1)[0] not in edges }
+        wan_anomalies_alert = []
+        for each in wan_anomalies:
+            key = '%s/%s/%s' % (each.edge, each.wan, each.quality)
+            time_alerted = alerted.get(key)
+            if time_alerted is None \
+            or time_now - time_alerted >= self.cooldown_sec:
+                wan_anomalies_alert.append(each)
+                time_alerted = time_now
+            alerted_new[key] = time_alerted
+
+        if alerted_new != alerted:
+            self._save(alerted_new)
+        return wan_anomalies_alert
@@ -0,0 +1,186 @@
+import logging
+import time
+from os import cpu_count
+from vco_api_client import vco_api_shared_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+_worker = {}
+'''
+The class, the shared rate limiter and the objects of the enterprises
+served by a worker process, which persist across the cycles
+'''
+
+def _init_worker(cls, rate_limiter):
+    '''
+    Initiate a worker process with the class to serve each enterprise
+    with and the rate limiter shared by all the worker processes
+    '''
+    _worker['cls'] = cls
+    _worker['rate_limiter'] = rate_limiter
+    _worker['conns'] = {}
+
+def _detect_enterprise(enterprise, generation, kwargs):
+    '''
+    Detect WAN anomaly for the given enterprise in a worker process,
+    with the object kept for it by the process, or a new one should
+    the process serve it for the first time, whose topology is
+    refreshed should it be older than the given generation. Return
+    the enterprise, the anomalies found and their description, or
+    the error should the detection fail. The anomalies already alerted
+    that persist are left out of the description.
+    '''
+    try:
+        conn, conn_generation = _worker['conns'].get(enterprise['id'],
+                                                     (None, None))
+        if conn is None:
+            conn = _worker['cls'](refresh_topology = generation > 0,
+                                  enterprise = enterprise)
+            conn.client.rate_limiter_global = _worker['rate_limiter']
+        elif conn_generation < generation:
+            conn.refresh_topology(force = True)
+        _worker['conns'][enterprise['id']] = (conn, generation)
+
+        conn.refresh_time()
+        wan_anomalies = conn.detect_wan_anomaly(**dict(kwargs,
+                            email = False))
+        '''
+        Leave the state of the alerts as it is should no email be sent,
+        e.g. on a dry run, so that the next alerts are not suppressed
+        '''
+        wan_anomaly_msg = []
+        if kwargs.get('email', True):
+            wan_anomaly_msg = [conn._get_wan_anomaly_msg(each,
+                                kwargs['interval_sec_hist'],
+                                kwargs.get('mode'))
+                               for each in conn._suppress_wan_anomaly(
+                                wan_anomalies)]
+        return enterprise, wan_anomalies, wan_anomaly_msg, None
+    except (Exception, SystemExit) as e:
+        return enterprise, [], [], str(e) or type(e).__name__
+
+class vco_api_operator():
+    '''
+    Detect WAN anomaly for all the enterprises on the VCO as an
+    operator. The enterprises are spread across a pool of worker
+    processes, each with its own client, topology and detection state
+    for each of the enterprises it serves, so that a cycle takes as
+    long as the enterprises divided by the processes rather than all
+    of them in turn. The anomalies are merged centrally into a single
+    email alert. Within an enterprise the Edges are polled with up to
+    VCO_MAX_WORKERS threads and VCO_MAX_CALLS_PER_SEC calls per second,
+    and all the enterprises together are held to no more than
+    VCO_OPERATOR_MAX_CALLS_PER_SEC calls per second should it be set.
+    '''
+
+    def __init__(self, conn, refresh_topology = False, processes = None,
+    calls_per_sec = None):
+        '''
+        Initiate the operator with the given VCO object logged in as
+        an operator with no enterprise, which lists the enterprises
+        and sends the merged email alert, and whose class serves each
+        of the enterprises in the worker processes
+        '''
+        self.conn = conn
+        self.cls = type(conn)
+        if processes is None:
+            processes = conn.operator_processes
+        self.processes = processes or cpu_count() or 1
+        if calls_per_sec is None:
+            calls_per_sec = conn.operator_max_calls_per_sec
+        self.rate_limiter = vco_api_shared_rate_limiter(calls_per_sec) \
+            if calls_per_sec else None
+        self.enterprises = None
+        self.generation = 1 if refresh_topology else 0
+        self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''
+        Shut the worker processes down should they be started, and
+        send the email notifications still queued
+        '''
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.conn.close()
+
+    def refresh_time(self):
+        '''
+        Read and set the time now for the merged email alert, which
+        each worker process does as well for its enterprises
+        '''
+        self.conn.refresh_time()
+
+    def refresh_topology(self, force = False):
+        '''
+        List the enterprises on the VCO, and have the worker processes
+        refresh the topology of each of them should a refresh be forced
+        '''
+        self.enterprises = self.conn.get_enterprises()
+        if force:
+            self.generation += 1
+
+    def _get_executor(self):
+        '''
+        Return the pool of worker processes, starting it on first use
+        '''
+        if self.executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers=self.processes,
+                                initializer=_init_worker,
+                                initargs=(self.cls, self.rate_limiter))
+        return self.executor
+
+    def detect_wan_anomaly(self, **kwargs):
+        '''
+        Detect WAN anomaly for each of the enterprises with the given
+        arguments of detect_wan_anomaly in the worker processes, and
+        send one email notification with the details of all the
+        enterprises should an anomaly be found. An enterprise whose
+        detection fails is logged and left out without affecting the
+        others. Return the anomalies found as a dictionary of lists of
+        wan_anomaly by enterprise name.
+        '''
+        if self.enterprises is None:
+            self.refresh_topology()
+
+        time_start = time.monotonic()
+        executor = self._get_executor()
+        futures = [executor.submit(_detect_enterprise, enterprise,
+                    self.generation, kwargs)
+                   for enterprise in self.enterprises]
+
+        wan_anomalies = {}
+        wan_anomaly = ''
+        for future in futures:
+            enterprise, ent_anomalies, ent_anomaly_msg, error = \
+                future.result()
+            if error is not None:
+                logger.warning('Skipping enterprise %s: %s',
+                    enterprise['name'], error)
+                continue
+            wan_anomalies[enterprise['name']] = ent_anomalies
+            if ent_anomaly_msg:
+                wan_anomaly += 'Enterprise ' + enterprise['name'] + ':' \
+                                + '\n' \
+                                + '\n'.join(ent_anomaly_msg) + '\n'
+
+        if wan_anomaly and kwargs.get('email', True):
+            self.conn._email_wan_anomaly(
+                self.conn._get_wan_anomaly_email(wan_anomaly))
+
+        telemetry = self.conn.telemetry
+        telemetry.observe('vco_api_phase_seconds',
+            time.monotonic() - time_start, phase='operator')
+        telemetry.set('vco_api_enterprises', len(self.enterprises))
+        telemetry.set('vco_api_enterprises_failed',
+            len(self.enterprises) - len(wan_anomalies))
+        self.conn._export_telemetry()
+
+        return wan_anomalies
@@ -0,0 +1,81 @@
+import datetime
+from operator import itemgetter
+
+WAN_QUALITY = ('latencyMsTx', 'latencyMsRx', 'jitterMsTx', 'jitterMsRx',
+               'lossPctTx', 'lossPctRx')
+'''
+The upload and download latency, jitter and packet loss reported in
+the metadata detail of each of the linkQualityEvent samples
+'''
+
+def parse_timestamp_e(timestamp):
+    '''
+    Return the given sample timestamp in epoch and in milliseconds,
+    converting it first should it be given as an ISO 8601 date and
+    time string instead. Raise a TypeError on a bool and a ValueError
+    on a number of a fraction of a millisecond, NaN or infinity, rather
+    than truncate it into a timestamp.
+    '''
+    if isinstance(timestamp, str):
+        date_time = datetime.datetime.fromisoformat(
+                        timestamp.replace('Z', '+00:00'))
+        if date_time.tzinfo is None:
+            date_time = date_time.replace(tzinfo=datetime.timezone.utc)
+        return int(date_time.timestamp() * 1000)
+    if isinstance(timestamp, bool):
+        raise TypeError('Timestamp is a bool: %r' % timestamp)
+    if isinstance(timestamp, float) and not timestamp.is_integer():
+        raise ValueError('Timestamp is not a whole number: %r' % timestamp)
+    return int(timestamp)
+
+def parse_link_quality(wan_quality, qualities = WAN_QUALITY):
+    '''
+    Walk the result of a linkQualityEvent/getLinkQualityEvents call
+    once and return the samples of each of the WAN as columns of typed
+    NumPy arrays, the timestamps in epoch and in milliseconds as int64
+    and each of the given WAN qualities as float64, with a missing or
+    null quality as NaN. The arrays are allocated once per WAN at the
+    size of its timeseries and each sample is written straight into
+    a row of them. A malformed sample, one without a timestamp or a
+    metadata detail, or with a timestamp that is a bool or not a whole
+    number, is rejected and leaves no trace in the arrays.
+    '''
+    # Import NumPy on first use so that parse_timestamp_e does not need it
+    import numpy as np
+    get_quality = itemgetter(*qualities)
+    wan = {}
+    for wan_id in wan_quality:
+        if wan_id == 'overallLinkQuality':
+            continue
+        try:
+            timeseries = wan_quality[wan_id]['timeseries']
+            size = len(timeseries)
+        except (KeyError, TypeError):
+            continue
+
+        timestamp = np.empty(size, dtype='int64')
+        values = np.empty((size, len(qualities)), dtype='float64')
+        i = 0
+        for sample in timeseries:
+            try:
+                detail = sample['metadata']['detail']
+                time_e = sample['timestamp']
+                timestamp[i] = time_e if type(time_e) is int \
+                    else parse_timestamp_e(time_e)
+                try:
+                    # NumPy stores None as NaN
+                    values[i] = get_quality(detail)
+                except KeyError:
+                    values[i] = [detail.get(quality)
+                                 for quality in qualities]
+            except (KeyError, TypeError, ValueError, AttributeError):
+                # Reject the sample, which the next one overwrites
+                continue
+            i += 1
+
+        if i:
+            columns = { 'timestamp': timestamp[:i] }
+            for j, quality in enumerate(qualities):
+                columns[quality] = values[:i, j]
+            wan[wan_id] = columns
+    return wan
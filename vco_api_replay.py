@@ -0,0 +1,288 @@
+import argparse
+import json
+import time
+from os import cpu_count
+from vco_api_daemon import vco_api_daemon
+from vco_api_history_store import vco_api_history_store
+from vco_api_notifier import vco_api_alert_suppressor
+from vco_api_parser import WAN_QUALITY, parse_link_quality, parse_timestamp_e
+
+PARAMS = dict(min_per_sample = 5,
+    interval_sec_present = 300,
+    interval_sec_hist = 3600,
+    std_factor = 2)
+'''
+The parameters of detect_wan_anomaly as set in
+vco_api_wan_anomaly_alert.py, which a parameter set to replay overrides
+'''
+
+def _resample(columns, min_per_sample):
+    '''
+    Return the given columns of the samples of a link averaged into
+    bins of the given sampling interval in minutes, as the VCO does
+    for a coarser minutesPerSample, timestamped by the start of each
+    bin, with a bin of only NaN of a WAN quality left as NaN
+    '''
+    import numpy as np
+    time_step_e = int(min_per_sample * 60 * 1000)
+    timestamp, group = np.unique(columns['timestamp'] // time_step_e
+                                 * time_step_e, return_inverse=True)
+    if len(timestamp) == len(columns['timestamp']):
+        return dict(columns, timestamp=timestamp)
+
+    resampled = { 'timestamp': timestamp }
+    for quality in columns:
+        if quality == 'timestamp':
+            continue
+        values = columns[quality]
+        valid = ~np.isnan(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            resampled[quality] = np.bincount(group[valid],
+                weights=values[valid], minlength=len(timestamp)) \
+                / np.bincount(group[valid], minlength=len(timestamp))
+    return resampled
+
+def _detect_windows(timestamp, values, time_end_e, params):
+    '''
+    Return whether the samples of a WAN quality of a link are found to
+    be an anomaly in each of the windows ending at the given times in
+    epoch and in milliseconds, with the present and the historical
+    interval split as detect_wan_anomaly does: the present samples at
+    or after the end minus interval_sec_present, and the historical
+    ones before it back to the end minus both intervals. The means
+    and the sample standard deviations of all the windows are found
+    at once from the prefix sums of the samples, shifted by the first
+    one for precision, with NaN ignored as the anomaly engine does, and
+    the standard deviations and the threshold are those of the engine.
+    '''
+    import numpy as np
+    from vco_api_detect import vco_api_anomaly_engine
+    valid = ~np.isnan(values)
+    timestamp = timestamp[valid]
+    values = values[valid]
+    if len(values) < 3:
+        return np.zeros(len(time_end_e), dtype=bool)
+
+    deviation = values - values[0]
+    count = np.arange(len(values) + 1)
+    sum1 = np.concatenate([[0], np.cumsum(deviation)])
+    sum2 = np.concatenate([[0], np.cumsum(deviation * deviation)])
+
+    time_split_e = time_end_e - params['interval_sec_present'] * 1000
+    time_start_e = time_split_e - params['interval_sec_hist'] * 1000
+    start = np.searchsorted(timestamp, time_start_e, 'left')
+    split = np.searchsorted(timestamp, time_split_e, 'left')
+    end = np.searchsorted(timestamp, time_end_e, 'right')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        present_mean = (sum1[end] - sum1[split]) / (count[end] - count[split])
+        hist_count = count[split] - count[start]
+        hist_sum1 = sum1[split] - sum1[start]
+        hist_mean = hist_sum1 / hist_count
+        hist_m2 = sum2[split] - sum2[start] - hist_sum1 * hist_mean
+    hist_std = vco_api_anomaly_engine.get_std(hist_count, hist_m2)
+    return vco_api_anomaly_engine.is_anomaly(present_mean, hist_mean,
+            hist_std, params['std_factor'])
+
+def _suppress_windows(is_anomaly, time_end_e, cooldown_sec):
+    '''
+    Return whether an anomaly of a WAN quality of a link is alerted in
+    each of the windows as vco_api_alert_suppressor does, i.e. should
+    it be new or last alerted more than cooldown_sec before
+    '''
+    import numpy as np
+    is_alert = np.zeros(len(is_anomaly), dtype=bool)
+    time_alerted = None
+    for i in np.flatnonzero(is_anomaly):
+        if i == 0 or not is_anomaly[i - 1] \
+        or time_end_e[i] - time_alerted >= cooldown_sec * 1000:
+            is_alert[i] = True
+            time_alerted = time_end_e[i]
+    return is_alert
+
+def _replay_edges(directory, edges, time_end_e, param_sets, cooldown_sec):
+    '''
+    Replay the samples of the given Edges in the history store in the
+    given directory through the detection of each parameter set, in a
+    worker process. Return by parameter set the anomalies and the
+    alerts found in each window, and the alerts by Edge.
+    '''
+    import numpy as np
+    store = vco_api_history_store(directory)
+    wan_quality = store.query_all(int(time_end_e[0] - max(
+                    (params['interval_sec_present'] +
+                     params['interval_sec_hist']) * 1000
+                    for params in param_sets)),
+                    int(time_end_e[-1]), edges)
+
+    results = []
+    for params in param_sets:
+        anomalies = np.zeros(len(time_end_e), dtype='int64')
+        alerts = np.zeros(len(time_end_e), dtype='int64')
+        alerts_edge = {}
+        for edge in wan_quality:
+            for wan in wan_quality[edge]:
+                columns = _resample(wan_quality[edge][wan],
+                            params['min_per_sample'])
+                for quality in WAN_QUALITY:
+                    is_anomaly = _detect_windows(columns['timestamp'],
+                                    columns[quality], time_end_e, params)
+                    if not is_anomaly.any():
+                        continue
+                    is_alert = _suppress_windows(is_anomaly, time_end_e,
+                                cooldown_sec)
+                    anomalies += is_anomaly
+                    alerts += is_alert
+                    alerts_edge[edge] = alerts_edge.get(edge, 0) + \
+                                        int(is_alert.sum())
+        results.append((anomalies, alerts, alerts_edge))
+    return results
+
+class vco_api_replay():
+    '''
+    Replay the WAN quality samples kept in a history store through the
+    detection of WAN anomaly offline, for each of a number of parameter
+    sets, to find out how many alerts each would have raised over a
+    past period without calling the API or sending any email. The
+    windows are those of a run every step_sec, as from cron or in
+    daemon mode, and the alerts those left after the suppression of
+    the anomalies that persist. The Edges are sharded across a pool
+    of worker processes, each reading its Edges from the store, and
+    each of the samples of a WAN quality is read once for all the
+    windows and parameter sets.
+    '''
+
+    def __init__(self, directory, processes = None, step_sec = None,
+    cooldown_sec = None):
+        '''
+        Initiate the replay of the history store in the given directory
+        with the number of worker processes, as many as there are CPUs
+        by default, the seconds between two runs and the seconds before
+        an anomaly that persists is alerted again
+        '''
+        self.directory = directory
+        self.processes = processes or cpu_count() or 1
+        self.step_sec = vco_api_daemon.INTERVAL_SECS \
+            if step_sec is None else step_sec
+        self.cooldown_sec = vco_api_alert_suppressor.COOLDOWN_SECS \
+            if cooldown_sec is None else cooldown_sec
+
+    def load_records(self, file_name):
+        '''
+        Append to the history store the recorded results of
+        linkQualityEvent/getLinkQualityEvents calls in the given JSON
+        file, a dictionary of each result by edgeId, and return the
+        number of samples appended
+        '''
+        with open(file_name) as f:
+            records = json.load(f)
+        store = vco_api_history_store(self.directory)
+        count = 0
+        for edge, result in records.items():
+            count += store.append(int(edge), parse_link_quality(result))
+        store.save()
+        return count
+
+    def run(self, param_sets, time_start, time_end):
+        '''
+        Replay the windows ending between the given start and end time,
+        either in epoch and in milliseconds or in ISO 8601 format, for
+        each of the given parameter sets, each overriding PARAMS, and
+        return by parameter set the parameters, the totals of the
+        anomalies and the alerts, the timeline of the windows with any,
+        and the alerts by Edge
+        '''
+        import numpy as np
+        from concurrent.futures import ProcessPoolExecutor
+        param_sets = [dict(PARAMS, **params) for params in param_sets]
+        for params in param_sets:
+            if min(params['interval_sec_present'],
+            params['interval_sec_hist']) / 60 < params['min_per_sample']:
+                # Raise a system exit on a sampling duration too short
+                raise SystemExit('Sampling duration is smaller than the '
+                    'sampling interval in %s' % json.dumps(params))
+
+        time_end_e = np.arange(parse_timestamp_e(time_start),
+                        parse_timestamp_e(time_end) + 1, self.step_sec * 1000)
+        if not len(time_end_e):
+            raise SystemExit('The replay period is shorter than a step')
+
+        edges = sorted(set(edge for edge, _ in
+                    vco_api_history_store(self.directory).links))
+        shards = [edges[i::self.processes * 4]
+                  for i in range(min(len(edges), self.processes * 4))]
+
+        anomalies = [np.zeros(len(time_end_e), dtype='int64')
+                     for _ in param_sets]
+        alerts = [np.zeros(len(time_end_e), dtype='int64')
+                  for _ in param_sets]
+        alerts_edge = [{} for _ in param_sets]
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            for results in executor.map(_replay_edges,
+            [self.directory] * len(shards), shards,
+            [time_end_e] * len(shards), [param_sets] * len(shards),
+            [self.cooldown_sec] * len(shards)):
+                for i, (anomalies_shard, alerts_shard, alerts_edge_shard) \
+                in enumerate(results):
+                    anomalies[i] += anomalies_shard
+                    alerts[i] += alerts_shard
+                    alerts_edge[i].update(alerts_edge_shard)
+
+        return [{ 'params': params,
+                  'windows': len(time_end_e),
+                  'anomalies': int(anomalies[i].sum()),
+                  'alerts': int(alerts[i].sum()),
+                  'timeline': [[int(time_end_e[j]), int(anomalies[i][j]),
+                                int(alerts[i][j])]
+                               for j in np.flatnonzero(anomalies[i])],
+                  'alerts_edge': alerts_edge[i] }
+                for i, params in enumerate(param_sets)]
+
+if __name__ == '__main__':
+    '''
+    Replay the samples in a history store over a past period, the last
+    30 days by default, for each parameter set given as JSON, e.g.
+    --params '{"interval_sec_hist": 7200, "std_factor": 3}', and print
+    the number of anomalies and alerts of each
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('store', help='directory of the history store, '
+        'e.g. enterpriseName/wan_quality-5min')
+    parser.add_argument('--params', action='append', type=json.loads,
+        help='parameter set as JSON, overriding %s' % json.dumps(PARAMS))
+    time_arg = lambda value: int(value) if value.isdigit() else value
+    parser.add_argument('--start', type=time_arg, help='start of the '
+        'replay in epoch and in milliseconds or in ISO 8601 format')
+    parser.add_argument('--end', type=time_arg, help='end of the '
+        'replay in epoch and in milliseconds or in ISO 8601 format')
+    parser.add_argument('--step', type=int,
+        help='seconds between two runs replayed')
+    parser.add_argument('--cooldown', type=int,
+        help='seconds before an anomaly that persists is alerted again')
+    parser.add_argument('--processes', type=int,
+        help='worker processes, as many as there are CPUs by default')
+    parser.add_argument('--load', metavar='FILE', action='append',
+        help='recorded getLinkQualityEvents results to append to the store')
+    parser.add_argument('--output', metavar='FILE',
+        help='write the results with the timelines as JSON to the file')
+    args = parser.parse_args()
+
+    time_end = args.end or int(time.time() * 1000)
+    time_start = args.start or parse_timestamp_e(time_end) - 30 * 86400000
+    replay = vco_api_replay(args.store, args.processes, args.step,
+                args.cooldown)
+    for file_name in args.load or []:
+        print('%s: %s samples appended' % (file_name,
+            replay.load_records(file_name)))
+
+    time_start_run = time.monotonic()
+    results = replay.run(args.params or [{}], time_start, time_end)
+    print('%d windows replayed for %d parameter set(s) in %.1f s' % (
+        results[0]['windows'], len(results),
+        time.monotonic() - time_start_run))
+    for result in results:
+        print('%8d anomalies %6d alerts  %s' % (result['anomalies'],
+            result['alerts'], json.dumps(result['params'])))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f)
@@ -0,0 +1,154 @@
+import heapq
+import json
+from vco_api_file import open_atomic
+
+class vco_api_poll_scheduler():
+    '''
+    Schedule the polling of the WAN quality of each Edge by how close
+    its links have come to an anomaly, rather than poll all the Edges
+    on every run. The Edges are held in a priority queue by the time
+    each is next due. An Edge found with an anomaly is polled as often
+    as every min_interval_sec, the sampling interval, and one close to
+    an anomaly keeps its polling interval, whereas the polling
+    interval of a stable Edge doubles every time up to
+    max_staleness_sec. The polls are drawn from a budget of
+    calls_per_min API calls per minute, refilled with the time elapsed
+    and of up to min_interval_sec of calls, with the Edges of the
+    shortest polling interval and then the most overdue polled first
+    and the rest deferred to the next run. The schedule is kept in a
+    JSON file so that it carries over from one run to the next in cron
+    as well as in daemon mode.
+    '''
+
+    MAX_STALENESS_SECS = 1800
+    '''
+    1800 seconds i.e. 30 minutes as default at most between two polls
+    of a stable Edge
+    '''
+
+    CALLS_PER_MIN = 0
+    '''
+    0 i.e. no budget as default of the API calls per minute
+    '''
+
+    def __init__(self, file_name, min_interval_sec, max_staleness_sec = None,
+    calls_per_min = None):
+        '''
+        Initiate the scheduler with the schedule in the given file
+        '''
+        self.file_name = file_name
+        self.min_interval_sec = min_interval_sec
+        self.max_staleness_sec = max(min_interval_sec,
+            self.MAX_STALENESS_SECS if max_staleness_sec is None
+            else max_staleness_sec)
+        self.calls_per_min = self.CALLS_PER_MIN \
+            if calls_per_min is None else calls_per_min
+        self.load()
+
+    def load(self):
+        '''
+        Load the schedule from disk, leaving it empty should the file
+        be absent or unreadable, with the budget full
+        '''
+        try:
+            with open(self.file_name) as f:
+                schedule = json.load(f)
+            self.interval = { edge: interval
+                              for edge, interval, _ in schedule['edges'] }
+            self.queue = [[time_next, edge]
+                          for edge, _, time_next in schedule['edges']]
+            self.tokens = schedule['tokens']
+            self.time_refill = schedule['time_refill']
+        except (OSError, KeyError, TypeError, ValueError):
+            self.interval = {}
+            self.queue = []
+            self.tokens = None
+            self.time_refill = None
+        heapq.heapify(self.queue)
+
+    def save(self):
+        '''
+        Write the schedule to disk
+        '''
+        with open_atomic(self.file_name) as f:
+            json.dump({ 'edges': [[edge, self.interval[edge], time_next]
+                                  for time_next, edge in self.queue],
+                        'tokens': self.tokens,
+                        'time_refill': self.time_refill }, f)
+
+    def _refill(self, time_now):
+        '''
+        Add the API calls earned since the last refill to the budget,
+        up to min_interval_sec of calls
+        '''
+        capacity = self.calls_per_min * self.min_interval_sec / 60
+        if self.tokens is None or self.time_refill is None:
+            self.tokens = capacity
+        else:
+            self.tokens = min(capacity, self.tokens +
+                max(time_now - self.time_refill, 0) * self.calls_per_min / 60)
+        self.time_refill = time_now
+
+    def pop_due(self, edges, time_now):
+        '''
+        Return the given Edges due to be polled at the given time in
+        epoch, within the budget of API calls, and take them out of
+        the queue until they are scheduled again with update. The
+        Edges no longer given are dropped from the schedule.
+        '''
+        edges = set(edges)
+        queued = set(edge for _, edge in self.queue)
+        if queued - edges:
+            self.queue = [[time_next, edge] for time_next, edge
+                          in self.queue if edge in edges]
+            heapq.heapify(self.queue)
+        self.interval = { edge: self.interval.get(edge,
+                            self.min_interval_sec) for edge in edges }
+        '''
+        Queue the new Edges, and those popped but never scheduled
+        again e.g. on an error, to be polled now
+        '''
+        for edge in edges - queued:
+            heapq.heappush(self.queue, [time_now, edge])
+
+        due = []
+        while self.queue and self.queue[0][0] <= time_now:
+            due.append(heapq.heappop(self.queue))
+        if not self.calls_per_min:
+            return [edge for _, edge in due]
+
+        '''
+        Poll the Edges of the shortest polling interval first, then the
+        most overdue, and queue the rest back beyond the budget
+        '''
+        self._refill(time_now)
+        due.sort(key=lambda item: (self.interval[item[1]], item[0]))
+        budget = max(int(self.tokens), 0)
+        for item in due[budget:]:
+            heapq.heappush(self.queue, item)
+        edges_due = [edge for _, edge in due[:budget]]
+        self.tokens -= len(edges_due)
+        return edges_due
+
+    def update(self, edge, time_now, deviation, std_factor):
+        '''
+        Schedule the next poll of an Edge polled at the given time in
+        epoch given the largest deviation of the present mean from the
+        historical mean of any of its WAN quality, in historical
+        standard deviations, and the factor above which it is an
+        anomaly. An Edge not looked into, of a deviation of None, e.g.
+        on a failed poll or with no baseline yet, is polled again as
+        often as an anomaly rather than backed off as a stable one.
+        '''
+        interval = self.interval.get(edge, self.min_interval_sec)
+        if deviation is None or deviation > std_factor:
+            interval = self.min_interval_sec
+        elif deviation <= std_factor / 2:
+            interval = min(self.max_staleness_sec, interval * 2)
+        self.interval[edge] = interval
+        '''
+        Schedule a little early so that a poll due on the tick of a
+        run is not deferred to the next one by the jitter of the clock
+        '''
+        heapq.heappush(self.queue, [time_now + interval -
+                                    self.min_interval_sec / 10, edge])
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from vco_api_file import open_atomic
+
+logger = logging.getLogger(__name__)
+
+class vco_api_telemetry():
+    '''
+    A thread-safe registry of counters, gauges and histograms of
+    the API calls, the phases of a cycle and the number of Edges,
+    WAN and samples processed, exposed in the Prometheus text format
+    either as a file, e.g. for the textfile collector of the node
+    exporter, or on a local HTTP endpoint
+    '''
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+               30, 60)
+    '''
+    The upper bounds in seconds of the histogram buckets, with one
+    more of infinity
+    '''
+
+    def __init__(self, labels = None):
+        '''
+        Initiate an empty registry with the given labels added to
+        every sample
+        '''
+        self.labels = labels or {}
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+        self.server = None
+
+    def _key(self, name, labels):
+        '''
+        Return the key of a sample given its name and labels, with the
+        values of the labels as strings so that the keys of a name sort
+        whatever the types the values are given in
+        '''
+        return name, tuple(sorted((label, str(value)) for label, value
+                                  in dict(self.labels, **labels).items()))
+
+    def inc(self, name, value = 1, **labels):
+        '''
+        Add the given value to a counter
+        '''
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        '''
+        Set a gauge to the given value
+        '''
+        key = self._key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        '''
+        Record the given value in a histogram
+        '''
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': [0] * (len(self.BUCKETS) + 1),
+                    'sum': 0, 'count': 0 }
+            i = 0
+            while i < len(self.BUCKETS) and value > self.BUCKETS[i]:
+                i += 1
+            histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        '''
+        Record the seconds taken by the enclosed block in a histogram,
+        whether it completes or raises
+        '''
+        time_start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - time_start, **labels)
+
+    def _format(self, name, labels, value):
+        '''
+        Return a sample in the Prometheus text format
+        '''
+        if labels:
+            name += '{%s}' % ','.join('%s="%s"' % (k, str(v).replace(
+                        '\\', '\\\\').replace('"', '\\"'))
+                        for k, v in labels)
+        return '%s %s\n' % (name, repr(float(value)))
+
+    def render(self):
+        '''
+        Return all the samples in the Prometheus text format
+        '''
+        lines = []
+        with self.lock:
+            for kind, samples in (('counter', self.counters),
+            ('gauge', self.gauges)):
+                names = sorted(set(name for name, _ in samples))
+                for name in names:
+                    lines.append('# TYPE %s %s\n' % (name, kind))
+                    for key in sorted(k for k in samples if k[0] == name):
+                        lines.append(self._format(name, key[1],
+                                        samples[key]))
+
+            names = sorted(set(name for name, _ in self.histograms))
+            for name in names:
+                lines.append('# TYPE %s histogram\n' % name)
+                for key in sorted(k for k in self.histograms
+                if k[0] == name):
+                    histogram = self.histograms[key]
+                    cumulative = 0
+                    for bound, count in zip(self.BUCKETS + ('+Inf',),
+                    histogram['buckets']):
+                        cumulative += count
+                        lines.append(self._format(name + '_bucket',
+                            key[1] + (('le', bound if bound == '+Inf'
+                            else repr(float(bound))),), cumulative))
+                    lines.append(self._format(name + '_sum', key[1],
+                                    histogram['sum']))
+                    lines.append(self._format(name + '_count', key[1],
+                                    histogram['count']))
+        return ''.join(lines)
+
+    def write(self, file_name):
+        '''
+        Write all the samples in the Prometheus text format to the
+        given file, which a scraper never reads partly written
+        '''
+        with open_atomic(file_name) as f:
+            f.write(self.render())
+
+    def serve(self, port, host = '127.0.0.1'):
+        '''
+        Serve all the samples in the Prometheus text format on the
+        given local port from a background thread
+        '''
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        telemetry = self
+
+        class handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = telemetry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                    'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), handler)
+        threading.Thread(target=self.server.serve_forever,
+            daemon=True).start()
+        logger.info('Serving metrics on http://%s:%s/', host, port)
+
+@contextmanager
+def profile(file_name):
+    '''
+    Profile the enclosed block with cProfile and dump the statistics
+    to the given file, e.g. for one cycle, to be read with pstats or
+    snakeviz
+    '''
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(file_name)
+        logger.info('Profile dumped to %s', file_name)
@@ -1,20 +1,75 @@
-from vco_api_main import vco_api_main
-
-class pccwg_vco(vco_api_main):
-    def __init__(self):
-        super().__init__()
-
-if __name__ == '__main__':
-    '''
-    Create the VCO client object and detect WAN anomoly
-    by calling the respective function
-    '''
-    conn = pccwg_vco()
-    conn.detect_wan_anomaly(min_per_sample = 5, 
-        interval_sec_present = 300, 
-        interval_sec_hist = 3600)
-    '''
-    min_per_sample of 5 i.e. one sample every 5 minutes
-    interval_sec_present of 300 i.e. 5 minutes
-    interval_sec_hist of 3600 i.e. 60 minutes
-    '''
+import argparse
+import logging
+from vco_api_main import vco_api_main
+from vco_api_daemon import vco_api_daemon
+from vco_api_operator import vco_api_operator
+from vco_api_telemetry import profile
+
+class pccwg_vco(vco_api_main):
+    def __init__(self, refresh_topology = False, enterprise = None):
+        super().__init__(refresh_topology, enterprise)
+
+if __name__ == '__main__':
+    '''
+    Run once and exit by default e.g. from cron, or keep running
+    as a daemon with the --daemon argument
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--daemon', action='store_true',
+        help='run continuously with an in-process scheduler')
+    parser.add_argument('--interval', type=int,
+        default=vco_api_daemon.INTERVAL_SECS,
+        help='seconds between two detection cycles in daemon mode')
+    parser.add_argument('--topology-interval', type=int,
+        default=vco_api_daemon.INTERVAL_SECS_TOPOLOGY,
+        help='seconds between two topology refreshes in daemon mode')
+    parser.add_argument('--refresh-topology', action='store_true',
+        help='ignore the topology cache and read it from the VCO')
+    parser.add_argument('--profile', metavar='FILE',
+        help='profile one detection cycle with cProfile to the file')
+    args = parser.parse_args()
+
+    '''
+    Create the VCO client object and detect WAN anomoly
+    by calling the respective function
+    '''
+    conn = pccwg_vco(refresh_topology = args.refresh_topology)
+    if conn.is_operator:
+        '''
+        Detect WAN anomaly for all the enterprises on the VCO across
+        a pool of worker processes as an operator
+        '''
+        conn = vco_api_operator(conn,
+                refresh_topology = args.refresh_topology)
+    detect_args = dict(min_per_sample = 5,
+        interval_sec_present = 300,
+        interval_sec_hist = 3600,
+        mode = 'sample_cache',
+        prefilter = False)
+    '''
+    min_per_sample of 5 i.e. one sample every 5 minutes
+    interval_sec_present of 300 i.e. 5 minutes
+    interval_sec_hist of 3600 i.e. 60 minutes
+    mode of sample_cache i.e. poll only the samples since the last run,
+    or separate, combined, stream, adaptive, history_store, online or
+    seasonal as of DETECT_MODES
+    prefilter of False i.e. poll every Edge without screening
+    '''
+
+    if args.daemon:
+        logging.basicConfig(level=logging.INFO,
+            format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+        daemon = vco_api_daemon(conn, args.interval,
+            args.topology_interval, args.profile)
+        daemon.install_signal_handlers()
+        daemon.run(conn.detect_wan_anomaly, **detect_args)
+    elif args.profile:
+        with profile(args.profile):
+            conn.detect_wan_anomaly(**detect_args)
+    else:
+        conn.detect_wan_anomaly(**detect_args)
+
+    '''
+    Send the email notifications still queued before exit
+    '''
+    conn.close()